@@ -3,6 +3,12 @@ ReviveAI 產品搜尋客戶端
 
 此客戶端連接到 WebTools MCP 服務器，使用 LangChain 和 LangGraph
 實現一個能夠執行網路搜尋和分析產品資訊的 AI 代理。
+MCP 會話由 mcp_session_pool 統一管理，所有請求共用長期存活的子程序；
+代理與 LLM 客戶端在每個行程中只建立一次，並在請求之間重複使用。
+
+搜尋模式：
+- agent：由 ReAct 代理依狀態機執行工具（多次 LLM 往返）
+- direct：直接呼叫搜尋與抓取函數，並行抓取網頁後只呼叫一次 LLM 產生報告
 """
 
 import asyncio
@@ -10,8 +16,11 @@ import argparse
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain.agents import create_agent
+from mcp_session_pool import get_mcp_pool, close_mcp_pool, load_pooled_tools
+from web_tools_server import fetch_brave_results, fetch_webpage, format_search_results
+from search_cache import get_search_cache, normalize_query
+from singleflight import get_singleflight
 import getpass
 import os
 
@@ -22,40 +31,8 @@ if "GOOGLE_API_KEY" not in os.environ:
 # 載入環境變數
 load_dotenv()
 
-async def search_product_info(query):
-    """
-    使用 MCP 工具搜尋產品資訊並返回分析結果
-    
-    Args:
-        query: 要搜尋的產品查詢
-        
-    Returns:
-        dict: 包含以下內容的字典:
-            - text: 處理後的文本內容
-            - raw_response: 原始響應對象
-    """
-    # 使用 OpenAI 模型
-    # model = ChatOpenAI(model="gpt-4o-mini")
-    model = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite")
-
-    
-    # 配置 MCP 客戶端並連接到 WebTools 服務器
-    client = MultiServerMCPClient(
-        {
-            "web_tools": {
-                "command": "python",
-                "args": ["web_tools_server.py"],
-                "transport": "stdio",
-            }
-        }
-    )
-    
-    try:
-        # 獲取所有工具（根據新 API 要求）
-        tools = await client.get_tools()
-        
-        # 系統提示
-        system_prompt = """你是一個專業的產品研究助手，請按照此流程執行：
+# 搜尋代理的系統提示
+SEARCH_AGENT_SYSTEM_PROMPT = """你是一個專業的產品研究助手，請按照此流程執行：
 
 【狀態機制】
 狀態 1：【初始】→ 執行 brave_search（1次）→ 狀態 2
@@ -64,7 +41,8 @@ async def search_product_info(query):
 
 【嚴格執行規則】
 1. brave_search：僅執行 1 次
-2. fetch_webpage：僅執行 1 次（選擇 2 個最權威的網站同時執行 fetch_webpage）
+2. fetch_webpage：僅執行 1 次（選擇 2 個最權威的網站同時執行 fetch_webpage），
+   並將產品名稱帶入 query 參數，只取回與產品相關的段落與規格表
 3. 禁止只說不做：每次工具調用必須立即執行
 4. 強制報告：即使網頁抓取失敗也必須基於搜尋結果生成報告
 
@@ -83,20 +61,248 @@ async def search_product_info(query):
 - 整體評價摘要
 - 參考來源（不需要列出 URL）
 """
+
+# 搜尋代理的用戶提示模板
+SEARCH_AGENT_USER_PROMPT = "請研究「{query}」的詳細產品資訊。\n\n**簡化執行流程**：\n\n【步驟1】執行 brave_search（僅1次）→ 宣告「狀態轉換：進入狀態2」\n\n【步驟2】選擇最權威的網站，執行 fetch_webpage（僅1次，query 參數帶入產品名稱）→ 宣告「狀態轉換：進入狀態3」\n\n【步驟3】生成完整產品報告\n\n**重要提醒**：\n- 每個工具只執行一次\n- 禁止說「即將執行」而不實際執行\n- 即使網頁抓取失敗也必須基於搜尋結果生成300字以內的繁體中文報告"
+
+# direct 模式的報告提示（與代理的最終報告要求相同）
+DIRECT_SUMMARY_PROMPT = """請根據以下搜尋結果與網頁內容，撰寫「{query}」的產品資訊報告。
+
+{search_results}
+
+{pages}
+
+【最終報告】（繁體中文，內容長度限 200 字以內）
+- 產品基本介紹
+- 產品規格
+- 主要功能特點
+- 整體評價摘要
+- 參考來源（不需要列出 URL）
+
+即使網頁抓取失敗也必須基於搜尋結果生成報告。"""
+
+# 搜尋代理使用的模型
+SEARCH_AGENT_MODEL = os.getenv("SEARCH_AGENT_MODEL", "gemini-2.5-flash-lite")
+
+# 預設搜尋模式：agent 或 direct
+SEARCH_MODE = os.getenv("SEARCH_MODE", "agent")
+SEARCH_MODES = ("agent", "direct")
+
+# direct 模式並行抓取的網頁數量（與代理提示中的 2 個網站一致）
+DIRECT_FETCH_PAGES = int(os.getenv("DIRECT_FETCH_PAGES", "2"))
+
+# 是否使用搜尋報告快取
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+
+# brave_search 工具回傳錯誤或沒有結果時的文字開頭（見 web_tools_server.brave_search）
+_SEARCH_ERROR_PREFIXES = ("錯誤", "搜尋錯誤", "搜尋時發生錯誤")
+_SEARCH_EMPTY_MARKER = "找不到相關結果"
+
+# 已編譯代理的快取，鍵為 (模型名稱, 工具名稱集合)
+_agent_cache = {}
+_agent_cache_loop = None
+_agent_cache_lock = None
+_pooled_tools = None
+_model_cache = {}
+
+
+def create_chat_model(model_name: str):
+    """建立搜尋代理使用的聊天模型"""
+    # 使用 OpenAI 模型
+    # return ChatOpenAI(model="gpt-4o-mini")
+    return ChatGoogleGenerativeAI(model=model_name)
+
+
+def get_chat_model(model_name: str = SEARCH_AGENT_MODEL):
+    """取得行程內共用的聊天模型（代理與 direct 模式共用同一個 HTTP 連線池）"""
+    _reset_cache_on_new_loop()
+    model = _model_cache.get(model_name)
+    if model is None:
+        model = create_chat_model(model_name)
+        _model_cache[model_name] = model
+    return model
+
+
+def _reset_cache_on_new_loop():
+    """模型的非同步客戶端綁定 event loop，換了 loop 就清空快取重新建立"""
+    global _agent_cache, _agent_cache_loop, _agent_cache_lock, _pooled_tools, _model_cache
+    loop = asyncio.get_running_loop()
+    if _agent_cache_loop is not loop:
+        _agent_cache = {}
+        _model_cache = {}
+        _agent_cache_loop = loop
+        _agent_cache_lock = asyncio.Lock()
+        _pooled_tools = None
+
+
+async def get_search_agent(model_name: str = SEARCH_AGENT_MODEL, tools: list = None, model=None):
+    """
+    取得（必要時建立）已編譯的搜尋代理
+
+    代理以模型名稱與工具集合為鍵快取，後續請求直接重用同一個編譯後的圖
+    以及模型底層的 HTTP 連線池。
+
+    Args:
+        model_name: 模型名稱
+        tools: LangChain 工具列表，預設為經由 MCP 會話池呼叫的 WebTools 工具
+        model: 直接指定的模型物件（測試或基準測試用），未指定時依 model_name 建立
+
+    Returns:
+        已編譯的 LangGraph 代理
+    """
+    global _pooled_tools
+
+    _reset_cache_on_new_loop()
+    async with _agent_cache_lock:
+        if tools is None:
+            if _pooled_tools is None:
+                _pooled_tools = await load_pooled_tools()
+            tools = _pooled_tools
+
+        key = (model_name if model is None else f"{model_name}:{id(model)}",
+               tuple(sorted((tool.name, id(tool)) for tool in tools)))
+        agent = _agent_cache.get(key)
+        if agent is None:
+            # 創建代理（使用新的 create_agent API）
+            agent = create_agent(
+                model=model or get_chat_model(model_name),
+                tools=tools,
+                system_prompt=SEARCH_AGENT_SYSTEM_PROMPT
+            )
+            _agent_cache[key] = agent
+        return agent
+
+
+async def warmup_search_agent():
+    """預先啟動 MCP 會話池並編譯搜尋代理（供 main.py 啟動時呼叫）"""
+    await get_mcp_pool().start()
+    await get_search_agent()
+
+
+async def run_direct_search(query: str, model=None) -> dict:
+    """
+    direct 模式：直接執行搜尋與抓取，只呼叫一次 LLM 產生報告
+
+    Args:
+        query: 要搜尋的產品查詢
+        model: 聊天模型，預設使用共用的搜尋模型
+
+    Returns:
+        dict: 與代理回應相同格式的 {"messages": [...]}，最後一條訊息為報告；
+            search_ok 表示 Brave 搜尋是否成功且有結果
+    """
+    try:
+        results = await fetch_brave_results(query)
+        search_results = format_search_results(query, results)
+        search_ok = bool(results)
+    except Exception as e:
+        results = []
+        search_results = f"搜尋錯誤: {str(e)}"
+        search_ok = False
+
+    # 並行抓取排名最前面的網頁（fetch_webpage 本身會把錯誤轉成文字）
+    urls = [result["url"] for result in results if result.get("url")][:DIRECT_FETCH_PAGES]
+    pages = await asyncio.gather(*(fetch_webpage(url, query=query) for url in urls))
+
+    model = model or get_chat_model()
+    report = await model.ainvoke([
+        {"role": "system", "content": "你是一個專業的產品研究助手。"},
+        {"role": "user", "content": DIRECT_SUMMARY_PROMPT.format(
+            query=query,
+            search_results=search_results,
+            pages="\n\n".join(pages) or "（沒有可抓取的網頁）"
+        )}
+    ])
+    return {"messages": [report], "search_ok": search_ok}
+
+
+def _search_succeeded(response) -> bool:
+    """
+    判斷搜尋回應是否建立在成功的網路搜尋上
+
+    direct 模式依 run_direct_search 的 search_ok；agent 模式需至少有一次 brave_search
+    工具呼叫回傳了搜尋結果（而非錯誤訊息或「找不到相關結果」）。
+    """
+    if not isinstance(response, dict):
+        return False
+    if "search_ok" in response:
+        return bool(response["search_ok"])
+    for message in response.get("messages", []):
+        if getattr(message, "type", None) != "tool" or getattr(message, "name", None) != "brave_search":
+            continue
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if (getattr(message, "status", "success") != "error"
+                and not content.startswith(_SEARCH_ERROR_PREFIXES)
+                and _SEARCH_EMPTY_MARKER not in content):
+            return True
+    return False
+
+
+async def search_product_info(query, mode: str = None, use_cache: bool = SEARCH_CACHE_ENABLED):
+    """
+    使用 MCP 工具搜尋產品資訊並返回分析結果
+
+    報告會寫入 search_cache；快取新鮮時直接回傳，過期但仍可用時先回傳舊報告並於背景重新搜尋。
+    網路搜尋失敗（例如 Brave API 錯誤）時產生的報告只回傳、不寫入快取。
+    
+    Args:
+        query: 要搜尋的產品查詢
+        mode: 搜尋模式，"agent" 或 "direct"，預設使用環境變數 SEARCH_MODE
+        use_cache: 是否使用搜尋報告快取
         
-        # 創建代理（使用新的 create_agent API）
-        agent = create_agent(
-            model=model,
-            tools=tools,
-            system_prompt=system_prompt
-        )
-        
-        # 執行代理並獲取結果
-        response = await agent.ainvoke({
-            "messages": [
-                {"role": "user", "content": f"請研究「{query}」的詳細產品資訊。\n\n**簡化執行流程**：\n\n【步驟1】執行 brave_search（僅1次）→ 宣告「狀態轉換：進入狀態2」\n\n【步驟2】選擇最權威的網站，執行 fetch_webpage（僅1次）→ 宣告「狀態轉換：進入狀態3」\n\n【步驟3】生成完整產品報告\n\n**重要提醒**：\n- 每個工具只執行一次\n- 禁止說「即將執行」而不實際執行\n- 即使網頁抓取失敗也必須基於搜尋結果生成300字以內的繁體中文報告"}
-            ]
-        })
+    Returns:
+        dict: 包含以下內容的字典:
+            - text: 處理後的文本內容
+            - raw_response: 原始響應對象（命中快取時為 None）
+            - cache: 快取狀態 "hit"、"stale" 或 "miss"
+            - ok: 報告是否建立在成功的網路搜尋上（命中快取時為 True）
+    """
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        mode = "agent"
+
+    # 同時進行中的相同查詢只執行一次搜尋
+    search_flight = get_singleflight("web_search")
+    flight_key = (normalize_query(query), mode)
+
+    if not use_cache:
+        result = await search_flight.do(flight_key, _search_product_info_uncached, query, mode)
+        return {**result, "cache": "miss"}
+
+    cache = get_search_cache()
+    # SQLite 讀寫在執行緒中進行，不阻塞事件迴圈
+    cached_text, status = await asyncio.to_thread(cache.lookup, query)
+    if status == "stale":
+        async def refresh():
+            result = await _search_product_info_uncached(query, mode)
+            if not result["ok"]:
+                raise ValueError("搜尋失敗，保留原本的報告")
+            return result["text"]
+        cache.refresh_in_background(query, refresh)
+    if cached_text is not None:
+        return {"text": cached_text, "raw_response": None, "cache": status, "ok": True}
+
+    result = await search_flight.do(flight_key, _search_product_info_uncached, query, mode)
+    if result["ok"]:
+        await asyncio.to_thread(cache.store, query, result["text"])
+    return {**result, "cache": "miss"}
+
+
+async def _search_product_info_uncached(query: str, mode: str) -> dict:
+    """實際執行搜尋（不經過快取），回傳 {"text", "raw_response", "ok"}"""
+    try:
+        if mode == "direct":
+            response = await run_direct_search(query)
+        else:
+            # 取得快取的代理（工具呼叫經由共用 MCP 會話池執行）
+            agent = await get_search_agent()
+
+            # 執行代理並獲取結果
+            response = await agent.ainvoke({
+                "messages": [
+                    {"role": "user", "content": SEARCH_AGENT_USER_PROMPT.format(query=query)}
+                ]
+            })
         
         # 處理 ReAct 代理返回的響應，提取搜尋結果
         formatted_text = ""
@@ -114,10 +320,12 @@ async def search_product_info(query):
             # 直接獲取非標準格式的回應
             formatted_text = str(response)
         
-        # 返回處理後的文本和原始響應
+        # 返回處理後的文本、原始響應與是否可寫入快取
         return {
             "text": formatted_text,
-            "raw_response": response
+            "raw_response": response,
+            "ok": (_search_succeeded(response) and isinstance(formatted_text, str)
+                   and bool(formatted_text.strip()) and formatted_text != "未找到產品資訊")
         }
     except Exception as e:
         # 捕獲並記錄任何錯誤
@@ -129,6 +337,7 @@ async def main():
     # 解析命令行參數
     parser = argparse.ArgumentParser(description="ReviveAI 產品資訊搜尋")
     parser.add_argument("query", nargs="?", default=None, help="產品搜尋查詢")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default=None, help="搜尋模式（預設依 SEARCH_MODE）")
     args = parser.parse_args()
     
     # 獲取搜尋查詢
@@ -141,7 +350,7 @@ async def main():
     
     try:
         # 執行搜尋
-        result = await search_product_info(query)
+        result = await search_product_info(query, mode=args.mode)
         
         # 顯示結果
         print("\n" + "="*60)
@@ -156,6 +365,9 @@ async def main():
         print(f"搜尋過程中發生錯誤：{str(e)}")
         import traceback
         traceback.print_exc()
+    finally:
+        # 結束 MCP 子程序
+        await close_mcp_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+搜尋代理建立成本的微基準測試
+
+比較「每次請求都重新建立模型與代理」（舊流程）與「使用 get_search_agent 快取」（新流程）
+的每次呼叫設定成本。模型以假模型取代，工具為本地假工具，不會連線到任何外部服務。
+
+用法：
+    python benchmarks/bench_agent_setup.py --calls 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+from langchain.agents import create_agent
+
+import agent_client
+
+
+class StubChatModel(GenericFakeChatModel):
+    """永遠直接回覆報告、不呼叫工具的假模型"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def make_stub_model():
+    return StubChatModel(messages=iter(lambda: AIMessage(content="產品報告"), None))
+
+
+async def brave_search(query: str, count: int = 5, country: str = "TW") -> str:
+    """假的 brave_search"""
+    return "## 搜尋結果"
+
+
+async def fetch_webpage(url: str, raw_html: bool = False, engine: str = None, query: str = None) -> str:
+    """假的 fetch_webpage"""
+    return "## 網頁內容"
+
+
+STUB_TOOLS = [
+    StructuredTool.from_function(coroutine=brave_search, name="brave_search", description="搜尋"),
+    StructuredTool.from_function(coroutine=fetch_webpage, name="fetch_webpage", description="抓取網頁"),
+]
+
+MESSAGES = {"messages": [{"role": "user", "content": agent_client.SEARCH_AGENT_USER_PROMPT.format(query="MacBook Air M1")}]}
+
+
+async def run_uncached(calls: int):
+    """舊流程：每次呼叫都建立模型、編譯代理"""
+    setup, total = [], []
+    for _ in range(calls):
+        start = time.perf_counter()
+        agent = create_agent(
+            model=make_stub_model(),
+            tools=STUB_TOOLS,
+            system_prompt=agent_client.SEARCH_AGENT_SYSTEM_PROMPT
+        )
+        setup.append(time.perf_counter() - start)
+        await agent.ainvoke(MESSAGES)
+        total.append(time.perf_counter() - start)
+    return setup, total
+
+
+async def run_cached(calls: int):
+    """新流程：透過 get_search_agent 取得快取的代理"""
+    model = make_stub_model()
+    setup, total = [], []
+    for _ in range(calls):
+        start = time.perf_counter()
+        agent = await agent_client.get_search_agent(model=model, tools=STUB_TOOLS)
+        setup.append(time.perf_counter() - start)
+        await agent.ainvoke(MESSAGES)
+        total.append(time.perf_counter() - start)
+    return setup, total
+
+
+def summarize(name: str, setup: list, total: list):
+    to_ms = lambda values: [v * 1000 for v in values]
+    setup_ms, total_ms = to_ms(setup), to_ms(total)
+    print(f"{name:<10} 設定成本 平均 {statistics.mean(setup_ms):8.3f} ms / 中位數 {statistics.median(setup_ms):8.3f} ms"
+          f" | 整體呼叫 平均 {statistics.mean(total_ms):8.3f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="搜尋代理建立成本微基準測試")
+    parser.add_argument("--calls", type=int, default=200, help="每種模式的呼叫次數")
+    args = parser.parse_args()
+
+    # 預熱一次，排除首次匯入與 JIT 類成本
+    await run_uncached(1)
+    await run_cached(1)
+
+    summarize("每次建立", *await run_uncached(args.calls))
+    summarize("快取代理", *await run_cached(args.calls))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+網頁正文擷取引擎基準測試：readability（readabilipy + markdownify）vs fast（lxml 輕量擷取器）
+
+對一組已儲存的商品頁 HTML 逐頁執行兩種引擎，比較吞吐量、記憶體與輸出大小。
+兩種引擎都在目前行程中直接執行（不經過擷取行程池），量測的是引擎本身的成本。
+
+- 記憶體：tracemalloc 的 Python 配置峰值；lxml 與 Readability.js（node 子程序）在 C/外部行程的
+  配置不在其中，因此另外列出整個行程的 ru_maxrss 增量作為參考
+- 未指定 --pages 時，使用內建產生的模擬商品頁（含導覽列、側欄、規格表、留言與大量 script）
+
+用法：
+    python benchmarks/bench_extractors.py --pages saved_pages/
+    python benchmarks/bench_extractors.py --urls urls.txt --pages saved_pages/   # 先下載再測試
+    python benchmarks/bench_extractors.py --synthetic 30 --show fast
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import web_tools_server
+from web_tools_server import EXTRACT_ENGINES, _extract_markdown
+
+
+def make_synthetic_page(index: int) -> str:
+    """產生一個模擬的二手商品頁"""
+    nav = "".join(f'<li><a href="/category/{i}">分類 {i}</a></li>' for i in range(40))
+    sidebar = "".join(f'<li><a href="/item/{i}">熱門商品 {i}</a> NT$ {1000 + i}</li>' for i in range(30))
+    paragraphs = "".join(
+        f"<p>第 {i} 段：這台 Apple MacBook Air M1 2020 搭載 8 核心 CPU 與 7 核心 GPU，"
+        f"電池循環 {100 + i} 次，外觀無明顯刮傷，附原廠充電器與盒裝，適合學生、上班族日常使用。</p>"
+        for i in range(12)
+    )
+    specs = "".join(f"<tr><td>規格項目 {i}</td><td>數值 {i * 8}GB</td></tr>" for i in range(15))
+    comments = "".join(f'<div class="comment"><p>買家 {i}：請問還有貨嗎？可以面交嗎，謝謝。</p></div>' for i in range(20))
+    scripts = "".join(f"<script>window.__DATA_{i}__ = {{{'x' * 2000!r}: {i}}};</script>" for i in range(10))
+    return (
+        f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>商品 {index} - MacBook Air M1</title>{scripts}"
+        f"<style>.a{{color:red}}</style></head><body>"
+        f"<header><nav><ul>{nav}</ul></nav></header>"
+        f"<div class='layout'><aside class='sidebar'><ul>{sidebar}</ul></aside>"
+        f"<div class='product-detail'><h1>Apple MacBook Air M1 2020 #{index}</h1>{paragraphs}"
+        f"<h2>規格</h2><table>{specs}</table></div>"
+        f"<div class='comments'>{comments}</div></div>"
+        f"<footer><p>© 2024 二手商店，版權所有。</p></footer></body></html>"
+    )
+
+
+def load_pages(pages_dir: str, synthetic: int) -> list:
+    """讀取儲存的 HTML 頁面；沒有指定目錄時產生模擬頁面"""
+    if not pages_dir:
+        return [(f"synthetic-{i}.html", make_synthetic_page(i)) for i in range(synthetic)]
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.htm*"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+async def download_pages(urls_file: str, pages_dir: str):
+    """下載 URL 清單中的網頁到 pages_dir，作為之後重複測試的語料"""
+    os.makedirs(pages_dir, exist_ok=True)
+    with open(urls_file, encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    session = await web_tools_server.get_http_session()
+    try:
+        for index, url in enumerate(urls):
+            try:
+                async with session.get(url, timeout=10) as response:
+                    html, _ = await web_tools_server.read_text_capped(response, web_tools_server.FETCH_MAX_BYTES)
+            except Exception as e:
+                print(f"下載失敗 {url}: {str(e)}", file=sys.stderr)
+                continue
+            with open(os.path.join(pages_dir, f"page_{index:03d}.html"), "w", encoding="utf-8") as f:
+                f.write(html)
+    finally:
+        await web_tools_server.close_http_session()
+
+
+def run_engine(engine: str, pages: list, rounds: int) -> dict:
+    """以指定引擎處理所有頁面，回傳統計"""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    durations, output_chars, failures, peaks = [], [], 0, []
+    for _ in range(rounds):
+        for _, html in pages:
+            tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                result = _extract_markdown(html, engine)
+            except Exception:
+                result = {"markdown": None}
+            durations.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            if result["markdown"]:
+                output_chars.append(len(result["markdown"]))
+            else:
+                failures += 1
+    total = sum(durations)
+    return {
+        "pages_per_sec": len(durations) / total if total else 0.0,
+        "mean_ms": statistics.mean(durations) * 1000,
+        "p95_ms": sorted(durations)[int(len(durations) * 0.95) - 1] * 1000 if durations else 0.0,
+        "peak_kib": max(peaks) / 1024 if peaks else 0.0,
+        "rss_growth_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+        "mean_output_chars": statistics.mean(output_chars) if output_chars else 0,
+        "failures": failures // rounds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="網頁正文擷取引擎基準測試")
+    parser.add_argument("--pages", help="已儲存 HTML 頁面的目錄（*.html）")
+    parser.add_argument("--urls", help="先下載此檔案中的 URL（每行一個）到 --pages 目錄")
+    parser.add_argument("--synthetic", type=int, default=20, help="未指定 --pages 時產生的模擬頁面數")
+    parser.add_argument("--rounds", type=int, default=3, help="每個引擎重複處理整個語料的次數")
+    parser.add_argument("--show", choices=EXTRACT_ENGINES, help="印出第一頁在指定引擎下的輸出")
+    args = parser.parse_args()
+
+    if args.urls:
+        if not args.pages:
+            parser.error("--urls 需要同時指定 --pages 作為儲存目錄")
+        asyncio.run(download_pages(args.urls, args.pages))
+
+    pages = load_pages(args.pages, args.synthetic)
+    if not pages:
+        parser.error(f"{args.pages} 中沒有 HTML 頁面")
+    input_kib = sum(len(html.encode("utf-8")) for _, html in pages) / len(pages) / 1024
+    print(f"語料：{len(pages)} 頁，平均 {input_kib:.1f} KiB，每個引擎 {args.rounds} 輪\n")
+
+    # 預熱，排除首次匯入成本
+    for engine in EXTRACT_ENGINES:
+        _extract_markdown(pages[0][1], engine)
+
+    print(f"{'引擎':<12}{'頁/秒':>10}{'平均 ms':>10}{'p95 ms':>10}{'峰值 KiB':>12}{'RSS 增量 KiB':>14}{'輸出字元':>10}{'失敗':>6}")
+    for engine in EXTRACT_ENGINES:
+        stats = run_engine(engine, pages, args.rounds)
+        print(f"{engine:<12}{stats['pages_per_sec']:>10.1f}{stats['mean_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['peak_kib']:>12.0f}{stats['rss_growth_kib']:>14}{stats['mean_output_chars']:>10.0f}{stats['failures']:>6}")
+
+    if args.show:
+        name, html = pages[0]
+        result = _extract_markdown(html, args.show)
+        print(f"\n--- {name}（{args.show}）---\n# {result['title']}\n\n{result['markdown']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+main:app 的匯入時間基準測試
+
+每次在新的子行程中匯入 main（uvicorn 載入 main:app 時做的事），交替量測兩種情況：
+- 延遲初始化（目前）：匯入時不載入 chromadb、不開啟資料庫或建立 OpenAI 客戶端；
+  另量測 warmup_query_chroma()（lifespan 啟動時執行）建立 Chroma 連線、客戶端與向量索引的時間
+- 匯入時初始化（基準）：在同一個計時區間內先執行原本 query_chroma 在匯入時做的事
+  （匯入 chromadb、建立 PersistentClient、OpenAIEmbeddingFunction、取得 collection、建立 AsyncOpenAI），
+  再匯入 main，即延遲初始化前 uvicorn 載入 main:app 的成本
+
+並列出兩者匯入時間的差距。
+
+另外列出匯入後是否已載入 chromadb，以及 python -X importtime 中 main 直接匯入、累計時間最長的模組（--top）。
+
+注意：預熱會開啟 Chroma 資料庫並寫入檔案，建議先複製一份資料庫再用 CHROMA_PATH 指向複本。
+
+用法：
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/bench_import_time.py --runs 5
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/bench_import_time.py --runs 3 --top 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MEASURE_SCRIPT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import main
+import_s = time.perf_counter() - start
+chromadb_loaded = "chromadb" in sys.modules
+start = time.perf_counter()
+asyncio.run(main.warmup_query_chroma())
+warmup_s = time.perf_counter() - start
+print("RESULT " + json.dumps({"import_s": import_s, "warmup_s": warmup_s, "chromadb_loaded": chromadb_loaded}))
+"""
+
+# 基準：延遲初始化前 query_chroma 在模組層級執行的初始化
+EAGER_SCRIPT = """
+import json, os, time
+start = time.perf_counter()
+import chromadb
+from chromadb.utils import embedding_functions
+from openai import AsyncOpenAI
+chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_PATH"))
+openai_ef = embedding_functions.OpenAIEmbeddingFunction(
+    api_key=os.getenv("OPENAI_API_KEY"), model_name="text-embedding-3-small", dimensions=1024
+)
+collection = chroma_client.get_collection(name="carbon_catalogue", embedding_function=openai_ef)
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import main
+import_s = time.perf_counter() - start
+print("RESULT " + json.dumps({"import_s": import_s}))
+"""
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("GOOGLE_API_KEY", "benchmark")
+    env.setdefault("ANONYMIZED_TELEMETRY", "False")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def measure_once(script: str = MEASURE_SCRIPT) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, env=child_env(),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def slowest_imports(top: int) -> list:
+    """以 -X importtime 匯入 main，回傳 main 直接匯入的模組中累計時間最長的 [(累計 ms, 模組)]"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=child_env(),
+        capture_output=True, text=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 巢狀匯入的模組名稱每層多兩格縮排，只看 main 直接匯入的模組
+        name = name[1:]
+        if name.startswith("  ") and not name.startswith("   "):
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main:app 的匯入時間基準測試")
+    parser.add_argument("--runs", type=int, default=5, help="子行程次數")
+    parser.add_argument("--top", type=int, default=10, help="列出匯入最慢的模組數量（0 表示不列出）")
+    args = parser.parse_args()
+
+    if not os.getenv("CHROMA_PATH"):
+        print("請設定 CHROMA_PATH")
+        sys.exit(1)
+
+    # 兩種情況交替執行，降低檔案快取與系統負載變化的影響
+    reports, eager_reports = [], []
+    for _ in range(args.runs):
+        eager_reports.append(measure_once(EAGER_SCRIPT))
+        reports.append(measure_once())
+    eager_s = [report["import_s"] for report in eager_reports]
+    import_s = [report["import_s"] for report in reports]
+    warmup_s = [report["warmup_s"] for report in reports]
+    total_s = [a + b for a, b in zip(import_s, warmup_s)]
+    print(f"{args.runs} 次子行程（中位數 / 最小值）：")
+    print(f"  匯入 main（基準：匯入時初始化） {statistics.median(eager_s):6.3f} s / {min(eager_s):6.3f} s")
+    print(f"  匯入 main（延遲初始化）         {statistics.median(import_s):6.3f} s / {min(import_s):6.3f} s")
+    print(f"  預熱                            {statistics.median(warmup_s):6.3f} s / {min(warmup_s):6.3f} s")
+    print(f"  匯入 + 預熱                     {statistics.median(total_s):6.3f} s / {min(total_s):6.3f} s")
+    saved = statistics.median(eager_s) - statistics.median(import_s)
+    print(f"  匯入時間減少 {saved:.3f} s（{saved / statistics.median(eager_s):.0%}）")
+    print(f"  匯入後已載入 chromadb：{any(report['chromadb_loaded'] for report in reports)}")
+
+    if args.top:
+        print("\n-X importtime：main 直接匯入的模組中累計時間最長的：")
+        for cumulative_ms, name in slowest_imports(args.top):
+            print(f"  {cumulative_ms:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+大型資料庫的向量搜尋基準測試：單一 NumPy 索引 vs 依產業分區的索引
+
+以合成資料庫（benchmarks/synthetic_catalogue.py）在不同筆數下量測 query_similar_products 的延遲：
+嵌入 API 以回傳預先產生查詢向量的假函數取代，因此結果只反映索引本身。
+過濾條件與 ai_search_products 相同（sector + 碳足跡範圍），並比較兩種索引的 top-k 是否一致。
+
+記憶體需求約為 筆數 × 維度 × 4 bytes × 2（原始矩陣與索引內的正規化副本），
+1M 筆建議使用 --dims 256；真實資料庫使用 1024 維。
+
+用法：
+    python benchmarks/bench_partitioned_index.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import query_chroma
+from synthetic_catalogue import generate_catalogue, sample_query
+from vector_index import NumpyVectorIndex, PartitionedVectorIndex
+
+
+def run_backend(backend: str, index, queries: list, n_results: int) -> tuple:
+    """以指定索引執行 query_similar_products，回傳 (過濾查詢延遲, 不過濾查詢延遲, 過濾查詢的結果 ID)"""
+    query_chroma.VECTOR_BACKEND = backend
+    query_chroma._vector_index = index
+    filtered_ms, unfiltered_ms, result_ids = [], [], []
+    for vector, where in queries:
+        query_chroma.get_embedding_function = lambda vector=vector: lambda texts: [vector]
+        start = time.perf_counter()
+        results = query_chroma.query_similar_products("synthetic", n_results=n_results, where=where)
+        filtered_ms.append((time.perf_counter() - start) * 1000)
+        result_ids.append(results["ids"][0])
+
+        start = time.perf_counter()
+        query_chroma.query_similar_products("synthetic", n_results=n_results)
+        unfiltered_ms.append((time.perf_counter() - start) * 1000)
+    return filtered_ms, unfiltered_ms, result_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="單一索引 vs 分區索引的延遲與資料量關係")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="資料筆數列表")
+    parser.add_argument("--dims", type=int, default=256, help="嵌入向量維度")
+    parser.add_argument("--queries", type=int, default=50, help="每個資料量的查詢次數")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'筆數':>9} {'索引':<12} {'建立 s':>7} | {'過濾 p50':>9} {'過濾 p95':>9} | "
+          f"{'不過濾 p50':>10} {'不過濾 p95':>10} | 與單一索引一致率")
+    for size in (int(value) for value in args.sizes.split(",")):
+        ids, embeddings, metadatas, documents = generate_catalogue(size, args.dims, args.seed)
+        rng = np.random.default_rng(args.seed)
+        queries = [sample_query(metadatas, embeddings, rng) for _ in range(args.queries)]
+
+        baseline_ids = None
+        for backend, index_class in (("numpy", NumpyVectorIndex), ("partitioned", PartitionedVectorIndex)):
+            start = time.perf_counter()
+            index = index_class(ids, embeddings, metadatas, documents)
+            build_s = time.perf_counter() - start
+            # 預熱
+            run_backend(backend, index, queries[:1], args.n_results)
+            filtered_ms, unfiltered_ms, result_ids = run_backend(backend, index, queries, args.n_results)
+
+            if baseline_ids is None:
+                baseline_ids, agreement = result_ids, "—"
+            else:
+                agreement = f"{statistics.mean(len(set(a) & set(b)) / max(1, len(a)) for a, b in zip(baseline_ids, result_ids)):.3f}"
+            print(f"{size:>9} {backend:<12} {build_s:>7.2f} | "
+                  f"{np.percentile(filtered_ms, 50):>6.2f} ms {np.percentile(filtered_ms, 95):>6.2f} ms | "
+                  f"{np.percentile(unfiltered_ms, 50):>7.2f} ms {np.percentile(unfiltered_ms, 95):>7.2f} ms | {agreement}")
+
+            query_chroma._vector_index = None
+            del index
+            gc.collect()
+        del ids, embeddings, metadatas, queries
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+GPT 重新排序提示的 token 數與延遲基準測試：原本的縮排 JSON vs 精簡候選格式
+
+以資料庫中隨機產品的嵌入向量加上少量雜訊作為查詢向量取得 top-10 候選（不需要呼叫嵌入 API），
+比較兩種格式的輸入 token 數（系統提示 + 使用者提示）與近似重複合併後的候選數。
+加上 --live 時會以真實 API 對兩種格式各呼叫一次 gpt-4.1-nano，量測重新排序延遲
+與兩者選擇的一致率。
+
+注意：開啟 Chroma 資料庫會寫入檔案，建議先複製一份資料庫再用 CHROMA_PATH 指向複本。
+
+用法：
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/bench_rerank_prompt.py --queries 100
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/bench_rerank_prompt.py --queries 10 --live
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import query_chroma
+from query_chroma import RERANK_SYSTEM_PROMPT, build_rerank_prompt, get_vector_index
+from text_tokens import count_tokens, tokenizer_name
+
+
+async def timed_rerank(description: str, results: dict, compact: bool) -> tuple:
+    """以指定格式呼叫一次重新排序，回傳 (原始索引, 延遲 ms)"""
+    original = query_chroma.RERANK_COMPACT_CANDIDATES
+    query_chroma.RERANK_COMPACT_CANDIDATES = compact
+    try:
+        start = time.perf_counter()
+        reranked = await query_chroma.gpt_rerank_async(description, results)
+        return reranked.get("best_match_index"), (time.perf_counter() - start) * 1000
+    finally:
+        query_chroma.RERANK_COMPACT_CANDIDATES = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重新排序提示的 token 數與延遲基準測試")
+    parser.add_argument("--queries", type=int, default=100, help="查詢次數")
+    parser.add_argument("--noise", type=float, default=0.03, help="加在查詢向量上的雜訊標準差")
+    parser.add_argument("--live", action="store_true", help="以真實 API 量測重新排序延遲")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    index = get_vector_index()
+    rng = np.random.default_rng(args.seed)
+    cases = []
+    for row in rng.integers(0, len(index), size=args.queries):
+        vector = index.embeddings[row] + rng.normal(0, args.noise, index.embeddings.shape[1]).astype(np.float32)
+        cases.append((index.metadatas[row]["product_name"], index.query([vector], n_results=10)))
+
+    system_tokens = count_tokens(RERANK_SYSTEM_PROMPT)
+    tokens = {"verbose": [], "compact": []}
+    format_ms = {"verbose": [], "compact": []}
+    groups_per_query = []
+    for description, results in cases:
+        for label, compact in (("verbose", False), ("compact", True)):
+            start = time.perf_counter()
+            prompt, groups = build_rerank_prompt(description, results, compact=compact)
+            format_ms[label].append((time.perf_counter() - start) * 1000)
+            tokens[label].append(system_tokens + count_tokens(prompt))
+            if compact:
+                groups_per_query.append(len(groups))
+
+    print(f"token 計數方式：{tokenizer_name()}，查詢數：{len(cases)}\n")
+    for label in ("verbose", "compact"):
+        print(f"  {label:<8} 輸入 token 平均 {statistics.mean(tokens[label]):7.1f} / 最大 {max(tokens[label]):5d}"
+              f"，組提示 {statistics.mean(format_ms[label]):.3f} ms")
+    print(f"  token 減少 {1 - statistics.mean(tokens['compact']) / statistics.mean(tokens['verbose']):.1%}，"
+          f"合併後平均候選數 {statistics.mean(groups_per_query):.2f} / 10"
+          f"（{sum(count < 10 for count in groups_per_query)} 個查詢有近似重複）")
+
+    if not args.live:
+        return
+
+    async def run_live():
+        latency = {"verbose": [], "compact": []}
+        agreed = 0
+        for description, results in cases:
+            verbose_index, verbose_ms = await timed_rerank(description, results, compact=False)
+            compact_index, compact_ms = await timed_rerank(description, results, compact=True)
+            latency["verbose"].append(verbose_ms)
+            latency["compact"].append(compact_ms)
+            # 選到同一組近似重複產品也算一致
+            same_group = any(
+                verbose_index in members and compact_index in members
+                for members in build_rerank_prompt(description, results, compact=True)[1]
+            )
+            agreed += same_group
+        print("\n重新排序延遲（真實 API）：")
+        for label in ("verbose", "compact"):
+            print(f"  {label:<8} 平均 {statistics.mean(latency[label]):7.1f} ms / p50 "
+                  f"{float(np.percentile(latency[label], 50)):7.1f} ms")
+        print(f"  兩種格式選擇一致率 {agreed / len(cases):.3f}")
+
+    asyncio.run(run_live())
+
+
+if __name__ == "__main__":
+    main()
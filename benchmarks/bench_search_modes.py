@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+搜尋模式延遲基準測試：agent（ReAct 代理）vs direct（單次 LLM 呼叫）
+
+所有上游（Brave 搜尋、網頁抓取、LLM）都以固定延遲的假函數模擬，
+因此結果反映的是流程本身的往返次數與並行程度，而不是網路狀況。
+
+用法：
+    python benchmarks/bench_search_modes.py --runs 5 --llm-latency 0.8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+
+import agent_client
+from web_tools_server import format_search_results
+
+
+class LatencyChatModel(GenericFakeChatModel):
+    """每次呼叫都等待固定延遲的假模型，並記錄呼叫次數"""
+
+    latency: float = 0.8
+    calls: int = 0
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._generate(messages, stop=stop, **kwargs)
+
+
+def make_upstreams(search_latency: float, fetch_latency: float):
+    """建立模擬的 Brave 搜尋與網頁抓取函數"""
+    results = [
+        {"title": f"MacBook Air M1 評測 {i}", "description": "規格與評價", "url": f"https://example.com/{i}"}
+        for i in range(1, 6)
+    ]
+
+    async def fake_brave_results(query: str, count: int = 5, country: str = "TW") -> list:
+        await asyncio.sleep(search_latency)
+        return results[:count]
+
+    async def fake_fetch_webpage(url: str, raw_html: bool = False, engine: str = None, query: str = None) -> str:
+        await asyncio.sleep(fetch_latency)
+        return f"## 網頁內容: 測試頁面\n\n來源: {url}\n\nApple M1 晶片、8GB 記憶體、13.3 吋 Retina 顯示器。"
+
+    return fake_brave_results, fake_fetch_webpage
+
+
+async def run_agent_mode(query: str, llm_latency: float, fake_brave_results, fake_fetch_webpage):
+    """agent 模式：搜尋 → 抓取 2 個網頁 → 報告，共 3 次 LLM 呼叫"""
+
+    async def brave_search(query: str, count: int = 5, country: str = "TW") -> str:
+        """搜尋"""
+        return format_search_results(query, await fake_brave_results(query, count, country))
+
+    async def fetch_webpage(url: str, raw_html: bool = False, engine: str = None, query: str = None) -> str:
+        """抓取網頁"""
+        return await fake_fetch_webpage(url, raw_html, engine, query)
+
+    tools = [
+        StructuredTool.from_function(coroutine=brave_search, name="brave_search", description="搜尋"),
+        StructuredTool.from_function(coroutine=fetch_webpage, name="fetch_webpage", description="抓取網頁"),
+    ]
+    model = LatencyChatModel(latency=llm_latency, messages=iter([
+        AIMessage(content="", tool_calls=[{"name": "brave_search", "args": {"query": query}, "id": "s1"}]),
+        AIMessage(content="狀態轉換：進入狀態2", tool_calls=[
+            {"name": "fetch_webpage", "args": {"url": "https://example.com/1"}, "id": "f1"},
+            {"name": "fetch_webpage", "args": {"url": "https://example.com/2"}, "id": "f2"},
+        ]),
+        AIMessage(content="產品報告"),
+    ]))
+    agent = await agent_client.get_search_agent(model=model, tools=tools)
+
+    start = time.perf_counter()
+    await agent.ainvoke({"messages": [{"role": "user", "content": agent_client.SEARCH_AGENT_USER_PROMPT.format(query=query)}]})
+    return time.perf_counter() - start, model.calls
+
+
+async def run_direct_mode(query: str, llm_latency: float, fake_brave_results, fake_fetch_webpage):
+    """direct 模式：搜尋 → 並行抓取 → 1 次 LLM 呼叫"""
+    agent_client.fetch_brave_results = fake_brave_results
+    agent_client.fetch_webpage = fake_fetch_webpage
+    model = LatencyChatModel(latency=llm_latency, messages=iter([AIMessage(content="產品報告")]))
+
+    start = time.perf_counter()
+    await agent_client.run_direct_search(query, model=model)
+    return time.perf_counter() - start, model.calls
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="搜尋模式延遲基準測試")
+    parser.add_argument("--runs", type=int, default=5, help="每種模式執行次數")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="模擬每次 LLM 呼叫延遲（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.4, help="模擬 Brave 搜尋延遲（秒）")
+    parser.add_argument("--fetch-latency", type=float, default=0.6, help="模擬單一網頁抓取延遲（秒）")
+    args = parser.parse_args()
+
+    query = "MacBook Air M1 2020"
+    upstreams = make_upstreams(args.search_latency, args.fetch_latency)
+
+    for name, runner in (("agent", run_agent_mode), ("direct", run_direct_mode)):
+        latencies, llm_calls = [], 0
+        for _ in range(args.runs):
+            elapsed, llm_calls = await runner(query, args.llm_latency, *upstreams)
+            latencies.append(elapsed)
+        print(f"{name:<7} 平均 {statistics.mean(latencies):.3f} 秒 / 中位數 {statistics.median(latencies):.3f} 秒"
+              f"，每次 LLM 呼叫 {llm_calls} 次")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
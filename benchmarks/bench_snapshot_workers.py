@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+向量快照的 worker 啟動時間與記憶體基準測試
+
+模擬多個 API worker 同時載入向量索引，比較三種載入方式：
+- chroma：各自開啟 chromadb.PersistentClient 並從 collection 載入（原本的方式）
+- private：讀取快照後轉成各自私有的 float32 矩陣
+- memmap：以 np.memmap 零複製讀取快照（所有 worker 共用 page cache）
+
+每個 worker 回報啟動時間、RSS 與 PSS（共用頁面依 worker 數平均分攤後的實際用量，
+讀取 /proc/self/smaps_rollup，僅 Linux）。所有 worker 載入完成後才一起量測，讓共用頁面被正確分攤。
+
+加上 --synthetic N 時以合成資料庫（benchmarks/synthetic_catalogue.py）產生 N 筆的快照，
+只比較 private 與 memmap，可觀察大型資料庫下的差異。
+
+注意：chroma 模式會開啟 Chroma 資料庫並寫入檔案，建議先複製一份資料庫再用 CHROMA_PATH 指向複本。
+
+用法：
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/bench_snapshot_workers.py --workers 4
+    python benchmarks/bench_snapshot_workers.py --workers 4 --synthetic 200000 --dims 1024
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+
+
+def memory_kib() -> dict:
+    """讀取目前行程的 RSS 與 PSS（KiB）"""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as rollup:
+            for line in rollup:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    usage[key.lower()] = int(value.split()[0])
+    except OSError:
+        import resource
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage
+
+
+def worker(mode: str, snapshot_path: str, chroma_path: str, barrier, results):
+    start = time.perf_counter()
+    sys.path.append(ROOT)
+    if mode == "chroma":
+        import chromadb
+        from vector_index import NumpyVectorIndex
+        collection = chromadb.PersistentClient(path=chroma_path).get_collection(name="carbon_catalogue")
+        index = NumpyVectorIndex.from_collection(collection)
+    else:
+        from embedding_snapshot import load_snapshot
+        from vector_index import NumpyVectorIndex
+        index = load_snapshot(snapshot_path)
+        if mode == "private":
+            index = NumpyVectorIndex.from_normalized(
+                index.ids, np.array(index.embeddings, dtype=np.float32), index.metadatas, index.documents)
+    # 查詢一次，讓所有向量頁面都被讀入
+    index.query(np.ones(index.embeddings.shape[1], dtype=np.float32), n_results=10)
+    startup_s = time.perf_counter() - start
+
+    barrier.wait()
+    results.put({"mode": mode, "startup_s": startup_s, **memory_kib()})
+    barrier.wait()
+
+
+def run_mode(mode: str, workers: int, snapshot_path: str, chroma_path: str) -> list:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mode, snapshot_path, chroma_path, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量快照的 worker 啟動時間與記憶體基準測試")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dtype", default="float16", choices=("float16", "float32"))
+    parser.add_argument("--synthetic", type=int, default=0, help="改用 N 筆合成資料建立快照")
+    parser.add_argument("--dims", type=int, default=1024, help="合成資料的向量維度")
+    args = parser.parse_args()
+
+    from embedding_snapshot import write_snapshot
+
+    chroma_path = os.getenv("CHROMA_PATH")
+    snapshot_path = os.path.join(tempfile.mkdtemp(prefix="reviveai_snapshot_"), "vector_snapshot.bin")
+    if args.synthetic:
+        from synthetic_catalogue import generate_catalogue
+        ids, embeddings, metadatas, documents = generate_catalogue(args.synthetic, args.dims)
+        modes = ("private", "memmap")
+    else:
+        if not chroma_path:
+            print("請設定 CHROMA_PATH，或使用 --synthetic")
+            sys.exit(1)
+        import chromadb
+        collection = chromadb.PersistentClient(path=chroma_path).get_collection(name="carbon_catalogue")
+        data = collection.get(include=["embeddings", "metadatas", "documents"])
+        ids, embeddings, metadatas, documents = data["ids"], data["embeddings"], data["metadatas"], data["documents"]
+        modes = ("chroma", "private", "memmap")
+    header = write_snapshot(snapshot_path, ids, embeddings, metadatas, documents, dtype=args.dtype)
+    del ids, embeddings, metadatas, documents
+    print(f"快照：{header['rows']} 筆、{header['dims']} 維 {header['dtype']}，"
+          f"{os.path.getsize(snapshot_path) / 1024 / 1024:.1f} MiB，{args.workers} 個 worker\n")
+
+    print(f"{'模式':<8} | {'啟動平均 s':>10} | {'RSS 平均 MiB':>12} | {'PSS 平均 MiB':>12} | {'PSS 總和 MiB':>12}")
+    for mode in modes:
+        reports = run_mode(mode, args.workers, snapshot_path, chroma_path)
+        pss = [report.get("pss", 0) / 1024 for report in reports]
+        print(f"{mode:<8} | {statistics.mean(report['startup_s'] for report in reports):>10.3f} | "
+              f"{statistics.mean(report['rss'] / 1024 for report in reports):>12.1f} | "
+              f"{statistics.mean(pss):>12.1f} | {sum(pss):>12.1f}")
+    os.remove(snapshot_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+向量搜尋基準測試：Chroma collection.query vs 記憶體內 NumPy 精確索引
+
+以資料庫中隨機產品的嵌入向量加上少量雜訊作為查詢向量（不需要呼叫 OpenAI 嵌入 API），
+並套用與 ai_search_products 相同形式的過濾條件（sector + carbon_footprint 範圍）。
+比較兩者的查詢延遲，以及 NumPy 索引結果與 Chroma 結果的 top-k 重疊率。
+
+注意：開啟 Chroma 資料庫會寫入檔案，建議先複製一份資料庫再用 CHROMA_PATH 指向複本。
+
+用法：
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/bench_vector_index.py --queries 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from query_chroma import get_collection
+from vector_index import NumpyVectorIndex
+
+
+def make_where(metadata: dict, rng: np.random.Generator):
+    """仿照 ai_search_products 建立的過濾條件：sector + 碳足跡範圍（涵蓋查詢產品本身）"""
+    carbon = float(metadata["carbon_footprint"])
+    return {"$and": [
+        {"carbon_footprint": {"$gte": carbon * rng.uniform(0.1, 0.9)}},
+        {"carbon_footprint": {"$lte": carbon * rng.uniform(1.1, 10)}},
+        {"sector": metadata["sector"]},
+    ]}
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs NumPy 向量搜尋基準測試")
+    parser.add_argument("--queries", type=int, default=200, help="查詢次數")
+    parser.add_argument("--n-results", type=int, default=10, help="每次查詢返回的結果數量")
+    parser.add_argument("--noise", type=float, default=0.02, help="加在查詢向量上的雜訊標準差")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    collection = get_collection()
+
+    start = time.perf_counter()
+    index = NumpyVectorIndex.from_collection(collection)
+    load_ms = (time.perf_counter() - start) * 1000
+    print(f"NumPy 索引載入：{len(index)} 筆、{index.embeddings.shape[1]} 維，"
+          f"{index.embeddings.nbytes / 1024:.0f} KiB，{load_ms:.1f} ms\n")
+
+    rows = rng.integers(0, len(index), size=args.queries)
+    queries = []
+    for row in rows:
+        vector = index.embeddings[row] + rng.normal(0, args.noise, index.embeddings.shape[1]).astype(np.float32)
+        queries.append((vector.tolist(), make_where(index.metadatas[row], rng)))
+
+    # 預熱
+    collection.query(query_embeddings=[queries[0][0]], n_results=args.n_results, where=queries[0][1])
+    index.query([queries[0][0]], n_results=args.n_results, where=queries[0][1])
+
+    for label, use_where in (("無過濾", False), ("sector + 碳足跡範圍", True)):
+        chroma_ms, numpy_ms, overlaps = [], [], []
+        for vector, where in queries:
+            where = where if use_where else None
+
+            start = time.perf_counter()
+            chroma = collection.query(query_embeddings=[vector], n_results=args.n_results, where=where)
+            chroma_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            exact = index.query([vector], n_results=args.n_results, where=where)
+            numpy_ms.append((time.perf_counter() - start) * 1000)
+
+            chroma_ids, exact_ids = set(chroma["ids"][0]), set(exact["ids"][0])
+            if exact_ids:
+                overlaps.append(len(chroma_ids & exact_ids) / len(exact_ids))
+
+        print(f"【{label}】")
+        for name, values in (("chroma", chroma_ms), ("numpy", numpy_ms)):
+            print(f"  {name:<7} 平均 {statistics.mean(values):7.3f} ms / p50 {percentile(values, 50):7.3f} ms"
+                  f" / p95 {percentile(values, 95):7.3f} ms")
+        print(f"  加速倍數 {statistics.mean(chroma_ms) / statistics.mean(numpy_ms):.1f}x，"
+              f"top-{args.n_results} 與 Chroma 重疊率 {statistics.mean(overlaps):.3f}\n")
+
+
+if __name__ == "__main__":
+    main()
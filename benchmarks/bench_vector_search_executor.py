@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+向量搜尋執行緒池的並行基準測試
+
+同時送出 N 個（預設 50）向量搜尋，比較兩種呼叫方式：
+- blocking：在 coroutine 中直接呼叫同步的 query_similar_products（嵌入 API 與搜尋期間整個 event loop 停住）
+- executor：serving 路徑使用的公開非同步入口 query_chroma.query_similar_products_async
+  （在大小固定的向量搜尋執行緒池執行）
+
+嵌入 API 以固定延遲的假函數取代（模擬 HTTP 往返），索引為合成資料庫（benchmarks/synthetic_catalogue.py），
+不需要 OPENAI_API_KEY 或 Chroma 資料庫。所有請求視為同時到達，量測項目：
+- 總耗時，與每個請求的端到端延遲、排隊等待（到達到開始嵌入）與執行時間（開始嵌入到 await 返回）
+  的 p50、p95、最大值；executor 模式另列出執行緒池本身記錄的排隊與執行時間
+- event loop 延遲：每 10 ms 觸發一次的計時器實際延遲的最大值（其他使用者的串流會被卡住的時間）
+- 同時執行的搜尋數上限（不應超過 VECTOR_SEARCH_WORKERS），以及結果與逐一同步查詢是否一致
+
+用法：
+    python benchmarks/bench_vector_search_executor.py --concurrency 50 --embed-latency 0.05
+    VECTOR_SEARCH_WORKERS=4 python benchmarks/bench_vector_search_executor.py --rows 100000 --dims 256
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import query_chroma
+from synthetic_catalogue import generate_catalogue, sample_query
+from vector_index import NumpyVectorIndex
+
+
+class MockEmbedding:
+    """固定延遲的假嵌入函數：回傳預先指定的查詢向量，記錄每個查詢開始嵌入的時間與同時執行的呼叫數"""
+
+    def __init__(self, vectors: dict, latency: float):
+        self.vectors = vectors
+        self.latency = latency
+        self.active = 0
+        self.max_active = 0
+        self.started = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, input: list) -> list:
+        with self._lock:
+            for text in input:
+                self.started[text] = time.perf_counter()
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            return [self.vectors[text] for text in input]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+async def monitor_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """回傳計時器相對預期時間的最大延遲（ms）"""
+    worst = 0.0
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, (time.perf_counter() - expected) * 1000)
+    return worst
+
+
+async def run_mode(mode: str, queries: list, n_results: int, embedding: MockEmbedding) -> dict:
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(stop))
+    await asyncio.sleep(0)
+    finished = {}
+    embedding.started.clear()
+    pool_before = dict(query_chroma.vector_search_stats)
+
+    async def search(text: str, where: dict):
+        if mode == "blocking":
+            results = query_chroma.query_similar_products(text, n_results=n_results, where=where)
+        else:
+            results = await query_chroma.query_similar_products_async(text, n_results=n_results, where=where)
+        finished[text] = time.perf_counter()
+        return results
+
+    # 所有請求同時到達：以 gather 開始的時間作為每個請求的到達時間
+    start = time.perf_counter()
+    results = await asyncio.gather(*(search(text, where) for text, where in queries))
+    total_ms = (time.perf_counter() - start) * 1000
+    stop.set()
+
+    texts = [text for text, _ in queries]
+    pool = {name: query_chroma.vector_search_stats[name] - pool_before[name]
+            for name in ("completed", "queue_wait_ms_total", "execution_ms_total")}
+    return {
+        "total_ms": total_ms,
+        "loop_lag_ms": await monitor,
+        "latency_ms": [(finished[text] - start) * 1000 for text in texts],
+        "queue_wait_ms": [(embedding.started[text] - start) * 1000 for text in texts],
+        "execution_ms": [(finished[text] - embedding.started[text]) * 1000 for text in texts],
+        "pool": pool,
+        "ids": [result["ids"][0] for result in results],
+    }
+
+
+def describe(values: list) -> str:
+    return (f"p50 {np.percentile(values, 50):7.1f} / p95 {np.percentile(values, 95):7.1f} / "
+            f"最大 {max(values):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量搜尋執行緒池的並行基準測試")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時送出的搜尋數")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="假嵌入 API 的延遲（秒）")
+    parser.add_argument("--rows", type=int, default=20000, help="合成資料庫筆數")
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ids, embeddings, metadatas, documents = generate_catalogue(args.rows, args.dims, args.seed)
+    rng = np.random.default_rng(args.seed)
+    queries, vectors = [], {}
+    for position in range(args.concurrency):
+        vector, where = sample_query(metadatas, embeddings, rng)
+        text = f"synthetic query {position}"
+        vectors[text] = vector
+        queries.append((text, where))
+
+    query_chroma.VECTOR_BACKEND = "numpy"
+    query_chroma._vector_index = NumpyVectorIndex(ids, embeddings, metadatas, documents)
+    embedding = MockEmbedding(vectors, args.embed_latency)
+    query_chroma.get_embedding_function = lambda: embedding
+
+    expected = [
+        query_chroma.query_similar_products(text, n_results=args.n_results, where=where)["ids"][0]
+        for text, where in queries
+    ]
+    print(f"{args.concurrency} 個並行搜尋，合成資料庫 {args.rows} 筆 × {args.dims} 維，"
+          f"假嵌入延遲 {args.embed_latency * 1000:.0f} ms，VECTOR_SEARCH_WORKERS={query_chroma.VECTOR_SEARCH_WORKERS}\n")
+
+    for mode in ("blocking", "executor"):
+        embedding.max_active = 0
+        report = asyncio.run(run_mode(mode, queries, args.n_results, embedding))
+        print(f"[{mode}]")
+        print(f"  總耗時 {report['total_ms']:.0f} ms，event loop 最大延遲 {report['loop_lag_ms']:.1f} ms，"
+              f"同時執行上限 {embedding.max_active}，結果一致 {report['ids'] == expected}")
+        print(f"  端到端   {describe(report['latency_ms'])}")
+        print(f"  排隊等待 {describe(report['queue_wait_ms'])}")
+        print(f"  執行     {describe(report['execution_ms'])}")
+        pool = report["pool"]
+        if pool["completed"]:
+            print(f"  執行緒池記錄：平均排隊 {pool['queue_wait_ms_total'] / pool['completed']:.1f} ms，"
+                  f"平均執行 {pool['execution_ms_total'] / pool['completed']:.1f} ms（{pool['completed']} 次）")
+
+    print(f"\nget_vector_search_stats(): {query_chroma.get_vector_search_stats()}")
+    query_chroma.shutdown_vector_search_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+碳足跡資料庫重建後的結果更新檢查
+
+在暫存目錄建立小型 carbon_catalogue，以假的 LLM 與固定的查詢向量計算一次碳足跡並寫入結果快取；
+接著刪除並重建 collection（最相似的產品與碳足跡改變），確認下一次計算：
+
+- 偵測到資料庫版本改變，不回傳舊的快取結果
+- 重新取得 collection、重新載入向量索引，回傳新資料庫的產品
+- 新結果以新版本寫入快取，再次查詢時命中
+
+最後就地更新最相似產品的碳足跡（collection ID 與筆數不變），確認版本改變、回傳更新後的碳足跡。
+
+numpy 與 chroma 兩種向量搜尋後端各檢查一次，有不符時以結束碼 1 結束。不需要任何 API。
+
+用法：
+    python benchmarks/check_catalogue_rebuild.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("CHROMA_OPENAI_API_KEY", "benchmark")
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+# 不讀寫專案的快照、搜尋參數快取與重新排序紀錄
+os.environ["VECTOR_SNAPSHOT_ENABLED"] = "false"
+os.environ["RERANK_LOG_ENABLED"] = "false"
+os.environ["SEARCH_PARAMS_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="reviveai_params_"), "params.sqlite3")
+
+import numpy as np
+
+import calculate_carbon
+import carbon_cache
+import query_chroma
+from eval_carbon_modes import SimulatedResponses
+
+DIMENSIONS = 8
+QUERY_VECTOR = np.eye(DIMENSIONS, dtype=np.float32)[0]
+DESCRIPTION = "Dell laptop 16G"
+SECTOR = "Computer, IT & telecom"
+
+
+def build_catalogue(client, products: list):
+    """重建 carbon_catalogue；products 為 (ID, 產品名稱, 碳足跡, 與查詢向量的相似程度)"""
+    try:
+        client.delete_collection("carbon_catalogue")
+    except Exception:
+        pass
+    collection = client.create_collection("carbon_catalogue", metadata={"hnsw:space": "cosine"},
+                                          embedding_function=query_chroma.get_openai_embedding_function())
+    embeddings = []
+    for position, (_, _, _, similarity) in enumerate(products):
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        vector[0], vector[1 + position] = similarity, 1 - similarity
+        embeddings.append(vector.tolist())
+    collection.add(
+        ids=[product[0] for product in products],
+        embeddings=embeddings,
+        metadatas=[{"product_name": name, "company": "Dell", "sector": SECTOR, "carbon_footprint": carbon}
+                   for _, name, carbon, _ in products],
+        documents=[f"產品: {name} laptop 詳情: notebook computer" for _, name, _, _ in products],
+    )
+
+
+async def check(backend: str) -> list:
+    os.environ["CHROMA_PATH"] = tempfile.mkdtemp(prefix="reviveai_chroma_")
+    query_chroma._resources.clear()
+    query_chroma._vector_index = None
+    query_chroma._sector_centroids = None
+    query_chroma.VECTOR_BACKEND = backend
+    carbon_cache._carbon_cache = carbon_cache.CarbonResultCache(version_interval=0)
+
+    client = query_chroma.get_chroma_client()
+    build_catalogue(client, [("old-1", "Latitude 5400 laptop", 200.0, 0.9), ("old-2", "Latitude 3400 laptop", 180.0, 0.5)])
+    first = await calculate_carbon.calculate_carbon_footprint_async(DESCRIPTION)
+
+    build_catalogue(client, [("new-1", "XPS 13 laptop", 320.0, 0.95), ("new-2", "Vostro 14 laptop", 250.0, 0.4),
+                             ("new-3", "Inspiron 15 laptop", 260.0, 0.3)])
+    second = await calculate_carbon.calculate_carbon_footprint_async(DESCRIPTION)
+    third = await calculate_carbon.calculate_carbon_footprint_async(DESCRIPTION)
+
+    # 就地更新：只修正碳足跡數值
+    client.get_collection("carbon_catalogue").update(
+        ids=["new-1"],
+        metadatas=[{"product_name": "XPS 13 laptop", "company": "Dell", "sector": SECTOR, "carbon_footprint": 410.0}],
+    )
+    fourth = await calculate_carbon.calculate_carbon_footprint_async(DESCRIPTION)
+
+    name = lambda result: result.get("selected_product", {}).get("product_name")
+    failures = []
+    if "error" in first or name(first) != "Latitude 5400 laptop":
+        failures.append(f"重建前的結果不符: {first}")
+    if second.get("cache_hit") or name(second) != "XPS 13 laptop":
+        failures.append(f"重建後沒有回傳新資料庫的結果: {second}")
+    if not third.get("cache_hit") or name(third) != "XPS 13 laptop":
+        failures.append(f"新結果沒有寫入快取: {third}")
+    carbon = fourth.get("selected_product", {}).get("carbon_footprint")
+    if fourth.get("cache_hit") or carbon != 410.0:
+        failures.append(f"就地更新後沒有回傳新的碳足跡: cache_hit={fourth.get('cache_hit')}, carbon_footprint={carbon}")
+    stats = carbon_cache.get_carbon_cache().get_stats()
+    if stats["invalidations"] != 2:
+        failures.append(f"快取失效次數應為 2: {stats}")
+    return failures
+
+
+def main():
+    client = SimpleNamespace(responses=SimulatedResponses(0))
+    query_chroma.get_openai_client = lambda: client
+    query_chroma.get_embedding_function = lambda: (lambda texts: [QUERY_VECTOR] * len(texts))
+
+    failed = False
+    for backend in ("numpy", "chroma"):
+        failures = asyncio.run(check(backend))
+        failed = failed or bool(failures)
+        print(f"  {'✓' if not failures else '✗'} {backend}")
+        for failure in failures:
+            print(f"      {failure}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+碳足跡搜尋模式評估：two_step（搜尋參數 → 過濾搜尋 → 重新排序）vs fused（不過濾搜尋 → 一次 GPT 選擇）
+
+以固定的評估集（benchmarks/carbon_eval_set.jsonl，每行一個描述與可接受的資料庫產品 ID）
+比較兩種模式的準確率、端到端延遲與每筆的 LLM 呼叫次數。兩種模式的執行順序每筆交替，
+避免嵌入快取只對其中一種模式有利。
+
+需要 OPENAI_API_KEY；加上 --simulate-latency 時改用固定延遲的假 LLM 與假嵌入向量，
+只比較往返次數與延遲（此時準確率沒有意義，不會顯示）。
+
+注意：開啟 Chroma 資料庫會寫入檔案，建議先複製一份資料庫再用 CHROMA_PATH 指向複本。
+
+用法：
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/eval_carbon_modes.py
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/eval_carbon_modes.py --simulate-latency 0.8
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import query_chroma
+from query_chroma import CARBON_SEARCH_MODES, EMBEDDING_DIMENSIONS, ai_search_products, get_vector_index
+from sector_classifier import classify_by_keywords
+
+DEFAULT_EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "carbon_eval_set.jsonl")
+
+
+class CountingResponses:
+    """包裝 client.responses，記錄 LLM 呼叫次數"""
+
+    def __init__(self, responses):
+        self._responses = responses
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return await self._responses.create(**kwargs)
+
+
+class SimulatedResponses:
+    """固定延遲的假 LLM：function calling 依關鍵字回傳參數，重新排序一律選第一名"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        if kwargs.get("tools"):
+            description = kwargs["input"][-1]["content"]
+            keywords = classify_by_keywords(description) or {}
+            arguments = {
+                "query_text": keywords.get("query_text", description),
+                "min_carbon_footprint": None,
+                "max_carbon_footprint": None,
+                "sector": keywords.get("sector"),
+            }
+            return SimpleNamespace(output=[SimpleNamespace(type="function_call", arguments=json.dumps(arguments))])
+        return SimpleNamespace(output_text=json.dumps({"best_match_index": 0, "reason": "模擬選擇"}))
+
+
+def simulated_embeddings(texts: list) -> list:
+    """以文字雜湊為種子的固定隨機向量"""
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vectors.append(np.random.default_rng(seed).normal(size=EMBEDDING_DIMENSIONS).astype(np.float32))
+    return vectors
+
+
+def load_eval_set(path: str) -> list:
+    with open(path, encoding="utf-8") as cases:
+        return [json.loads(line) for line in cases if line.strip()]
+
+
+async def run(cases: list, counter, simulate: bool):
+    index = get_vector_index()
+    products = {
+        product_id: (metadata["product_name"], metadata["company"])
+        for product_id, metadata in zip(index.ids, index.metadatas)
+    }
+    stats = {mode: {"latency_ms": [], "llm_calls": [], "correct": 0, "errors": 0} for mode in CARBON_SEARCH_MODES}
+
+    for position, case in enumerate(cases):
+        expected = {products[product_id] for product_id in case["expected_ids"] if product_id in products}
+        modes = CARBON_SEARCH_MODES if position % 2 == 0 else tuple(reversed(CARBON_SEARCH_MODES))
+        for mode in modes:
+            calls_before = counter.calls
+            start = time.perf_counter()
+            result = await ai_search_products(case["description"], mode=mode)
+            latency_ms = (time.perf_counter() - start) * 1000
+            stats[mode]["latency_ms"].append(latency_ms)
+            stats[mode]["llm_calls"].append(counter.calls - calls_before)
+            if "error" in result:
+                stats[mode]["errors"] += 1
+                print(f"  [{mode}] {case['description']}: 錯誤 {result['error']}")
+                continue
+            best = result["best_product"]
+            correct = (best["product_name"], best["company"]) in expected
+            stats[mode]["correct"] += correct
+            if not simulate:
+                print(f"  [{mode:<8}] {'✓' if correct else '✗'} {case['description']} → {best['product_name']} "
+                      f"({best['company']})，{latency_ms:.0f} ms")
+
+    print(f"\n評估集 {len(cases)} 筆：")
+    for mode, values in stats.items():
+        accuracy = "—" if simulate else f"{values['correct'] / len(cases):.3f}"
+        print(f"  {mode:<8} 準確率 {accuracy}，平均延遲 {statistics.mean(values['latency_ms']):7.1f} ms / p95 "
+              f"{float(np.percentile(values['latency_ms'], 95)):7.1f} ms，平均 LLM 呼叫 "
+              f"{statistics.mean(values['llm_calls']):.2f} 次，錯誤 {values['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="two_step vs fused 碳足跡搜尋模式評估")
+    parser.add_argument("--eval-set", default=DEFAULT_EVAL_SET, help="評估集 JSONL")
+    parser.add_argument("--simulate-latency", type=float, help="以固定延遲（秒）的假 LLM 與假嵌入向量執行")
+    args = parser.parse_args()
+
+    cases = load_eval_set(args.eval_set)
+    if args.simulate_latency is not None:
+        simulated_client = SimpleNamespace(responses=SimulatedResponses(args.simulate_latency))
+        query_chroma.get_openai_client = lambda: simulated_client
+        query_chroma.get_embedding_function = lambda: simulated_embeddings
+    counting_client = SimpleNamespace(responses=CountingResponses(query_chroma.get_openai_client().responses))
+    counter = counting_client.responses
+    query_chroma.get_openai_client = lambda: counting_client
+
+    asyncio.run(run(cases, counter, simulate=args.simulate_latency is not None))
+
+
+if __name__ == "__main__":
+    main()
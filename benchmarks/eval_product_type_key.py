@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+產品類型鍵（sector_classifier.canonical_product_key）的離線檢查與搜尋參數快取的效果
+
+1. 以內建的案例檢查鍵的擷取結果：同一系列的不同規格應得到相同的鍵，不同系列或產品類型應不同；
+   有不符的案例時以結束碼 1 結束，不需要任何 API 或資料庫
+2. 加上 --simulate 時，以假的 LLM（計算呼叫次數）依序規劃一批同系列不同規格的描述，
+   比較有無搜尋參數快取時 plan_product_search 的 LLM 呼叫次數（快取使用暫存的 SQLite 檔）；
+   並確認配件（手機殼）交給 LLM 產生的參數不會被之後的主產品（手機）沿用
+
+用法：
+    python benchmarks/eval_product_type_key.py
+    python benchmarks/eval_product_type_key.py --simulate
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from sector_classifier import canonical_product_key
+
+# (描述, 預期的鍵)；None 表示不應產生鍵（交給 LLM，不共用參數）
+# 筆電、平板、顯示器型號後單獨的 10~34 視為螢幕吋數；Galaxy 涵蓋手機、平板與手錶，沒有產品類型詞時不產生鍵
+KEY_CASES = [
+    ("Apple MacBook Air 13吋 2020 16G 512G 太空灰 筆記型電腦", "apple|macbook air|laptop"),
+    ("macbook air 13吋 2020 8G 256G 筆記型電腦", "apple|macbook air|laptop"),
+    ("MacBook Air laptop silver", "apple|macbook air|laptop"),
+    ("蘋果 MacBook Air 筆電 九成新", "apple|macbook air|laptop"),
+    ("MacBook Pro 14 M3 18GB 1TB", "apple|macbook pro m3|laptop"),
+    ("二手 iPhone 12 Pro 128GB 藍色 手機", "apple|iphone 12 pro|smartphone"),
+    ("iPhone 12 Pro 256G unlocked", "apple|iphone 12 pro|smartphone"),
+    ("iPhone 13 mini 128GB", "apple|iphone 13 mini|smartphone"),
+    ("Samsung Galaxy S21 Ultra 5G 256GB smartphone", "samsung|galaxy s21 ultra|smartphone"),
+    ("三星 Galaxy S21 Ultra 512GB 手機", "samsung|galaxy s21 ultra|smartphone"),
+    ("華碩 ZenBook 14 筆電 16G", "asus|zenbook|laptop"),
+    ("ASUS ZenBook 14 laptop 2021", "asus|zenbook|laptop"),
+    ("Dell XPS 13 9310 16G", "dell|xps 9310|laptop"),
+    ("iPad Air 4 64GB", "apple|ipad air 4|tablet"),
+    ("Dell laptop with 4K display", "dell||laptop"),
+    ("IKEA 沙發", "ikea||沙發"),
+    ("IKEA desk", "ikea||desk"),
+    ("Tesla Model 3 電動車", "tesla|model 3|electric vehicle"),
+    ("Toyota Corolla 2018 轎車", "toyota|corolla|car"),
+    ("二手筆電", None),
+    # 配件與主產品：配件加上標記，不與主產品共用參數；附屬說明中的配件（附充電器）不算
+    ("iPhone 13 手機殼 透明", "apple|iphone 13|smartphone|殼"),
+    ("iPhone 13 128G 手機", "apple|iphone 13|smartphone"),
+    ("iPhone 13 case clear", "apple|iphone 13|smartphone|case"),
+    ("MacBook Air 13 筆電 保護套", "apple|macbook air|laptop|保護套"),
+    ("MacBook Air 2020 筆電", "apple|macbook air|laptop"),
+    ("iPad Air 4 充電器", "apple|ipad air 4|tablet|充電器"),
+    ("iPhone 12 Pro 附充電器", "apple|iphone 12 pro|smartphone"),
+    ("Samsung Galaxy S21 Ultra 256GB", None),
+    ("Nintendo Switch OLED", None),
+    ("laptop and monitor bundle", None),
+]
+
+# 同系列不同規格的描述（--simulate 使用）
+SIMULATED_DESCRIPTIONS = [
+    "MacBook Air 13吋 2020 8G 256G",
+    "MacBook Air 2020 16G 512G 太空灰",
+    "Apple MacBook Air 13 2020 金色",
+    "iPhone 12 Pro 128GB 藍色",
+    "iPhone 12 Pro 256GB 石墨色",
+    "iPhone 12 Pro 512G unlocked",
+    "ASUS ZenBook 14 UX425 16G",
+    "Samsung Galaxy S21 Ultra 256GB 手機",
+    "Samsung Galaxy S21 Ultra 512GB 黑色 smartphone",
+    "Dell XPS 13 9310 16G",
+]
+
+
+class CountingPlanner:
+    """假的 function calling：回傳固定參數並計算呼叫次數"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        arguments = {
+            "query_text": kwargs["input"][-1]["content"][:40],
+            "min_carbon_footprint": 30,
+            "max_carbon_footprint": None,
+            "sector": "Computer, IT & telecom",
+        }
+        return SimpleNamespace(output=[SimpleNamespace(type="function_call", arguments=json.dumps(arguments))])
+
+
+# (配件描述, 之後規劃的主產品描述)
+ACCESSORY_PAIRS = [
+    ("iPhone 13 手機殼 透明", "iPhone 13 128G 手機"),
+    ("MacBook Air 13 筆電 保護套", "MacBook Air 2020 筆電"),
+]
+
+
+def check_keys() -> int:
+    failures = 0
+    for description, expected in KEY_CASES:
+        key = canonical_product_key(description)
+        ok = key == expected
+        failures += not ok
+        print(f"  {'✓' if ok else '✗'} {description!r} → {key!r}" + ("" if ok else f"（預期 {expected!r}）"))
+    print(f"\n{len(KEY_CASES) - failures}/{len(KEY_CASES)} 個案例符合")
+    return failures
+
+
+def _use_simulated_planner(planner, classifier_enabled: bool, cache_enabled: bool):
+    import query_chroma
+    import search_params_cache
+
+    client = SimpleNamespace(responses=planner)
+    query_chroma.get_openai_client = lambda: client
+    query_chroma.SECTOR_CLASSIFIER_ENABLED = classifier_enabled
+    query_chroma.SEARCH_PARAMS_CACHE_ENABLED = cache_enabled
+    path = os.path.join(tempfile.mkdtemp(prefix="reviveai_params_"), "search_params_cache.sqlite3")
+    search_params_cache._search_params_cache = search_params_cache.SearchParamsCache(path=path)
+    search_params_cache._search_params_cache_pid = os.getpid()
+    return query_chroma
+
+
+async def simulate(cache_enabled: bool) -> int:
+    planner = CountingPlanner()
+    # 關閉本地分類器，讓每筆描述都需要參數快取或 LLM
+    query_chroma = _use_simulated_planner(planner, classifier_enabled=False, cache_enabled=cache_enabled)
+
+    for description in SIMULATED_DESCRIPTIONS:
+        await query_chroma.plan_product_search(description)
+    return planner.calls
+
+
+async def check_accessory_isolation() -> int:
+    """配件先交給 LLM 並寫入快取後，主產品仍以本地分類器規劃，不沿用配件的參數"""
+    planner = CountingPlanner()
+    query_chroma = _use_simulated_planner(planner, classifier_enabled=True, cache_enabled=True)
+    # 中心向量分類需要嵌入 API，此檢查只看關鍵字分類與參數快取（配件改由假的 LLM 規劃）
+    def offline_embeddings(texts):
+        raise RuntimeError("離線檢查不呼叫嵌入 API")
+    query_chroma.get_embedding_function = lambda: offline_embeddings
+
+    failures = 0
+    for accessory, product in ACCESSORY_PAIRS:
+        await query_chroma.plan_product_search(accessory)
+        needs_llm = await query_chroma.needs_llm_plan(product)
+        args = await query_chroma.plan_product_search(product)
+        ok = not needs_llm and args.get("classifier", {}).get("source") == "keyword"
+        failures += not ok
+        print(f"  {'✓' if ok else '✗'} {accessory!r} → {product!r}：query_text={args.get('query_text')!r}，"
+              f"sector={args.get('sector')!r}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產品類型鍵的離線檢查")
+    parser.add_argument("--simulate", action="store_true", help="比較有無搜尋參數快取時的 LLM 呼叫次數")
+    args = parser.parse_args()
+
+    failures = check_keys()
+    if args.simulate:
+        print("\n配件與主產品：")
+        failures += asyncio.run(check_accessory_isolation())
+        without_cache = asyncio.run(simulate(False))
+        with_cache = asyncio.run(simulate(True))
+        print(f"\n{len(SIMULATED_DESCRIPTIONS)} 筆同系列不同規格的描述：LLM 呼叫 "
+              f"{without_cache} 次（無快取）→ {with_cache} 次（搜尋參數快取）")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+GPT 重新排序閘門的離線評估
+
+對每組門檻計算：略過重新排序的比例、略過時第一名與 GPT 選擇的一致率、整體一致率，
+以及因略過而節省的延遲。
+
+案例來源：
+- --record：以真實 API 跑一次 plan_product_search → 向量搜尋 → gpt_rerank_async，
+  把搜尋結果、GPT 的選擇與重新排序延遲寫入 --cases 指定的 JSONL，之後可反覆離線評估
+- --from-catalogue N：不呼叫任何 API，以資料庫產品名稱為描述、產品本身的嵌入向量加雜訊為查詢，
+  以來源產品在結果中的位置代替 GPT 的選擇，延遲以 --rerank-latency-ms 估計
+
+注意：開啟 Chroma 資料庫會寫入檔案，建議先複製一份資料庫再用 CHROMA_PATH 指向複本。
+
+用法：
+    python benchmarks/eval_rerank_gate.py --record --descriptions descriptions.txt --cases rerank_cases.jsonl
+    python benchmarks/eval_rerank_gate.py --cases rerank_cases.jsonl
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/eval_rerank_gate.py --from-catalogue 200
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from rerank_gate import evaluate_rerank_gate
+
+DEFAULT_DESCRIPTIONS = [
+    "macbook air 13吋 2020 16G 512G 筆記型電腦",
+    "iPhone 13 Pro 256GB 藍色 智慧型手機",
+    "Dell 27吋 4K 顯示器",
+    "HP LaserJet 雷射印表機",
+    "Lenovo ThinkPad X1 Carbon 筆電",
+    "Samsung Galaxy Tab S9 平板電腦",
+    "IKEA 辦公椅",
+    "Nike Air Max 運動鞋",
+    "Toyota Corolla 轎車",
+    "雀巢即溶咖啡",
+]
+
+
+def _trim_results(results: dict) -> dict:
+    """只保留閘門需要的欄位，方便寫入 JSONL"""
+    return {key: results[key] for key in ("ids", "distances", "metadatas", "documents")}
+
+
+async def record_cases(descriptions: list, path: str):
+    """以真實 API 收集評估案例"""
+    from query_chroma import plan_product_search, query_similar_products, build_where, gpt_rerank_async
+
+    with open(path, "w", encoding="utf-8") as output:
+        for description in descriptions:
+            args = await plan_product_search(description)
+            if "error" in args:
+                print(f"略過 {description}: {args['error']}")
+                continue
+            results = await asyncio.to_thread(query_similar_products, args["query_text"], 10, build_where(args))
+            if not results["ids"][0]:
+                print(f"略過 {description}: 沒有搜尋結果")
+                continue
+            start = time.perf_counter()
+            reranked = await gpt_rerank_async(description, results)
+            latency_ms = (time.perf_counter() - start) * 1000
+            output.write(json.dumps({
+                "description": description,
+                "args": args,
+                "results": _trim_results(results),
+                "rerank_index": reranked.get("best_match_index", 0),
+                "rerank_latency_ms": round(latency_ms, 1),
+            }, ensure_ascii=False) + "\n")
+            print(f"已記錄 {description}：GPT 選擇 #{reranked.get('best_match_index')}，{latency_ms:.0f} ms")
+
+
+def load_cases(path: str) -> list:
+    with open(path, encoding="utf-8") as cases:
+        return [json.loads(line) for line in cases if line.strip()]
+
+
+def catalogue_cases(count: int, noise: float, rerank_latency_ms: float, seed: int) -> list:
+    """以資料庫產品建立不需要 API 的代理案例"""
+    from query_chroma import get_vector_index
+
+    index = get_vector_index()
+    rng = np.random.default_rng(seed)
+    cases = []
+    for row in rng.choice(len(index), size=min(count, len(index)), replace=False):
+        metadata = index.metadatas[row]
+        vector = index.embeddings[row] + rng.normal(0, noise, index.embeddings.shape[1]).astype(np.float32)
+        results = index.query([vector], n_results=10)
+        ids = results["ids"][0]
+        cases.append({
+            "description": metadata["product_name"],
+            "args": {"sector": metadata.get("sector")},
+            "results": _trim_results(results),
+            "rerank_index": ids.index(index.ids[row]) if index.ids[row] in ids else -1,
+            "rerank_latency_ms": rerank_latency_ms,
+        })
+    return cases
+
+
+def evaluate(cases: list, margins: list, max_distances: list, type_match_options: list):
+    print(f"案例數：{len(cases)}，GPT 選擇第一名的比例："
+          f"{sum(case['rerank_index'] == 0 for case in cases) / len(cases):.3f}\n")
+    print(f"{'margin':>7} {'max_dist':>8} {'type':>5} | {'略過率':>6} {'略過一致率':>8} {'整體一致率':>8} "
+          f"{'節省延遲(平均)':>12}")
+    for margin, max_distance, type_match in itertools.product(margins, max_distances, type_match_options):
+        skipped = agreed = 0
+        saved_ms = 0.0
+        for case in cases:
+            decision = evaluate_rerank_gate(
+                case["description"], case["args"], case["results"],
+                min_margin=margin, max_distance=max_distance, require_type_match=type_match,
+            )
+            if decision["skip"]:
+                skipped += 1
+                agreed += case["rerank_index"] == 0
+                saved_ms += case["rerank_latency_ms"]
+        total = len(cases)
+        # 未略過的案例使用 GPT 的選擇，一致率視為 1
+        overall = (agreed + total - skipped) / total
+        skipped_agreement = f"{agreed / skipped:.3f}" if skipped else "—"
+        print(f"{margin:>7.3f} {max_distance:>8.2f} {str(type_match):>5} | {skipped / total:>6.3f} "
+              f"{skipped_agreement:>8} {overall:>8.3f} {saved_ms / total:>10.1f} ms")
+
+
+def _floats(text: str) -> list:
+    return [float(value) for value in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPT 重新排序閘門的離線評估")
+    parser.add_argument("--cases", default="rerank_cases.jsonl", help="評估案例 JSONL")
+    parser.add_argument("--record", action="store_true", help="以真實 API 收集案例到 --cases")
+    parser.add_argument("--descriptions", help="收集案例用的產品描述檔（每行一筆）")
+    parser.add_argument("--from-catalogue", type=int, default=0, help="以資料庫產品建立 N 個代理案例")
+    parser.add_argument("--noise", type=float, default=0.07, help="代理案例查詢向量的雜訊標準差")
+    parser.add_argument("--rerank-latency-ms", type=float, default=1200.0, help="代理案例的重新排序延遲估計")
+    parser.add_argument("--margins", default="0,0.01,0.02,0.03,0.05,0.08", help="要評估的 margin 門檻")
+    parser.add_argument("--max-distances", default="0.4,0.6,1.0", help="要評估的第一名距離上限")
+    parser.add_argument("--type-match", default="true,false", help="是否要求產品類型相同")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.record:
+        descriptions = DEFAULT_DESCRIPTIONS
+        if args.descriptions:
+            with open(args.descriptions, encoding="utf-8") as lines:
+                descriptions = [line.strip() for line in lines if line.strip()]
+        asyncio.run(record_cases(descriptions, args.cases))
+
+    if args.from_catalogue:
+        cases = catalogue_cases(args.from_catalogue, args.noise, args.rerank_latency_ms, args.seed)
+    else:
+        cases = load_cases(args.cases)
+    if not cases:
+        print("沒有可評估的案例")
+        return
+
+    type_match_options = [value.strip().lower() == "true" for value in args.type_match.split(",")]
+    evaluate(cases, _floats(args.margins), _floats(args.max_distances), type_match_options)
+
+
+if __name__ == "__main__":
+    main()
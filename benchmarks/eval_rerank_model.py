@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+重新排序模型與 GPT 重新排序的準確率／延遲比較
+
+把案例分成訓練與評估兩部分（或以 --model 評估已保存的版本），對每個信心門檻計算：
+模型接手的比例、接手時與 GPT 選擇的一致率、整體一致率（未接手的案例使用 GPT，一致率視為 1），
+以及每筆查詢的平均重新排序延遲（模型推論實測；GPT 延遲取自案例紀錄）。
+同時列出 GPT 與「直接採用第一名」兩種基準。
+
+案例來源：
+- --cases：rerank_model 記錄的決策（data/rerank_decisions.jsonl，特徵已在記錄時計算，延遲只含預測），
+  或 benchmarks/eval_rerank_gate.py --record 收集的案例（含完整搜尋結果，延遲包含特徵計算）
+- --from-catalogue N：不呼叫任何 API，以資料庫產品名稱為描述、產品嵌入向量加雜訊為查詢，
+  以來源產品在結果中的位置代替 GPT 的選擇，GPT 延遲以 --rerank-latency-ms 估計
+
+用法：
+    python benchmarks/eval_rerank_model.py --cases data/rerank_decisions.jsonl
+    python benchmarks/eval_rerank_model.py --cases data/rerank_decisions.jsonl --model data/rerank_models/rerank_model_v1.json
+    CHROMA_PATH=/tmp/chroma_copy python benchmarks/eval_rerank_model.py --from-catalogue 300
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from rerank_model import LogisticReranker, case_features, load_decisions
+
+
+def _floats(text: str) -> list:
+    return [float(value) for value in text.split(",") if value.strip()]
+
+
+def report(model: LogisticReranker, cases: list, thresholds: list):
+    # 模型推論延遲：預測（案例含完整搜尋結果時也包含特徵計算）
+    probabilities = []
+    started = time.perf_counter()
+    for case in cases:
+        probabilities.append(model.predict_proba(case_features(case)))
+    model_ms = (time.perf_counter() - started) * 1000 / len(cases)
+    predictions = [int(np.argmax(row)) for row in probabilities]
+    confidences = [float(np.max(row)) for row in probabilities]
+    labels = [case["rerank_index"] for case in cases]
+    gpt_ms = float(np.mean([case["rerank_latency_ms"] for case in cases]))
+
+    total = len(cases)
+    print(f"評估案例：{total}，模型版本：{model.version or '未保存'}，"
+          f"模型推論 {model_ms:.2f} ms/筆，GPT 重新排序 {gpt_ms:.0f} ms/筆\n")
+    print(f"{'方法':<14} | {'接手率':>6} {'接手一致率':>8} {'整體一致率':>8} {'平均延遲':>10}")
+    print(f"{'GPT':<14} | {0:>6.3f} {'—':>8} {1:>8.3f} {gpt_ms:>7.1f} ms")
+    top1 = sum(label == 0 for label in labels) / total
+    print(f"{'第一名':<14} | {1:>6.3f} {top1:>8.3f} {top1:>8.3f} {0:>7.1f} ms")
+    print(f"{'模型（全接手）':<14} | {1:>6.3f} "
+          f"{np.mean([p == l for p, l in zip(predictions, labels)]):>8.3f} "
+          f"{np.mean([p == l for p, l in zip(predictions, labels)]):>8.3f} {model_ms:>7.1f} ms")
+    for threshold in thresholds:
+        covered = [i for i in range(total) if confidences[i] >= threshold]
+        agreed = sum(predictions[i] == labels[i] for i in covered)
+        coverage = len(covered) / total
+        covered_agreement = f"{agreed / len(covered):.3f}" if covered else "—"
+        # 未接手的案例仍需呼叫 GPT
+        latency = model_ms + (1 - coverage) * gpt_ms
+        print(f"{'模型 ≥ ' + format(threshold, '.2f'):<14} | {coverage:>6.3f} {covered_agreement:>8} "
+              f"{(agreed + total - len(covered)) / total:>8.3f} {latency:>7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重新排序模型與 GPT 的準確率／延遲比較")
+    parser.add_argument("--cases", action="append", help="決策紀錄或評估案例 JSONL（可多次指定）")
+    parser.add_argument("--from-catalogue", type=int, default=0, help="以資料庫產品建立 N 個代理案例")
+    parser.add_argument("--noise", type=float, default=0.07, help="代理案例查詢向量的雜訊標準差")
+    parser.add_argument("--rerank-latency-ms", type=float, default=1200.0, help="代理案例的 GPT 重新排序延遲估計")
+    parser.add_argument("--model", help="評估已保存的模型檔案（所有案例皆用於評估）")
+    parser.add_argument("--holdout", type=float, default=0.3, help="未指定 --model 時保留評估的案例比例")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9", help="要評估的信心門檻")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    cases = [case for path in args.cases or [] for case in load_decisions(path)]
+    if args.from_catalogue:
+        from eval_rerank_gate import catalogue_cases
+        cases += [case for case in catalogue_cases(args.from_catalogue, args.noise, args.rerank_latency_ms, args.seed)
+                  if case["rerank_index"] >= 0]
+    if not cases:
+        parser.error("沒有案例：請指定 --cases 或 --from-catalogue")
+
+    if args.model:
+        model, test_cases = LogisticReranker.load(args.model), cases
+    else:
+        order = np.random.default_rng(args.seed).permutation(len(cases))
+        test_size = max(int(len(cases) * args.holdout), 1)
+        test_cases = [cases[row] for row in order[:test_size]]
+        train_cases = [cases[row] for row in order[test_size:]]
+        model = LogisticReranker().fit(
+            [case_features(case) for case in train_cases],
+            [case["rerank_index"] for case in train_cases],
+        )
+        print(f"訓練案例：{len(train_cases)}")
+    report(model, test_cases, _floats(args.thresholds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+合成碳足跡資料庫產生器（供大型資料庫的向量搜尋基準測試使用）
+
+產業比例與真實 carbon_catalogue 相同；每個產業有數十種「產品類型」，嵌入向量為
+產業中心 + 類型中心 + 雜訊（再正規化），碳足跡為依類型中位數的對數常態分佈。
+以分批方式寫入預先配置的 float32 矩陣，可產生到數百萬筆。
+
+用法：
+    python benchmarks/synthetic_catalogue.py --rows 1000000 --dims 256 --output /tmp/synthetic_catalogue.npz
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+# 真實資料庫的產業分佈（筆數）
+SECTOR_WEIGHTS = {
+    "Computer, IT & telecom": 151,
+    "Food & Beverage": 85,
+    "Home durables, textiles, & equipment": 68,
+    "Chemicals": 54,
+    "Automobiles & components": 38,
+    "Construction & commercial materials": 35,
+    "Comm. equipm. & capital goods": 34,
+    "Packaging for consumer goods": 21,
+}
+TYPES_PER_SECTOR = 40
+
+
+def generate_catalogue(rows: int, dims: int = 1024, seed: int = 42, chunk_size: int = 100_000) -> tuple:
+    """
+    產生合成資料庫
+
+    Args:
+        rows: 筆數
+        dims: 嵌入向量維度
+        seed: 亂數種子
+        chunk_size: 每批產生的筆數（控制暫存記憶體）
+
+    Returns:
+        tuple: (ids, embeddings (rows, dims) float32, metadatas, documents)
+    """
+    rng = np.random.default_rng(seed)
+    sectors = list(SECTOR_WEIGHTS)
+    weights = np.array(list(SECTOR_WEIGHTS.values()), dtype=np.float64)
+    weights /= weights.sum()
+
+    sector_centers = rng.normal(size=(len(sectors), dims)).astype(np.float32)
+    type_centers = (
+        np.repeat(sector_centers, TYPES_PER_SECTOR, axis=0)
+        + rng.normal(scale=0.8, size=(len(sectors) * TYPES_PER_SECTOR, dims)).astype(np.float32)
+    )
+    # 每種產品類型的碳足跡中位數：0.01 ~ 10000 kg CO2e
+    type_medians = 10 ** rng.uniform(-2, 4, size=len(type_centers))
+
+    embeddings = np.empty((rows, dims), dtype=np.float32)
+    sector_index = rng.choice(len(sectors), size=rows, p=weights)
+    type_index = sector_index * TYPES_PER_SECTOR + rng.integers(0, TYPES_PER_SECTOR, size=rows)
+    carbon = np.round(type_medians[type_index] * rng.lognormal(0, 0.5, size=rows), 4)
+
+    for start in range(0, rows, chunk_size):
+        end = min(rows, start + chunk_size)
+        chunk = type_centers[type_index[start:end]] + rng.normal(
+            scale=0.6, size=(end - start, dims)).astype(np.float32)
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+        embeddings[start:end] = chunk
+
+    ids = [f"synthetic-{row}" for row in range(rows)]
+    metadatas = [
+        {
+            "product_name": f"Synthetic product {type_value}-{row}",
+            "company": f"Company {type_value % 97}",
+            "sector": sectors[sector_value],
+            "carbon_footprint": float(carbon_value),
+        }
+        for row, (sector_value, type_value, carbon_value) in enumerate(zip(
+            sector_index.tolist(), type_index.tolist(), carbon.tolist()))
+    ]
+    return ids, embeddings, metadatas, None
+
+
+def sample_query(metadatas: list, embeddings: np.ndarray, rng: np.random.Generator, noise: float = 0.02) -> tuple:
+    """
+    以隨機一筆資料產生查詢向量與 ai_search_products 形式的過濾條件（sector + 碳足跡範圍）
+
+    Returns:
+        tuple: (查詢向量, where)
+    """
+    row = int(rng.integers(0, len(metadatas)))
+    metadata = metadatas[row]
+    vector = embeddings[row] + rng.normal(0, noise, embeddings.shape[1]).astype(np.float32)
+    carbon = metadata["carbon_footprint"]
+    where = {"$and": [
+        {"carbon_footprint": {"$gte": carbon * rng.uniform(0.1, 0.9)}},
+        {"carbon_footprint": {"$lte": carbon * rng.uniform(1.1, 10)}},
+        {"sector": metadata["sector"]},
+    ]}
+    return vector, where
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成碳足跡資料庫產生器")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True, help="輸出的 .npz 檔")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ids, embeddings, metadatas, _ = generate_catalogue(args.rows, args.dims, args.seed)
+    print(f"產生 {args.rows} 筆、{args.dims} 維，{time.perf_counter() - start:.1f} s")
+    np.savez(
+        args.output,
+        ids=np.array(ids),
+        embeddings=embeddings,
+        sectors=np.array([metadata["sector"] for metadata in metadatas]),
+        carbon_footprints=np.array([metadata["carbon_footprint"] for metadata in metadatas]),
+    )
+    print(f"已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,27 @@
 from dotenv import load_dotenv
 import asyncio
-from query_chroma import ai_search_products 
+import logging
+import os
+from query_chroma import (
+    ai_search_products,
+    prepare_search,
+    resolve_search_mode,
+    build_where,
+    embed_for_centroid,
+    query_similar_products_batch_async,
+    select_best_match,
+)
+from singleflight import get_singleflight
+from carbon_cache import CARBON_CACHE_ENABLED, get_carbon_cache
 
 # 載入環境變數
 load_dotenv()
 
+logger = logging.getLogger("reviveai_api")
+
 # 常數定義
 DEFAULT_SAVING_RATIO = 0.54  # 假設平均節省的碳排放比例：二手產品的平均替代率（Replacement Rate）
+CARBON_BATCH_CONCURRENCY = int(os.getenv("CARBON_BATCH_CONCURRENCY", "8"))  # 批次計算時同時進行的 LLM 步驟上限
 
 def calculate_environmental_benefits(saved_carbon: float) -> dict:
     """計算環境效益等值"""
@@ -22,11 +37,124 @@ def calculate_environmental_benefits(saved_carbon: float) -> dict:
         "phone_charges": "少於1" if phone_charges < 1 else f"{phone_charges:.0f}"
     }
 
-async def calculate_carbon_footprint_async(product_description: str) -> dict:
-    """使用 AI 計算碳足跡並返回結果 (非同步版本)"""
+async def calculate_carbon_footprint_async(product_description: str, mode: str = None) -> dict:
+    """使用 AI 計算碳足跡並返回結果 (非同步版本)
+
+    相同描述（正規化後）在資料庫未變更時直接回傳快取結果，結果的 cache_hit 欄位標示是否來自快取。
+    同時進行中的相同描述只會計算一次，其餘呼叫共用結果（呼叫端不應修改回傳的字典）。
+    mode 為搜尋模式（two_step 或 fused），預設依 CARBON_SEARCH_MODE。
+    """
+    mode = resolve_search_mode(mode)
+    cache = get_carbon_cache()
+    version = await cache.get_catalogue_version() if CARBON_CACHE_ENABLED else None
+    if version is not None:
+        cached = cache.lookup(product_description, mode, version)
+        if cached is not None:
+            return cached
+
+    # 與結果快取使用相同的正規化鍵，同一個快取項目只會有一次計算
+    key = cache.make_key(product_description, mode, version)
+    result = await get_singleflight("carbon_lookup").do(key, _calculate_carbon_footprint, product_description, mode)
+    if version is not None:
+        cache.store(product_description, mode, version, result)
+    return {**result, "cache_hit": False}
+
+async def _calculate_carbon_footprint(product_description: str, mode: str = None) -> dict:
+    """實際執行碳足跡計算"""
     # 使用 AI 搜尋產品
-    search_results = await ai_search_products(product_description)
-    
+    search_results = await ai_search_products(product_description, mode)
+    return build_carbon_result(search_results)
+
+async def calculate_carbon_footprint_batch(product_descriptions: list, concurrency: int = CARBON_BATCH_CONCURRENCY,
+                                           mode: str = None):
+    """批次計算多個商品的碳足跡，依完成順序逐筆產出結果
+
+    與逐筆呼叫 calculate_carbon_footprint_async 的差別（結果快取相同，命中的商品最先產出）：
+    - 需要產業中心向量分類的商品描述，其嵌入向量以單一批次請求取得（不逐筆呼叫嵌入 API）
+    - 所有查詢文本的嵌入向量以單一批次請求取得
+    - 向量搜尋以一次矩陣運算處理所有查詢向量
+    - 每筆商品的兩次 LLM 呼叫（搜尋參數、重新排序）以 concurrency 限制同時進行的數量
+
+    Args:
+        product_descriptions: 商品描述列表
+        concurrency: 同時進行的 LLM 步驟上限
+        mode: 搜尋模式（two_step 或 fused），預設依 CARBON_SEARCH_MODE
+
+    Yields:
+        tuple: (商品在輸入列表中的索引, 與 calculate_carbon_footprint_async 相同格式的結果)
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(index, func, *args):
+        async with semaphore:
+            return index, await func(*args)
+
+    # 快取命中的商品直接產出
+    mode = resolve_search_mode(mode)
+    cache = get_carbon_cache()
+    version = await cache.get_catalogue_version() if CARBON_CACHE_ENABLED else None
+    pending = []
+    for index, description in enumerate(product_descriptions):
+        cached = cache.lookup(description, mode, version) if version is not None else None
+        if cached is not None:
+            yield index, cached
+        else:
+            pending.append(index)
+
+    def finish(index, search_results):
+        result = build_carbon_result(search_results)
+        if version is not None:
+            cache.store(product_descriptions[index], mode, version, result)
+        return index, {**result, "cache_hit": False}
+
+    # 第一步：產生每筆商品的搜尋參數（fused 模式不呼叫 LLM），失敗的商品直接產出錯誤結果
+    # 中心向量分類所需的描述嵌入向量先以單一請求取得；失敗時不做中心向量分類，交給 LLM
+    vectors = [None] * len(pending)
+    use_centroid = mode == "two_step"
+    if use_centroid:
+        try:
+            vectors = await embed_for_centroid([product_descriptions[index] for index in pending])
+        except Exception as e:
+            logger.warning(f"批次取得描述嵌入向量失敗，略過產業中心向量分類: {str(e)}")
+            use_centroid = False
+    plans = {}
+    n_results = 10
+    for finished in asyncio.as_completed([
+        bounded(index, prepare_search, product_descriptions[index], mode, vector, vector is not None)
+        for index, vector in zip(pending, vectors)
+    ]):
+        index, (args, n_results) = await finished
+        if "error" in args:
+            yield finish(index, args)
+        else:
+            plans[index] = args
+
+    if not plans:
+        return
+
+    # 第二步：單一批次嵌入 + 一次多向量搜尋
+    indices = sorted(plans)
+    try:
+        searches = await query_similar_products_batch_async(
+            [plans[index]["query_text"] for index in indices],
+            n_results,
+            [build_where(plans[index]) for index in indices]
+        )
+    except Exception as e:
+        for index in indices:
+            yield finish(index, {"error": f"搜尋過程中發生錯誤: {str(e)}", "search_params": plans[index]})
+        return
+
+    # 第三步：逐筆重新排序，依完成順序產出
+    for finished in asyncio.as_completed([
+        bounded(index, select_best_match, product_descriptions[index], plans[index], results)
+        for index, results in zip(indices, searches)
+    ]):
+        index, search_results = await finished
+        yield finish(index, search_results)
+
+def build_carbon_result(search_results: dict) -> dict:
+    """將產品搜尋結果轉換為碳足跡計算結果"""
     # 檢查是否有錯誤
     if "error" in search_results:
         # 返回錯誤訊息，但包含一個預設的環境效益資訊，避免前端顯示問題
@@ -0,0 +1,179 @@
+"""
+ReviveAI 碳足跡計算結果快取
+
+同一個商品常以不同 style 重新送出，online_sale、online_sale_stream、selling_post 每次都會重新計算
+calculate_carbon_footprint_async（搜尋參數 LLM、嵌入、向量搜尋、重新排序）。此模組快取最終結果：
+
+- 行程內 LRU，筆數上限 + TTL
+- 以正規化後的描述、搜尋模式與資料庫版本（collection ID + 筆數 + 內容雜湊）為鍵
+- 定期檢查資料庫版本；資料庫重建或內容就地更新（版本改變）時先重新取得 collection、
+  重新載入向量索引與產業中心向量，再清空快取
+- 錯誤結果不快取；回傳的結果以 cache_hit 欄位標示是否來自快取
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+from search_cache import normalize_query
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+# 快取設定
+CARBON_CACHE_ENABLED = os.getenv("CARBON_CACHE_ENABLED", "true").lower() == "true"
+CARBON_CACHE_TTL = float(os.getenv("CARBON_CACHE_TTL", str(6 * 3600)))  # 結果有效期（秒）
+CARBON_CACHE_SIZE = int(os.getenv("CARBON_CACHE_SIZE", "1024"))
+CARBON_CACHE_VERSION_INTERVAL = float(os.getenv("CARBON_CACHE_VERSION_INTERVAL", "60"))  # 重新檢查資料庫版本的間隔（秒）
+
+
+def _default_version_source() -> str:
+    from query_chroma import get_catalogue_version
+    return get_catalogue_version()
+
+
+def _default_version_change():
+    from query_chroma import refresh_catalogue
+    refresh_catalogue()
+
+
+class CarbonResultCache:
+    """
+    碳足跡計算結果的行程內快取
+
+    Args:
+        ttl: 結果有效期（秒）
+        max_entries: 筆數上限，超過時淘汰最久未使用的結果
+        version_interval: 資料庫版本的快取時間（秒）
+        version_source: 回傳資料庫版本字串的同步函數，預設為 query_chroma.get_catalogue_version
+        on_version_change: 資料庫版本改變時（清空快取前）執行的同步函數，預設為 query_chroma.refresh_catalogue
+    """
+
+    def __init__(self, ttl: float = CARBON_CACHE_TTL, max_entries: int = CARBON_CACHE_SIZE,
+                 version_interval: float = CARBON_CACHE_VERSION_INTERVAL, version_source=None,
+                 on_version_change=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_interval = version_interval
+        self.version_source = version_source or _default_version_source
+        self.on_version_change = on_version_change or _default_version_change
+        self._version_lock = asyncio.Lock()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "version_errors": 0,
+            "refresh_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(description: str, mode: str, version: str) -> str:
+        return hashlib.sha256(f"{version}\x1f{mode}\x1f{normalize_query(description)}".encode("utf-8")).hexdigest()
+
+    async def get_catalogue_version(self) -> Optional[str]:
+        """
+        取得資料庫版本（每 version_interval 秒才實際查詢一次）；版本改變時更新索引並清空快取
+
+        Returns:
+            str: 資料庫版本；無法取得時為 None（此時不使用快取）
+        """
+        if self._is_version_fresh():
+            return self._version
+        # 同時到期的請求只由一個實際查詢與更新索引
+        async with self._version_lock:
+            if self._is_version_fresh():
+                return self._version
+            try:
+                version = await asyncio.to_thread(self.version_source)
+            except Exception as e:
+                self.stats["version_errors"] += 1
+                logger.warning(f"取得碳足跡資料庫版本失敗，暫不使用結果快取: {str(e)}")
+                return None
+            if self._version is not None and version != self._version:
+                logger.info(f"碳足跡資料庫已變更（{self._version} → {version}），重新載入向量索引並清空結果快取")
+                try:
+                    await asyncio.to_thread(self.on_version_change)
+                except Exception as e:
+                    # 無法更新索引時不使用快取，下次再重試
+                    self.stats["refresh_errors"] += 1
+                    logger.warning(f"重新載入碳足跡資料庫失敗，暫不使用結果快取: {str(e)}")
+                    return None
+                self.clear()
+                self.stats["invalidations"] += 1
+            self._version = version
+            self._version_checked_at = time.monotonic()
+            return version
+
+    def _is_version_fresh(self) -> bool:
+        return self._version is not None and time.monotonic() - self._version_checked_at < self.version_interval
+
+    def lookup(self, description: str, mode: str, version: str) -> Optional[dict]:
+        """查詢快取，命中時回傳標示 cache_hit 的結果副本"""
+        key = self.make_key(description, mode, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return {**entry[0], "cache_hit": True}
+
+    def store(self, description: str, mode: str, version: str, result: dict):
+        """寫入快取（錯誤結果不寫入）"""
+        if "error" in result:
+            return
+        key = self.make_key(description, mode, version)
+        with self._lock:
+            self._entries[key] = ({name: value for name, value in result.items() if name != "cache_hit"},
+                                  time.monotonic())
+            self._entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """回傳命中統計與命中率"""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": CARBON_CACHE_ENABLED,
+            "hit_rate": round(self.stats["hits"] / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "catalogue_version": self._version,
+        }
+
+
+# 行程內共用的快取實例
+_carbon_cache = None
+
+
+def get_carbon_cache() -> CarbonResultCache:
+    """取得行程內共用的碳足跡結果快取"""
+    global _carbon_cache
+    if _carbon_cache is None:
+        _carbon_cache = CarbonResultCache()
+    return _carbon_cache
@@ -3,7 +3,7 @@ from pydantic import BaseModel
 import tempfile
 import os
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import asyncio
 import json
 from fastapi.responses import StreamingResponse
@@ -17,11 +17,22 @@ logger = logging.getLogger("reviveai_api")
 from image_service import analyze_image, validate_image
 from content_service import generate_product_content
 from streaming_content_service import generate_streaming_product_content
-from calculate_carbon import calculate_carbon_footprint_async
+from calculate_carbon import calculate_carbon_footprint_async, calculate_carbon_footprint_batch, CARBON_BATCH_CONCURRENCY
 from selling_post_service import generate_selling_post
 from seeking_post_service import generate_seeking_post
 from seeking_image import create_seeking_image, remake_seeking_image
 from ai_image import remake_product_image
+from singleflight import get_singleflight_stats
+from search_cache import get_search_cache
+from carbon_cache import get_carbon_cache
+from search_params_cache import get_search_params_cache
+from embedding_cache import get_embedding_cache
+from sector_classifier import get_sector_classifier_stats
+from rerank_gate import get_rerank_gate_stats
+from rerank_model import get_rerank_model_stats
+from query_chroma import get_speculative_search_stats, get_vector_search_stats
+from mcp_session_pool import get_mcp_pool
+from web_tools_server import get_extract_stats, get_condense_stats
 
 # 建立 Router
 router = APIRouter(
@@ -29,12 +40,20 @@ router = APIRouter(
     tags=["ReviveAI Combined Services"]
 )
 
+# 批次碳足跡計算的商品數上限
+CARBON_BATCH_MAX_ITEMS = int(os.getenv("CARBON_BATCH_MAX_ITEMS", "500"))
+
 # 定義響應模型
 class ApiResponse(BaseModel):
     success: bool
     data: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
+# 定義請求模型
+class CarbonBatchRequest(BaseModel):
+    descriptions: List[str]
+    concurrency: Optional[int] = None
+
 def format_carbon_footprint_for_content(carbon_results):
     """
     將碳足跡數據格式化為適合融入文案的內容
@@ -115,12 +134,81 @@ async def save_and_validate_image(image: UploadFile):
         raise HTTPException(status_code=400, detail=str(e))
 
 # API 端點
+@router.get("/stats", response_model=ApiResponse)
+async def combined_stats_endpoint():
+    """
+    服務內部統計：重複請求合併次數、搜尋/碳足跡/嵌入快取命中率、向量搜尋執行緒池的排隊與執行時間、重新排序模型的採用比例、MCP 會話池狀態、
+    direct 搜尋模式在本行程內的網頁擷取佇列與精簡節省的 token 數
+    """
+    return ApiResponse(
+        success=True,
+        data={
+            "singleflight": get_singleflight_stats(),
+            "search_cache": get_search_cache().get_stats(),
+            "carbon_cache": get_carbon_cache().get_stats(),
+            "search_params_cache": get_search_params_cache().get_stats(),
+            "embedding_cache": get_embedding_cache().get_stats(),
+            "sector_classifier": get_sector_classifier_stats(),
+            "rerank_gate": get_rerank_gate_stats(),
+            "rerank_model": get_rerank_model_stats(),
+            "speculative_search": get_speculative_search_stats(),
+            "vector_search": get_vector_search_stats(),
+            "mcp_pool": get_mcp_pool().get_stats(),
+            "extract": get_extract_stats(),
+            "condense": get_condense_stats()
+        }
+    )
+
+@router.post("/carbon_batch")
+async def carbon_batch_endpoint(request: CarbonBatchRequest):
+    """
+    批次碳足跡計算：一次送出多個商品描述（例如匯入賣家庫存），以 NDJSON 串流逐筆回傳
+
+    - **descriptions**: 商品描述列表
+    - **concurrency**: 同時進行的 LLM 步驟上限（不可超過伺服器設定，預設使用伺服器設定）
+
+    每行一個 JSON，依完成順序回傳：
+    {"type": "result", "index": 輸入索引, "description": 商品描述, "carbon_footprint": 碳足跡結果}，
+    最後一行為 {"type": "end", "count": 筆數, "errors": 失敗筆數}
+    """
+    descriptions = request.descriptions
+    if not descriptions:
+        raise HTTPException(status_code=400, detail="商品描述列表為空")
+    if len(descriptions) > CARBON_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"一次最多計算 {CARBON_BATCH_MAX_ITEMS} 個商品")
+    concurrency = min(request.concurrency or CARBON_BATCH_CONCURRENCY, CARBON_BATCH_CONCURRENCY)
+    logger.info(f"接收批次碳足跡計算請求: 商品數={len(descriptions)}, 並行上限={concurrency}")
+
+    async def response_generator():
+        count, errors = 0, 0
+        try:
+            async for index, carbon_results in calculate_carbon_footprint_batch(descriptions, concurrency=concurrency):
+                count += 1
+                errors += "error" in carbon_results
+                yield json.dumps({
+                    "type": "result",
+                    "index": index,
+                    "description": descriptions[index],
+                    "carbon_footprint": carbon_results
+                }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"批次碳足跡計算失敗: {str(e)}", exc_info=True)
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+        logger.info(f"批次碳足跡計算完成: {count} 筆，失敗 {errors} 筆")
+        yield json.dumps({"type": "end", "count": count, "errors": errors}) + "\n"
+
+    return StreamingResponse(
+        response_generator(),
+        media_type="application/x-ndjson"
+    )
+
 @router.post("/online_sale", response_model=ApiResponse)
 async def combined_online_sale_endpoint(
     description: str = Form(None),
     image: UploadFile = File(...),
     style: str = Form("normal"),  # 添加風格參數，默認為 normal
-    generate_image: bool = Form(False)  # 新增生成美化圖片選項
+    generate_image: bool = Form(False),  # 新增生成美化圖片選項
+    search_mode: Optional[str] = Form(None)  # 網路搜尋模式：agent 或 direct
 ):
     """
     拍賣網站文案服務：分析圖片、優化內容並計算碳足跡
@@ -129,6 +217,7 @@ async def combined_online_sale_endpoint(
     - **image**: 商品圖片檔案 (支持 PNG, JPEG, WEBP，最大 20MB)
     - **style**: 文案風格，可選值：normal(標準專業)、casual(輕鬆活潑)、formal(正式商務)、story(故事體驗)
     - **generate_image**: 是否同時生成AI美化圖片（預設為 false）
+    - **search_mode**: 網路搜尋模式，可選值：agent(AI 代理)、direct(直接搜尋，單次 LLM 呼叫)，預設依伺服器設定
     """
     desc_preview = description[:50] + "..." if description and len(description) > 50 else description
     logger.info(f"接收拍賣網站文案服務請求: 圖片={image.filename}, 描述預覽={desc_preview}, 風格={style}, 生成美化圖片={generate_image}")
@@ -178,7 +267,7 @@ async def combined_online_sale_endpoint(
         # 並行執行多個非同步操作
         logger.info(f"開始並行執行內容優化和碳足跡計算，使用風格: {style}")
         optimized_content, carbon_results = await asyncio.gather(
-            generate_product_content(combined_description, style=style),  # 傳遞風格參數
+            generate_product_content(combined_description, style=style, search_mode=search_mode),  # 傳遞風格參數
             calculate_carbon_footprint_async(combined_description)
         )
         logger.info(f"拍賣網站文案服務處理完成")
@@ -210,7 +299,8 @@ async def combined_online_sale_stream_endpoint(
     description: str = Form(None),
     image: UploadFile = File(...),
     style: str = Form("normal"),  # 添加風格參數，默認為 normal
-    generate_image: bool = Form(False)  # 新增生成美化圖片選項
+    generate_image: bool = Form(False),  # 新增生成美化圖片選項
+    search_mode: Optional[str] = Form(None)  # 網路搜尋模式：agent 或 direct
 ):
     """
     拍賣網站文案服務（串流版）：分析圖片、優化內容並計算碳足跡，以串流方式回應
@@ -219,6 +309,7 @@ async def combined_online_sale_stream_endpoint(
     - **image**: 商品圖片檔案 (支持 PNG, JPEG, WEBP，最大 20MB)
     - **style**: 文案風格，可選值：normal(標準專業)、casual(輕鬆活潑)、formal(正式商務)、story(故事體驗)
     - **generate_image**: 是否同時生成AI美化圖片（預設為 false）
+    - **search_mode**: 網路搜尋模式，可選值：agent(AI 代理)、direct(直接搜尋，單次 LLM 呼叫)，預設依伺服器設定
     """
     desc_preview = description[:50] + "..." if description and len(description) > 50 else description
     logger.info(f"接收拍賣網站文案串流服務請求: 圖片={image.filename}, 描述預覽={desc_preview}, 風格={style}, 生成美化圖片={generate_image}")
@@ -272,7 +363,7 @@ async def combined_online_sale_stream_endpoint(
         
         # 獲取串流內容生成器
         logger.info(f"開始生成串流式內容優化，使用風格: {style}")
-        streaming_result = await generate_streaming_product_content(combined_description, style=style)
+        streaming_result = await generate_streaming_product_content(combined_description, style=style, search_mode=search_mode)
         search_results = streaming_result["search_results"]
         content_generator = streaming_result["content_generator"]
         
@@ -356,7 +447,8 @@ async def combined_selling_post_endpoint(
     trade_method: str = Form("面交/郵寄皆可"),
     style: str = Form("normal"),
     stream: bool = Form(False),  # 新增串流選項
-    generate_image: bool = Form(False)  # 新增生成美化圖片選項
+    generate_image: bool = Form(False),  # 新增生成美化圖片選項
+    search_mode: Optional[str] = Form(None)  # 網路搜尋模式：agent 或 direct
 ):
     """
     社群銷售貼文服務：分析圖片、計算碳足跡並生成社群平台銷售文案
@@ -369,6 +461,7 @@ async def combined_selling_post_endpoint(
     - **style**: 文案風格，可選值:normal (標準實用)、storytelling (故事體驗)、minimalist (簡約精要)、bargain (超值優惠)
     - **stream**: 是否使用串流回應（預設為 false）
     - **generate_image**: 是否同時生成AI美化圖片（預設為 false）
+    - **search_mode**: 網路搜尋模式，可選值：agent(AI 代理)、direct(直接搜尋，單次 LLM 呼叫)，預設依伺服器設定
     """
     desc_preview = description[:50] + "..." if description and len(description) > 50 else description
     logger.info(f"接收社群銷售貼文服務請求: 圖片={image.filename}, 描述預覽={desc_preview}, 價格={price}, 串流={stream}, 生成美化圖片={generate_image}")
@@ -426,7 +519,7 @@ async def combined_selling_post_endpoint(
             
             # 獲取搜尋結果（與拍賣網站功能相同）
             logger.info(f"開始生成串流式內容優化以獲取搜尋結果")
-            streaming_result = await generate_streaming_product_content(combined_description, style=style)
+            streaming_result = await generate_streaming_product_content(combined_description, style=style, search_mode=search_mode)
             search_results = streaming_result["search_results"]
             
             # 獲取生成器函數
@@ -436,7 +529,8 @@ async def combined_selling_post_endpoint(
                 contact_info=contact_info,
                 trade_method=trade_method,
                 style=style,
-                stream=True
+                stream=True,
+                search_mode=search_mode
             )
             
             # 等待碳足跡計算完成
@@ -488,7 +582,8 @@ async def combined_selling_post_endpoint(
                 contact_info=contact_info,
                 trade_method=trade_method,
                 style=style,
-                stream=False
+                stream=False,
+                search_mode=search_mode
             ))
             # 等待兩個任務完成
             selling_post_result, carbon_results = await asyncio.gather(
@@ -10,13 +10,14 @@ from templates.content_styles import CONTENT_STYLES
 load_dotenv()
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-async def generate_product_content(product_description: str, style: str = "normal") -> dict:
+async def generate_product_content(product_description: str, style: str = "normal", search_mode: str = None) -> dict:
     """
     根據選擇的風格生成優化的商品內容
     
     Args:
         product_description (str): 原始商品描述
         style (str): 選擇的文案風格，默認為"normal"
+        search_mode (str): 網路搜尋模式，"agent" 或 "direct"，默認依環境變數 SEARCH_MODE
         
     Returns:
         dict: 優化後的商品內容
@@ -32,7 +33,7 @@ async def generate_product_content(product_description: str, style: str = "norma
     search_start = time.time()
 
     # 直接使用商品描述調用agent進行搜尋和分析
-    search_result = await search_product_info(product_description)
+    search_result = await search_product_info(product_description, mode=search_mode)
     
     # 獲取處理後的搜尋結果文本
     search_results = search_result["text"]
@@ -0,0 +1,57 @@
+"""
+將 Chroma 碳足跡資料庫匯出為記憶體映射的向量快照
+
+API 的每個 worker 會以 np.memmap 讀取此快照，共用同一份 page cache，
+不必各自從 Chroma 載入一份嵌入向量。資料庫內容更新後需要重新匯出。
+
+用法：
+    python data/cleansing/export_snapshot.py --chroma-path data/chroma --dtype float16
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import chromadb
+from dotenv import load_dotenv
+
+# 添加專案根目錄到路徑中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from embedding_snapshot import (
+    SNAPSHOT_DTYPES, VECTOR_SNAPSHOT_DTYPE, VECTOR_SNAPSHOT_PATH, collection_version, write_snapshot
+)
+
+# 載入環境變數
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯出向量快照")
+    parser.add_argument("--chroma-path", default=os.getenv("CHROMA_PATH"), help="Chroma 資料庫路徑")
+    parser.add_argument("--collection", default="carbon_catalogue")
+    parser.add_argument("--output", default=VECTOR_SNAPSHOT_PATH, help="快照檔路徑")
+    parser.add_argument("--dtype", default=VECTOR_SNAPSHOT_DTYPE, choices=SNAPSHOT_DTYPES)
+    args = parser.parse_args()
+
+    if not args.chroma_path:
+        print("請以 --chroma-path 或 CHROMA_PATH 指定 Chroma 資料庫路徑")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=args.chroma_path).get_collection(name=args.collection)
+    data = collection.get(include=["embeddings", "metadatas", "documents"])
+    header = write_snapshot(
+        args.output, data["ids"], data["embeddings"], data["metadatas"], data["documents"],
+        dtype=args.dtype,
+        source={"collection": collection.name, "collection_id": str(collection.id), "count": len(data["ids"]),
+                "version": collection_version(collection, data)},
+    )
+    size = os.path.getsize(args.output)
+    print(f"已匯出 {header['rows']} 筆、{header['dims']} 維 {header['dtype']} 向量到 {args.output}"
+          f"（{size / 1024:.0f} KiB，{len(header['partitions'])} 個分區，{time.perf_counter() - start:.1f} s）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+ReviveAI 查詢嵌入向量快取
+
+碳足跡搜尋的 function calling 步驟產生的查詢詞彙量很小（"laptop"、"smartphone"、
+"office chair" 等），但每次查詢都會呼叫一次 OpenAI 嵌入 API。此模組快取查詢的嵌入向量：
+
+- 兩層快取：行程內 LRU + 磁碟 SQLite（向量以 float32 BLOB 儲存，多個 worker 與重啟之間共用）
+- 以 (模型, 維度, 正規化後的文字) 為鍵
+- 記憶體與磁碟都有筆數上限，超過時淘汰最久未使用的項目
+- 提供命中率、API 呼叫與淘汰次數統計
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+# 快取設定
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "embedding_cache.sqlite3")
+)
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2048"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "100000"))  # 磁碟快取筆數上限
+
+
+def normalize_text(text: str) -> str:
+    """正規化嵌入文字：全形轉半形、轉小寫、合併空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    嵌入向量的兩層快取
+
+    get_many() 回傳與輸入順序相同的向量列表，未命中的位置為 None。
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE,
+                 max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._rows = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "api_calls": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def _connect(self):
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, dimensions INTEGER, text TEXT, "
+                "vector BLOB NOT NULL, last_used_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used_at)")
+            self._db.commit()
+            self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._db
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, text: str) -> str:
+        return hashlib.sha256(f"{model}\x1f{dimensions}\x1f{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def get_many(self, model: str, dimensions: int, texts: list) -> list:
+        """
+        查詢多筆文字的嵌入向量
+
+        Returns:
+            list: 與 texts 順序相同的 np.ndarray 或 None（未命中）
+        """
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        vectors = [None] * len(texts)
+        with self._lock:
+            disk_keys = []
+            for position, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[position] = vector
+                    self.stats["memory_hits"] += 1
+                else:
+                    disk_keys.append(key)
+
+            if disk_keys:
+                try:
+                    db = self._connect()
+                    placeholders = ",".join("?" * len(disk_keys))
+                    rows = dict(db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", disk_keys
+                    ).fetchall())
+                    if rows:
+                        db.executemany(
+                            "UPDATE embeddings SET last_used_at = ? WHERE key = ?",
+                            [(time.time(), key) for key in rows]
+                        )
+                        db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"讀取嵌入快取失敗: {str(e)}")
+                    rows = {}
+                for position, key in enumerate(keys):
+                    if vectors[position] is not None:
+                        continue
+                    blob = rows.get(key)
+                    if blob is None:
+                        self.stats["misses"] += 1
+                        continue
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vector)
+                    vectors[position] = vector
+                    self.stats["disk_hits"] += 1
+        return vectors
+
+    def put_many(self, model: str, dimensions: int, texts: list, vectors: list):
+        """寫入多筆嵌入向量到兩層快取，磁碟超過上限時淘汰最久未使用的項目"""
+        now = time.time()
+        entries = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model, dimensions, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                entries.append((key, model, dimensions, normalize_text(text)[:200], vector.tobytes(), now))
+            try:
+                db = self._connect()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, dimensions, text, vector, last_used_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    entries
+                )
+                self._rows = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._rows > self.max_rows:
+                    # 一次淘汰到上限的 90%，避免每次寫入都觸發淘汰
+                    evict = self._rows - int(self.max_rows * 0.9)
+                    db.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used_at LIMIT ?)", (evict,)
+                    )
+                    self._rows -= evict
+                    self.stats["disk_evictions"] += evict
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"寫入嵌入快取失敗: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """回傳命中統計與命中率"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._rows,
+        }
+
+
+class CachedEmbeddingFunction:
+    """
+    在嵌入函數前加上快取，呼叫介面與 Chroma 的 EmbeddingFunction 相同
+
+    Args:
+        embedding_function: 原始嵌入函數，輸入文字列表、回傳向量列表
+        model: 模型名稱（快取鍵的一部分）
+        dimensions: 向量維度（快取鍵的一部分）
+        cache: EmbeddingCache，預設使用行程內共用的快取
+    """
+
+    def __init__(self, embedding_function, model: str, dimensions: int, cache: EmbeddingCache = None):
+        self.embedding_function = embedding_function
+        self.model = model
+        self.dimensions = dimensions
+        self._cache = cache
+        # 正在嵌入中的文字：其他執行緒同時查詢相同文字時等待結果，不重複呼叫 API
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache or get_embedding_cache()
+
+    def _embed(self, cache: EmbeddingCache, texts: list) -> list:
+        cache.stats["api_calls"] += 1
+        embedded = [np.asarray(vector, dtype=np.float32) for vector in self.embedding_function(texts)]
+        cache.put_many(self.model, self.dimensions, texts, embedded)
+        return embedded
+
+    def __call__(self, input: list) -> list:
+        if not EMBEDDING_CACHE_ENABLED:
+            return [np.asarray(vector, dtype=np.float32) for vector in self.embedding_function(input)]
+
+        cache = self.cache
+        vectors = cache.get_many(self.model, self.dimensions, input)
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+
+        # 同一批中相同的文字只嵌入一次
+        unique = {}
+        for position in missing:
+            unique.setdefault(normalize_text(input[position]), input[position])
+        with self._inflight_lock:
+            owned = {key: text for key, text in unique.items() if key not in self._inflight}
+            waiting = {key: self._inflight[key] for key in unique if key not in owned}
+            for key in owned:
+                self._inflight[key] = threading.Event()
+
+        by_text = {}
+        try:
+            if owned:
+                by_text.update(zip(owned.keys(), self._embed(cache, list(owned.values()))))
+        finally:
+            with self._inflight_lock:
+                for key in owned:
+                    self._inflight.pop(key).set()
+
+        if waiting:
+            for event in waiting.values():
+                event.wait()
+            texts = [unique[key] for key in waiting]
+            shared = cache.get_many(self.model, self.dimensions, texts)
+            # 另一個執行緒嵌入失敗時自行重新嵌入
+            retry = [text for text, vector in zip(texts, shared) if vector is None]
+            by_text.update((normalize_text(text), vector) for text, vector in zip(texts, shared) if vector is not None)
+            if retry:
+                by_text.update(zip((normalize_text(text) for text in retry), self._embed(cache, retry)))
+
+        for position in missing:
+            vectors[position] = by_text[normalize_text(input[position])]
+        return vectors
+
+
+# 行程內共用的快取實例（fork 出的子行程不沿用父行程的 SQLite 連線，重新建立）
+_embedding_cache = None
+_embedding_cache_pid = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """取得行程內共用的嵌入向量快取"""
+    global _embedding_cache, _embedding_cache_pid
+    if _embedding_cache is None or _embedding_cache_pid != os.getpid():
+        _embedding_cache = EmbeddingCache()
+        _embedding_cache_pid = os.getpid()
+    return _embedding_cache
@@ -0,0 +1,207 @@
+"""
+ReviveAI 的嵌入向量快照（記憶體映射）
+
+每個 uvicorn worker 各自開啟 Chroma 並載入一份向量，記憶體用量隨 worker 數線性成長。
+此模組把資料庫的嵌入向量與 metadata 匯出成單一快照檔，查詢端以 np.memmap 零複製讀取：
+所有 worker 共用作業系統 page cache 中的同一份向量頁面。
+
+檔案格式（little-endian）：
+- 8 bytes 魔術字串 b"RVSNAP01"
+- 4 bytes 標頭長度（uint32）+ JSON 標頭：dtype、rows、dims、各區塊的位移與長度、分區範圍，
+  以及匯出時的資料庫版本（source.version，載入時用來判斷快照是否過期）等
+- 嵌入向量區塊：已正規化的 (rows, dims) float16/float32 矩陣，起點對齊 64 bytes；
+  資料列依 sector、carbon_footprint 排序，分區索引可直接使用連續切片
+- metadata 區塊：JSON（ids、metadatas、documents）
+
+匯出：python data/cleansing/export_snapshot.py
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import numpy as np
+from dotenv import load_dotenv
+from vector_index import NumpyVectorIndex, PartitionedVectorIndex
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+VECTOR_SNAPSHOT_PATH = os.getenv(
+    "VECTOR_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "vector_snapshot.bin")
+)
+VECTOR_SNAPSHOT_DTYPE = os.getenv("VECTOR_SNAPSHOT_DTYPE", "float16")
+
+SNAPSHOT_MAGIC = b"RVSNAP01"
+SNAPSHOT_DTYPES = ("float16", "float32")
+_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _sort_key(metadata: dict, partition_key: str, sort_key: str) -> tuple:
+    value = metadata.get(sort_key)
+    numeric = isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+    # 缺值排在分區最後，與 PartitionedVectorIndex 的排序相同
+    return (str(metadata.get(partition_key)), not numeric, value if numeric else 0.0)
+
+
+def write_snapshot(path: str, ids, embeddings, metadatas, documents, dtype: str = VECTOR_SNAPSHOT_DTYPE,
+                   source: dict = None, partition_key: str = "sector", sort_key: str = "carbon_footprint") -> dict:
+    """
+    將嵌入向量與 metadata 寫成快照檔（先寫暫存檔再取代，讀取中的 worker 不受影響）
+
+    Args:
+        path: 快照檔路徑
+        ids / embeddings / metadatas / documents: 與 Chroma collection.get 相同的資料
+        dtype: 向量的儲存型別（float16 或 float32）
+        source: 寫入標頭的來源資訊（例如 collection 名稱、ID 與筆數）
+
+    Returns:
+        dict: 寫入的標頭
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"不支援的快照型別: {dtype}")
+    metadatas = [metadata or {} for metadata in metadatas]
+    documents = list(documents) if documents is not None else [None] * len(ids)
+    order = sorted(range(len(ids)), key=lambda row: _sort_key(metadatas[row], partition_key, sort_key))
+
+    matrix = np.asarray(embeddings, dtype=np.float32)[order]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = np.ascontiguousarray(matrix / norms, dtype=dtype)
+
+    sorted_metadatas = [metadatas[row] for row in order]
+    partitions = []
+    for row, metadata in enumerate(sorted_metadatas):
+        key = metadata.get(partition_key)
+        if partitions and partitions[-1][0] == key:
+            partitions[-1][2] = row + 1
+        else:
+            partitions.append([key, row, row + 1])
+
+    payload = json.dumps({
+        "ids": [ids[row] for row in order],
+        "metadatas": sorted_metadatas,
+        "documents": [documents[row] for row in order],
+    }, ensure_ascii=False).encode("utf-8")
+
+    header = {
+        "dtype": dtype,
+        "rows": int(matrix.shape[0]),
+        "dims": int(matrix.shape[1]),
+        "partition_key": partition_key,
+        "sort_key": sort_key,
+        "partitions": partitions,
+        "source": source or {},
+        "created_at": time.time(),
+    }
+    # 位移取決於標頭長度，先以佔位值估算長度再填入（保留足夠的位數）
+    header.update({"embeddings_offset": 10 ** 12, "metadata_offset": 10 ** 12, "metadata_length": len(payload)})
+    header_length = len(json.dumps(header).encode("utf-8"))
+    embeddings_offset = _align(len(SNAPSHOT_MAGIC) + 4 + header_length)
+    header["embeddings_offset"] = embeddings_offset
+    header["metadata_offset"] = embeddings_offset + matrix.nbytes
+    header_bytes = json.dumps(header).encode("utf-8").ljust(header_length)
+
+    temporary_path = f"{path}.tmp{os.getpid()}"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(temporary_path, "wb") as output:
+        output.write(SNAPSHOT_MAGIC)
+        output.write(struct.pack("<I", header_length))
+        output.write(header_bytes)
+        output.write(b"\0" * (embeddings_offset - output.tell()))
+        output.write(matrix.tobytes())
+        output.write(payload)
+    os.replace(temporary_path, path)
+    return header
+
+
+def content_hash(ids, metadatas, documents) -> str:
+    """資料列內容（ID、metadata、文件）的雜湊，與資料列順序無關"""
+    digest = hashlib.sha256()
+    for row in sorted(range(len(ids)), key=lambda row: ids[row]):
+        digest.update(json.dumps(
+            [ids[row], metadatas[row], documents[row] if documents is not None else None],
+            sort_keys=True, ensure_ascii=False, default=str
+        ).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()[:16]
+
+
+def collection_version(collection, data: dict = None) -> str:
+    """
+    資料庫版本：collection ID、筆數與內容雜湊
+
+    重建資料庫會產生新的 collection ID；就地更新 metadata 或文件（例如修正碳足跡數值）時
+    ID 與筆數不變，但內容雜湊改變。嵌入向量不納入雜湊（就地更新向量時需重建 collection）。
+    匯出時寫入快照標頭的 source.version，載入時與目前資料庫比較判斷快照是否過期。
+
+    Args:
+        collection: Chroma collection
+        data: 已取得的 collection.get 結果（需含 metadatas 與 documents），未提供時讀取一次
+
+    Returns:
+        str: "<collection ID>:<筆數>:<內容雜湊>"
+    """
+    if data is None:
+        data = collection.get(include=["metadatas", "documents"])
+    return f"{collection.id}:{len(data['ids'])}:{content_hash(data['ids'], data['metadatas'], data['documents'])}"
+
+
+def snapshot_version(header: dict) -> str:
+    """快照標頭記錄的資料庫版本（沒有 version 欄位的舊快照以 collection_id 與筆數組成，不會與目前版本相符）"""
+    source = header.get("source") or {}
+    return source.get("version") or f"{source.get('collection_id')}:{header['rows']}"
+
+
+def read_snapshot_header(path: str) -> dict:
+    """讀取快照檔的標頭"""
+    with open(path, "rb") as snapshot:
+        if snapshot.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是向量快照檔: {path}")
+        header_length, = struct.unpack("<I", snapshot.read(4))
+        return json.loads(snapshot.read(header_length).decode("utf-8"))
+
+
+def load_snapshot(path: str = VECTOR_SNAPSHOT_PATH, partitioned: bool = False):
+    """
+    以 np.memmap 零複製載入快照
+
+    Args:
+        path: 快照檔路徑
+        partitioned: 是否建立 PartitionedVectorIndex（否則為 NumpyVectorIndex）
+
+    Returns:
+        NumpyVectorIndex 或 PartitionedVectorIndex：嵌入矩陣為唯讀的 np.memmap
+    """
+    header = read_snapshot_header(path)
+    embeddings = np.memmap(
+        path, dtype=header["dtype"], mode="r",
+        offset=header["embeddings_offset"], shape=(header["rows"], header["dims"])
+    )
+    with open(path, "rb") as snapshot:
+        snapshot.seek(header["metadata_offset"])
+        payload = json.loads(snapshot.read(header["metadata_length"]).decode("utf-8"))
+
+    if partitioned:
+        index = PartitionedVectorIndex.from_sorted(
+            payload["ids"], embeddings, payload["metadatas"], payload["documents"],
+            {key: (start, end) for key, start, end in header["partitions"]},
+            partition_key=header["partition_key"], sort_key=header["sort_key"],
+        )
+    else:
+        index = NumpyVectorIndex.from_normalized(payload["ids"], embeddings, payload["metadatas"], payload["documents"])
+    index.snapshot_header = header
+    logger.info(
+        f"已載入向量快照 {path}：{header['rows']} 筆、{header['dims']} 維 {header['dtype']}，"
+        f"來源 {header['source']}"
+    )
+    return index
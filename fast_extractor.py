@@ -0,0 +1,225 @@
+"""
+ReviveAI 的輕量網頁正文擷取器
+
+以 lxml 解析 HTML，用簡單的啟發式規則找出主要內容區塊，並直接輸出 Markdown，
+不經過 readabilipy（Readability.js / BeautifulSoup）與 markdownify 的多次解析與序列化。
+
+主要內容的選擇方式：
+1. 先移除 script/style/nav/footer 等元素，以及 class/id 看起來像側欄、廣告、留言的區塊
+2. 若有 <article>、<main> 或 role="main"，取文字最多的那一個
+3. 否則依段落文字量（長度、逗號數）為父層與祖父層區塊計分，並以連結密度扣分，取最高分者
+
+輸出格式與 fetch_webpage 原本的 Markdown 相近（ATX 標題、清單、表格、連結），
+但會略過圖片與行內樣式，輸出通常比 readabilipy + markdownify 精簡。
+"""
+
+import re
+import lxml.html
+from lxml import etree
+
+# 直接移除的元素
+REMOVE_TAGS = [
+    "script", "style", "noscript", "template", "iframe", "svg", "canvas", "form",
+    "button", "select", "input", "textarea", "nav", "header", "footer", "aside",
+]
+
+# class/id 符合此規則的區塊視為雜訊（但 article/main/body 不移除）
+_NOISE_PATTERN = re.compile(
+    r"(?<![a-z])(comment|sidebar|footer|header|menu|nav|breadcrumb|share|social|related|recommend|"
+    r"advert|ads?(?![a-z])|banner|cookie|popup|modal|subscribe|newsletter|login|signup)",
+    re.IGNORECASE,
+)
+_KEEP_TAGS = {"article", "main", "body", "html"}
+
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "ul", "ol", "li", "table", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "dl", "dt", "dd", "figure",
+    "figcaption", "hr", "br", "tbody", "thead",
+}
+_CANDIDATE_TAGS = {"div", "section", "article", "main", "td", "body"}
+_SCORED_TAGS = {"p", "pre", "li", "td", "dd", "blockquote"}
+_COMMA_PATTERN = re.compile(r"[,，、;；]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _parse(html: str):
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # 含 XML 編碼宣告的字串無法直接解析，改以 UTF-8 位元組傳入
+        return lxml.html.document_fromstring(html.encode("utf-8"))
+
+
+def _text(element) -> str:
+    return _WHITESPACE_PATTERN.sub(" ", element.text_content()).strip()
+
+
+def _remove_noise(root):
+    etree.strip_elements(root, etree.Comment, *REMOVE_TAGS, with_tail=False)
+    for element in list(root.iter("div", "section", "ul", "table", "span", "p")):
+        if element.getparent() is None or element.tag in _KEEP_TAGS:
+            continue
+        attributes = f"{element.get('class', '')} {element.get('id', '')}"
+        if attributes.strip() and _NOISE_PATTERN.search(attributes):
+            element.drop_tree()
+
+
+def _link_density(element, text_length: int) -> float:
+    if not text_length:
+        return 1.0
+    link_length = sum(len(_text(link)) for link in element.iter("a"))
+    return min(1.0, link_length / text_length)
+
+
+def _select_main(root):
+    """挑選主要內容區塊"""
+    semantic = root.xpath("//article | //main | //*[@role='main']")
+    semantic = [element for element in semantic if len(_text(element)) >= 200]
+    if semantic:
+        return max(semantic, key=lambda element: len(_text(element)))
+
+    scores = {}
+    for element in root.iter(*_SCORED_TAGS):
+        text = _text(element)
+        if len(text) < 25:
+            continue
+        score = 1 + len(_COMMA_PATTERN.findall(text)) + min(len(text) / 100, 3)
+        parent = element.getparent()
+        for ancestor, weight in ((parent, 1.0), (parent.getparent() if parent is not None else None, 0.5)):
+            if ancestor is not None and ancestor.tag in _CANDIDATE_TAGS:
+                scores[ancestor] = scores.get(ancestor, 0) + score * weight
+
+    best, best_score = None, 0
+    for element, score in scores.items():
+        text_length = len(_text(element))
+        score *= 1 - _link_density(element, text_length)
+        if score > best_score:
+            best, best_score = element, score
+    if best is None:
+        body = root.find("body")
+        return body if body is not None else root
+    return best
+
+
+class _MarkdownWriter:
+    """把 lxml 元素樹轉成 Markdown"""
+
+    def __init__(self):
+        self.blocks = []
+        self._inline = []
+
+    def flush(self, prefix: str = ""):
+        text = _WHITESPACE_PATTERN.sub(" ", "".join(self._inline)).strip()
+        self._inline = []
+        if text:
+            self.blocks.append(prefix + text)
+
+    def render(self, element) -> str:
+        self.walk(element)
+        self.flush()
+        return "\n\n".join(self.blocks)
+
+    def walk(self, element, list_depth: int = 0):
+        tag = element.tag if isinstance(element.tag, str) else ""
+
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.flush()
+            self._inline.append(_text(element))
+            self.flush("#" * int(tag[1]) + " ")
+        elif tag in ("ul", "ol"):
+            self.flush()
+            for index, item in enumerate(element.iterchildren("li"), 1):
+                marker = f"{index}." if tag == "ol" else "-"
+                nested = []
+                if item.text:
+                    self._inline.append(item.text)
+                for child in item:
+                    if child.tag in ("ul", "ol"):
+                        nested.append(child)
+                    else:
+                        self.walk(child, list_depth)
+                self.flush("  " * list_depth + marker + " ")
+                for child in nested:
+                    self.walk(child, list_depth + 1)
+        elif tag == "table":
+            self.flush()
+            self._write_table(element)
+        elif tag == "pre":
+            self.flush()
+            self.blocks.append(f"```\n{element.text_content().strip()}\n```")
+        elif tag == "br":
+            self.flush()
+        elif tag == "a":
+            text = _text(element)
+            href = element.get("href", "")
+            if text and href.startswith(("http://", "https://")):
+                self._inline.append(f"[{text}]({href})")
+            elif text:
+                self._inline.append(text)
+        elif tag == "img":
+            pass
+        else:
+            block = tag in _BLOCK_TAGS
+            if block:
+                self.flush()
+            self._walk_children(element, list_depth)
+            if block:
+                self.flush("> " if tag == "blockquote" else "")
+
+        if element.tail:
+            self._inline.append(element.tail)
+
+    def _walk_children(self, element, list_depth: int):
+        if element.text:
+            self._inline.append(element.text)
+        for child in element:
+            self.walk(child, list_depth)
+
+    def _write_table(self, table):
+        rows = []
+        for row in table.iter("tr"):
+            cells = [_text(cell).replace("|", "\\|") for cell in row.iterchildren("td", "th")]
+            if any(cells):
+                rows.append(cells)
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        lines = []
+        for index, row in enumerate(rows):
+            lines.append("| " + " | ".join(row + [""] * (width - len(row))) + " |")
+            if index == 0:
+                lines.append("|" + " --- |" * width)
+        self.blocks.append("\n".join(lines))
+
+
+def extract_main_content(html: str) -> dict:
+    """
+    擷取網頁主要內容並轉換為 Markdown
+
+    Args:
+        html: 網頁 HTML
+
+    Returns:
+        dict: {"title": 標題, "markdown": Markdown 內容}；擷取不到內容時 markdown 為 None
+    """
+    if not html or not html.strip():
+        return {"title": None, "markdown": None}
+    root = _parse(html)
+
+    title_element = root.find(".//title")
+    title = _text(title_element) if title_element is not None else None
+    if not title:
+        heading = root.find(".//h1")
+        title = _text(heading) if heading is not None else None
+
+    _remove_noise(root)
+    markdown = _MarkdownWriter().render(_select_main(root))
+    return {"title": title or None, "markdown": markdown or None}
+
+
+if __name__ == "__main__":
+    import sys
+
+    with open(sys.argv[1], encoding="utf-8", errors="replace") as f:
+        result = extract_main_content(f.read())
+    print(f"# {result['title']}\n\n{result['markdown']}")
@@ -7,7 +7,9 @@ import asyncio
 import mimetypes
 from pathlib import Path
 import filetype  # 使用 filetype 代替 imghdr
+import hashlib
 from dotenv import load_dotenv
+from singleflight import get_singleflight
 
 load_dotenv()
 
@@ -72,7 +74,29 @@ def validate_image(image_path):
     
     return kind.mime
 
+# 計算圖片內容的 SHA-256（分段讀取）
+def _file_digest(image_path):
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 async def analyze_image(image_path):
+    """
+    分析商品圖片；同時進行中、內容相同的圖片只會送出一次分析請求
+
+    Args:
+        image_path: 圖片路徑
+
+    Returns:
+        Gemini 的回應物件
+    """
+    # 讀檔計算雜湊在執行緒中進行，不阻塞事件迴圈
+    key = await asyncio.to_thread(_file_digest, image_path)
+    return await get_singleflight("image_analysis").do(key, _analyze_image, image_path)
+
+async def _analyze_image(image_path):
     # 簡化的商品分析提示 - 專注於關鍵資訊
     prompt = """
     #zh-tw
@@ -2,7 +2,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import logging
+from contextlib import asynccontextmanager
 import combined_service_api
+from mcp_session_pool import close_mcp_pool
+from agent_client import warmup_search_agent
+from query_chroma import warmup_query_chroma, shutdown_vector_search_pool
+from rerank_model import shutdown_rerank_log
+from web_tools_server import close_http_session, shutdown_extract_pool
 # import archive.single_service_api  # 已封存，暫不使用
 
 # 設定日誌
@@ -17,10 +23,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger("reviveai_api")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 預先啟動 MCP 會話池並編譯搜尋代理，避免第一個請求承擔初始化成本
+    try:
+        await warmup_search_agent()
+    except Exception as e:
+        logger.warning(f"搜尋代理預熱失敗，將於第一次搜尋時重試: {str(e)}")
+    # 匯入時不開啟 Chroma 與 OpenAI 客戶端，在每個 worker 啟動後才建立
+    try:
+        await warmup_query_chroma()
+    except Exception as e:
+        logger.warning(f"碳足跡搜尋預熱失敗，將於第一次查詢時重試: {str(e)}")
+    yield
+    await close_mcp_pool()
+    # direct 搜尋模式在本行程內使用的共用 HTTP 連線池與正文擷取行程池
+    await close_http_session()
+    shutdown_extract_pool()
+    shutdown_vector_search_pool()
+    # 寫完尚未寫入的重新排序決策
+    shutdown_rerank_log()
+
 # 建立 FastAPI 應用程序
 app = FastAPI(
     title="ReviveAI API",
     description="二手商品優化 API 服務",
+    lifespan=lifespan,
 )
 
 # 添加 CORS 中間件
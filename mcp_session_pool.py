@@ -0,0 +1,410 @@
+"""
+ReviveAI 的 MCP 會話池
+
+維護一組長期存活的 web_tools_server.py MCP 會話，讓所有產品搜尋請求共用，
+避免每次搜尋都重新啟動 Python 子程序、重新匯入 aiohttp/readabilipy/markdownify
+並重新進行 MCP 握手。
+
+- 會話數量可透過環境變數 MCP_POOL_SIZE 設定
+- 背景定期以 ping 進行健康檢查
+- 子程序崩潰或健康檢查失敗時自動重新啟動
+- 呼叫時遇到傳輸中斷（子程序已結束）會立即標記該會話失效，並在其他或重啟後的會話重試一次
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+import anyio
+from dotenv import load_dotenv
+from langchain_core.tools import StructuredTool, ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, TextContent
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+# 會話池設定
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+MCP_HEALTH_CHECK_TIMEOUT = float(os.getenv("MCP_HEALTH_CHECK_TIMEOUT", "5"))
+
+WEB_TOOLS_SERVER_NAME = "web_tools"
+
+# WebTools 服務器的連線設定（與原本每次建立的 MultiServerMCPClient 相同）
+WEB_TOOLS_CONNECTION = {
+    "command": "python",
+    "args": [os.path.join(os.path.dirname(os.path.abspath(__file__)), "web_tools_server.py")],
+    "transport": "stdio",
+}
+
+
+def _is_transport_error(error: Exception) -> bool:
+    """是否為會話傳輸中斷（子程序結束、stdio 串流關閉），而非工具本身的錯誤"""
+    if isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError)):
+        return True
+    return isinstance(error, McpError) and error.error.code == CONNECTION_CLOSED
+
+
+class _PooledSession:
+    """
+    單一長期存活的 MCP 會話
+
+    會話的開啟與關閉都在同一個背景任務中完成，
+    以符合 anyio cancel scope 必須在同一任務進出的要求。
+    """
+
+    def __init__(self, slot_id: int, client: MultiServerMCPClient, server_name: str):
+        self.slot_id = slot_id
+        self.session = None
+        self.in_flight = 0
+        self.started_at = None
+        self.error = None
+        self.broken = False
+        self._client = client
+        self._server_name = server_name
+        self._task = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+
+    @property
+    def alive(self) -> bool:
+        return (self.session is not None and not self.broken
+                and self._task is not None and not self._task.done())
+
+    async def start(self):
+        """啟動子程序並完成 MCP 初始化，失敗時拋出原始錯誤"""
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if not self.alive:
+            raise self.error or RuntimeError("MCP 會話啟動失敗")
+
+    async def _run(self):
+        try:
+            async with self._client.session(self._server_name) as session:
+                self.session = session
+                self.started_at = time.time()
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self.error = e
+            logger.warning(f"MCP 會話 #{self.slot_id} 已結束: {str(e)}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def ping(self, timeout: float) -> bool:
+        """健康檢查，回傳會話是否仍可正常回應"""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"MCP 會話 #{self.slot_id} 健康檢查失敗: {str(e)}")
+            return False
+
+    def discard(self):
+        """標記為失效（傳輸已中斷），並讓背景任務結束會話"""
+        self.broken = True
+        self._stop.set()
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except Exception:
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """
+    MCP 會話池
+
+    acquire() 會挑選目前使用中請求最少的存活會話；MCP 會話本身支援多個請求並行，
+    因此不會因為池子大小而讓請求排隊等待，只是把負載分散到多個子程序上。
+    """
+
+    def __init__(self, connection: dict = None, size: int = MCP_POOL_SIZE,
+                 server_name: str = WEB_TOOLS_SERVER_NAME):
+        self.size = max(1, size)
+        self.server_name = server_name
+        self._client = MultiServerMCPClient({server_name: connection or WEB_TOOLS_CONNECTION})
+        self._slots = []
+        self._slot_locks = []
+        self._start_lock = asyncio.Lock()
+        self._health_task = None
+        self._respawn_tasks = set()
+        self._closed = False
+        self.stats = {
+            "acquired": 0,
+            "spawned": 0,
+            "respawned": 0,
+            "health_check_failures": 0,
+            "transport_errors": 0,
+            "retried": 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return bool(self._slots)
+
+    async def start(self):
+        """啟動所有會話與健康檢查任務（重複呼叫不會重複啟動）"""
+        async with self._start_lock:
+            if self._slots:
+                return
+            self._closed = False
+            self._slots = [self._new_slot(i) for i in range(self.size)]
+            self._slot_locks = [asyncio.Lock() for _ in range(self.size)]
+            results = await asyncio.gather(
+                *(slot.start() for slot in self._slots), return_exceptions=True
+            )
+            failures = [r for r in results if isinstance(r, Exception)]
+            if len(failures) == len(results):
+                self._slots = []
+                raise failures[0]
+            for failure in failures:
+                logger.warning(f"部分 MCP 會話啟動失敗，將於使用時重試: {str(failure)}")
+            self._health_task = asyncio.create_task(self._health_loop())
+            logger.info(f"MCP 會話池已啟動，共 {self.size - len(failures)}/{self.size} 個會話")
+
+    def _new_slot(self, slot_id: int) -> _PooledSession:
+        self.stats["spawned"] += 1
+        return _PooledSession(slot_id, self._client, self.server_name)
+
+    async def _respawn(self, slot_id: int, force: bool = False) -> _PooledSession:
+        """重新啟動指定位置的會話；若同時有其他請求在重啟，則等待其完成"""
+        async with self._slot_locks[slot_id]:
+            slot = self._slots[slot_id]
+            if slot.alive and not force:
+                return slot
+            await slot.close()
+            new_slot = self._new_slot(slot_id)
+            await new_slot.start()
+            self._slots[slot_id] = new_slot
+            self.stats["respawned"] += 1
+            logger.info(f"MCP 會話 #{slot_id} 已重新啟動")
+            return new_slot
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        取得一個可用的 MCP 會話
+
+        使用期間發生傳輸中斷時，該會話會被標記為失效，後續請求不會再分配到它。
+
+        Yields:
+            ClientSession: 已初始化的 MCP 客戶端會話
+        """
+        async with self._checkout() as slot:
+            yield slot.session
+
+    @asynccontextmanager
+    async def _checkout(self, respawn_slot: int = None):
+        """借出一個會話；指定 respawn_slot 時改用該位置重新啟動後的會話"""
+        if not self._slots:
+            await self.start()
+
+        if respawn_slot is not None:
+            slot = await self._respawn(respawn_slot)
+        else:
+            alive = [slot for slot in self._slots if slot.alive]
+            for slot_id, slot in enumerate(self._slots):
+                # 背景重啟已崩潰的會話，不阻塞目前請求
+                if not slot.alive and alive and not self._slot_locks[slot_id].locked():
+                    task = asyncio.create_task(self._respawn_quietly(slot_id))
+                    self._respawn_tasks.add(task)
+                    task.add_done_callback(self._respawn_tasks.discard)
+            if alive:
+                slot = min(alive, key=lambda s: s.in_flight)
+            else:
+                # 所有會話都已失效，重啟第一個
+                slot = await self._respawn(0)
+
+        self.stats["acquired"] += 1
+        slot.in_flight += 1
+        try:
+            yield slot
+        except Exception as e:
+            if _is_transport_error(e) and not slot.broken:
+                self.stats["transport_errors"] += 1
+                logger.warning(f"MCP 會話 #{slot.slot_id} 傳輸中斷，標記為失效: {type(e).__name__} {str(e)}")
+                slot.discard()
+            raise
+        finally:
+            slot.in_flight -= 1
+
+    async def run(self, operation):
+        """
+        以會話池中的會話執行操作；遇到傳輸中斷時在該位置重新啟動的會話上重試一次
+
+        其他會話的子程序可能也已結束（健康檢查尚未發現），因此重試不挑選其他存活會話，
+        而是使用確定剛啟動的會話。
+
+        Args:
+            operation: 接收 ClientSession 並回傳 awaitable 的函式
+
+        Returns:
+            操作的結果
+        """
+        slot = None
+        try:
+            async with self._checkout() as slot:
+                return await operation(slot.session)
+        except Exception as e:
+            # 借出前的錯誤（例如啟動失敗）不重試
+            if slot is None or not _is_transport_error(e):
+                raise
+            error = e
+        self.stats["retried"] += 1
+        logger.info(f"MCP 會話 #{slot.slot_id} 傳輸中斷（{type(error).__name__}），以重新啟動的會話重試")
+        async with self._checkout(respawn_slot=slot.slot_id) as slot:
+            return await operation(slot.session)
+
+    async def _respawn_quietly(self, slot_id: int, force: bool = False):
+        try:
+            await self._respawn(slot_id, force=force)
+        except Exception as e:
+            logger.error(f"MCP 會話 #{slot_id} 重新啟動失敗: {str(e)}")
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(MCP_HEALTH_CHECK_INTERVAL)
+            for slot_id, slot in enumerate(list(self._slots)):
+                if await slot.ping(MCP_HEALTH_CHECK_TIMEOUT):
+                    continue
+                self.stats["health_check_failures"] += 1
+                # 無回應但仍有請求在使用的會話，留待下一輪再處理
+                if slot.in_flight == 0:
+                    await self._respawn_quietly(slot_id, force=True)
+
+    def get_stats(self) -> dict:
+        """回傳會話池狀態與計數"""
+        return {
+            **self.stats,
+            "size": self.size,
+            "alive": sum(1 for slot in self._slots if slot.alive),
+            "in_flight": sum(slot.in_flight for slot in self._slots),
+        }
+
+    async def close(self):
+        """關閉健康檢查與所有子程序"""
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for task in list(self._respawn_tasks):
+            task.cancel()
+        await asyncio.gather(*(slot.close() for slot in self._slots), return_exceptions=True)
+        self._slots = []
+
+    def abandon(self):
+        """
+        放棄會話池（其 event loop 已停止或關閉，無法再 await 關閉）
+
+        停止健康檢查並通知所有會話結束；若該 event loop 之後再執行，會話任務會關閉子程序。
+        """
+        self._closed = True
+        for task in [self._health_task, *self._respawn_tasks]:
+            if task is not None:
+                task.cancel()
+        self._health_task = None
+        for slot in self._slots:
+            slot.discard()
+        self._slots = []
+
+
+# 行程內共用的會話池（綁定建立時的 event loop）
+_pool = None
+_pool_loop = None
+
+
+def get_mcp_pool() -> MCPSessionPool:
+    """取得行程內共用的 WebTools MCP 會話池"""
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
+        if _pool is not None:
+            _retire_pool(_pool, _pool_loop)
+        _pool = MCPSessionPool()
+        _pool_loop = loop
+    return _pool
+
+
+def _retire_pool(pool: MCPSessionPool, loop: asyncio.AbstractEventLoop):
+    """換到新的 event loop 時處理舊的會話池，避免遺留 stdio 子程序"""
+    if pool.started and loop.is_running() and not loop.is_closed():
+        # 舊 loop 仍在其他執行緒執行，交由它自行關閉會話
+        asyncio.run_coroutine_threadsafe(pool.close(), loop)
+        logger.info("Event loop 已更換，已排程關閉舊的 MCP 會話池")
+    elif pool.started:
+        pool.abandon()
+        logger.warning("Event loop 已更換，舊的 MCP 會話池已放棄（其 event loop 已停止）")
+
+
+async def close_mcp_pool():
+    """關閉共用的會話池（供服務關閉時呼叫）"""
+    global _pool, _pool_loop
+    if _pool is not None:
+        await _pool.close()
+    _pool = None
+    _pool_loop = None
+
+
+def _make_pooled_tool(mcp_tool) -> StructuredTool:
+    """將 MCP 工具定義包裝成每次呼叫都向會話池借用會話的 LangChain 工具"""
+
+    async def call_tool(**arguments):
+        result = await get_mcp_pool().run(lambda session: session.call_tool(mcp_tool.name, arguments))
+
+        text_contents = [content.text for content in result.content if isinstance(content, TextContent)]
+        non_text_contents = [content for content in result.content if not isinstance(content, TextContent)]
+        tool_content = text_contents[0] if len(text_contents) == 1 else text_contents or ""
+        if result.isError:
+            raise ToolException(tool_content)
+        return tool_content, non_text_contents or None
+
+    return StructuredTool(
+        name=mcp_tool.name,
+        description=mcp_tool.description or "",
+        args_schema=mcp_tool.inputSchema,
+        coroutine=call_tool,
+        response_format="content_and_artifact",
+    )
+
+
+async def load_pooled_tools() -> list:
+    """
+    載入 WebTools 工具並轉換為 LangChain 工具
+
+    與 load_mcp_tools(session) 綁定單一會話不同，這些工具在每次呼叫時才從會話池取得會話，
+    因此工具以及使用它們的代理可以跨請求重複使用。
+
+    Returns:
+        list: LangChain StructuredTool 列表
+    """
+    listed = await get_mcp_pool().run(lambda session: session.list_tools())
+    return [_make_pooled_tool(tool) for tool in listed.tools]
+
+
+if __name__ == "__main__":
+    async def _demo():
+        pool = get_mcp_pool()
+        start = time.time()
+        await pool.start()
+        print(f"會話池啟動時間: {time.time() - start:.2f} 秒", file=sys.stderr)
+        async with pool.acquire() as session:
+            start = time.time()
+            tools = await session.list_tools()
+            print(f"可用工具: {[tool.name for tool in tools.tools]}（{time.time() - start:.3f} 秒）")
+        print(pool.get_stats())
+        await close_mcp_pool()
+
+    asyncio.run(_demo())
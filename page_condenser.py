@@ -0,0 +1,142 @@
+"""
+ReviveAI 的網頁內容精簡器
+
+fetch_webpage 擷取出的整頁 Markdown 會直接放進搜尋代理的上下文，但最終報告只有 200 字。
+此模組在本機先把網頁精簡到 token 上限內，再交給 LLM：
+
+- 移除導覽、頁尾、社群分享、登入等樣板文字、純連結行、圖片行與重複行
+- 保留標題、規格表格，以及包含查詢關鍵字的段落
+- 超過上限時依優先順序（表格 → 標題 → 相關段落 → 其他段落）挑選，輸出維持原本順序
+"""
+
+import re
+import unicodedata
+from text_tokens import count_tokens, truncate_to_tokens
+
+# 樣板文字關鍵字（只用於判斷較短的行）
+_BOILERPLATE_PATTERN = re.compile(
+    r"登入|登出|註冊|會員中心|購物車|結帳|隱私權|隱私政策|服務條款|使用條款|版權所有|©|copyright|"
+    r"cookie|追蹤我們|分享到|分享至|加入好友|訂閱|電子報|客服中心|回到頂端|上一頁|下一頁|"
+    r"sign in|log in|sign up|privacy|terms of (use|service)|all rights reserved|subscribe|newsletter|"
+    r"share on|follow us|back to top|skip to",
+    re.IGNORECASE,
+)
+_BOILERPLATE_MAX_CHARS = 80
+
+_LINK_PATTERN = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_IMAGE_LINE_PATTERN = re.compile(r"^!\[[^\]]*\]\([^)]*\)$")
+_QUERY_SPLIT_PATTERN = re.compile(r"[\s,，、/|()（）\[\]\"'「」:：;；.!?！？+]+")
+_CJK_RUN_PATTERN = re.compile(r"^[㐀-䶿一-鿿]+$")
+_TABLE_SEPARATOR_PATTERN = re.compile(r"^\|[\s\-:|]+$")
+
+# 各類行的保留優先順序
+PRIORITY_TABLE = 4  # 規格表格列
+PRIORITY_HEADING = 3
+PRIORITY_RELEVANT = 2  # 包含查詢關鍵字的段落
+PRIORITY_OTHER = 1  # 沒有任何段落符合查詢時才保留的一般段落
+
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", line)).strip().lower()
+
+
+def query_terms(query: str) -> list:
+    """
+    將查詢拆成比對用的關鍵字；中文詞組另外拆成雙字詞，以便比對不同寫法的段落
+
+    Args:
+        query: 查詢字串，例如 "MacBook Air M1 2020" 或 "二手 iPhone 13 藍色"
+
+    Returns:
+        list: 小寫關鍵字列表
+    """
+    terms = []
+    for term in _QUERY_SPLIT_PATTERN.split(_normalize_line(query or "")):
+        if len(term) < 2 and not term.isdigit():
+            continue
+        terms.append(term)
+        if _CJK_RUN_PATTERN.match(term) and len(term) > 2:
+            terms.extend(term[i:i + 2] for i in range(len(term) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def _is_boilerplate(line: str) -> bool:
+    """樣板行：圖片、純連結、或含樣板關鍵字的短行"""
+    if _IMAGE_LINE_PATTERN.match(line):
+        return True
+    text_without_links = _LINK_PATTERN.sub("", line).strip(" -*|>#")
+    if not text_without_links and _LINK_PATTERN.search(line):
+        return True
+    return len(line) <= _BOILERPLATE_MAX_CHARS and bool(_BOILERPLATE_PATTERN.search(line))
+
+
+def condense_page(markdown: str, query: str = None, max_tokens: int = 1500) -> tuple:
+    """
+    將網頁 Markdown 精簡到 token 上限內
+
+    Args:
+        markdown: 擷取出的網頁 Markdown
+        query: 查詢字串（產品名稱）；未提供時保留所有非樣板段落
+        max_tokens: 精簡後的 token 上限
+
+    Returns:
+        tuple: (精簡後的 Markdown, {"tokens_before", "tokens_after", "tokens_saved"})
+    """
+    tokens_before = count_tokens(markdown)
+    terms = query_terms(query)
+
+    seen = set()
+    lines = []  # (優先順序, 行文字)
+    has_relevant_paragraph = False
+    for raw_line in (markdown or "").splitlines():
+        line = raw_line.rstrip()
+        key = _normalize_line(line)
+        if not key or _is_boilerplate(line.strip()):
+            continue
+        # 表格分隔列在每個表格都要保留，不視為重複行
+        if not _TABLE_SEPARATOR_PATTERN.match(key):
+            if key in seen:
+                continue
+            seen.add(key)
+
+        stripped = line.lstrip()
+        if stripped.startswith("#"):
+            priority = PRIORITY_HEADING
+        elif stripped.startswith("|"):
+            priority = PRIORITY_TABLE
+        elif terms and any(term in key for term in terms):
+            priority = PRIORITY_RELEVANT
+            has_relevant_paragraph = True
+        else:
+            priority = PRIORITY_OTHER
+        lines.append((priority, line))
+
+    # 有符合查詢的段落時，其餘一般段落全部捨棄
+    if has_relevant_paragraph:
+        lines = [(priority, line) for priority, line in lines if priority != PRIORITY_OTHER]
+
+    # 依優先順序挑選，直到用完 token 上限；最後依原本順序輸出
+    order = sorted(range(len(lines)), key=lambda index: (-lines[index][0], index))
+    selected = {}
+    remaining = max_tokens
+    for index in order:
+        if remaining <= 0:
+            break
+        line = lines[index][1]
+        cost = count_tokens(line) + 1  # 換行
+        if cost > remaining:
+            # 過長的表格列或段落只保留前段
+            line = truncate_to_tokens(line, remaining - 1)
+            if not line:
+                continue
+            cost = count_tokens(line) + 1
+        selected[index] = line
+        remaining -= cost
+
+    condensed = "\n".join(selected[index] for index in sorted(selected))
+    tokens_after = count_tokens(condensed)
+    return condensed, {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(0, tokens_before - tokens_after),
+    }
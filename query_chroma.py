@@ -1,11 +1,37 @@
-import chromadb
-from chromadb.utils import embedding_functions
 from openai import AsyncOpenAI
 import json
 import os
+import sys
 from dotenv import load_dotenv
 import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any
+from vector_index import NumpyVectorIndex, PartitionedVectorIndex, metadata_matches
+from embedding_cache import CachedEmbeddingFunction
+from embedding_snapshot import VECTOR_SNAPSHOT_PATH, collection_version, load_snapshot, snapshot_version
+from sector_classifier import (
+    SECTOR_CLASSIFIER_ENABLED,
+    SECTOR_CLASSIFIER_MIN_CONFIDENCE,
+    SectorCentroids,
+    canonical_product_key,
+    classify_by_keywords,
+    combine_with_centroid,
+    record_decision,
+)
+from rerank_gate import should_skip_rerank
+from rerank_model import RERANK_LOG_ENABLED, predict_rerank, submit_rerank_decision
+from search_params_cache import SEARCH_PARAMS_CACHE_ENABLED, get_search_params_cache
+from rerank_candidates import (
+    COMPACT_SCHEMA_LEGEND,
+    RERANK_COMPACT_CANDIDATES,
+    expand_index,
+    format_compact_candidates,
+    format_verbose_candidates,
+    group_candidates,
+)
 
 # 設置 tokenizers 並行處理環境變數
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -13,24 +39,232 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # 載入環境變數
 load_dotenv()
 
-# 連接到現有的 Chroma 資料庫
-chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_PATH"))
+logger = logging.getLogger("reviveai_api")
 
 # 使用 OpenAI 的嵌入模型
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model_name="text-embedding-3-small",
-    dimensions=1024
-)
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1024
 
-# 獲取現有的 collection
-collection = chroma_client.get_collection(
-    name="carbon_catalogue",
-    embedding_function=openai_ef
-)
+# 啟動時（main.py 的 lifespan）預先建立 Chroma 連線、OpenAI 客戶端與向量索引
+CARBON_WARMUP_ENABLED = os.getenv("CARBON_WARMUP_ENABLED", "true").lower() == "true"
+
+# Chroma 連線、嵌入函數與 OpenAI 客戶端在第一次使用時才建立（匯入本模組不開啟資料庫），
+# 並且每個行程各自建立：fork 出的 worker 不沿用父行程的 SQLite 連線與 HTTP 連線池
+_resources = {}
+_resources_pid = os.getpid()
+_resources_lock = threading.RLock()
+
+def _reset_after_fork():
+    """fork 後在子行程捨棄父行程建立的連線，並重建鎖（fork 當下可能被其他執行緒持有）"""
+    global _resources, _resources_pid, _resources_lock, _vector_index_lock
+    _resources = {}
+    _resources_pid = os.getpid()
+    _resources_lock = threading.RLock()
+    # chromadb 依資料庫路徑快取共用的 System（含背景執行緒），子行程沿用會卡住，一併清除
+    if "chromadb" in sys.modules:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    # 向量索引是唯讀的 NumPy 陣列（或 memmap），子行程可直接共用父行程的頁面
+    _vector_index_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _get_resource(name: str, factory):
+    """取得本行程的共用資源，不存在時以 factory 建立"""
+    if _resources_pid != os.getpid():
+        _reset_after_fork()
+    resource = _resources.get(name)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+def _create_chroma_client():
+    import chromadb
+    # 連接到現有的 Chroma 資料庫
+    return chromadb.PersistentClient(path=os.getenv("CHROMA_PATH"))
+
+def _create_openai_embedding_function():
+    from chromadb.utils import embedding_functions
+    return embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model_name=EMBEDDING_MODEL,
+        dimensions=EMBEDDING_DIMENSIONS
+    )
+
+def get_chroma_client():
+    """取得本行程的 Chroma 客戶端"""
+    return _get_resource("chroma_client", _create_chroma_client)
+
+def get_openai_embedding_function():
+    """取得 OpenAI 的嵌入函數（不經快取）"""
+    return _get_resource("openai_ef", _create_openai_embedding_function)
+
+def get_embedding_function() -> CachedEmbeddingFunction:
+    """取得查詢用的嵌入函數：先查快取，未命中才呼叫 OpenAI"""
+    return _get_resource("cached_ef", lambda: CachedEmbeddingFunction(
+        get_openai_embedding_function(), EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+    ))
+
+def get_collection():
+    """取得現有的 carbon_catalogue collection"""
+    return _get_resource("collection", lambda: get_chroma_client().get_collection(
+        name="carbon_catalogue",
+        embedding_function=get_openai_embedding_function()
+    ))
+
+def get_catalogue_version() -> str:
+    """
+    資料庫版本：以名稱重新取得 collection，組合 ID、筆數與 metadata／文件的內容雜湊
+    （重建資料庫會產生新的 collection ID，就地更新內容會改變雜湊）
+
+    Returns:
+        str: "<collection ID>:<筆數>:<內容雜湊>"
+    """
+    return collection_version(get_chroma_client().get_collection(
+        name="carbon_catalogue",
+        embedding_function=get_openai_embedding_function()
+    ))
+
+def get_openai_client() -> AsyncOpenAI:
+    """取得本行程的 OpenAI 客戶端"""
+    return _get_resource("openai_client", lambda: AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+# 相容舊的模組屬性（query_chroma.collection 等），存取時才建立
+_LAZY_ATTRIBUTES = {
+    "chroma_client": get_chroma_client,
+    "openai_ef": get_openai_embedding_function,
+    "cached_ef": get_embedding_function,
+    "collection": get_collection,
+    "client": get_openai_client,
+}
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 向量搜尋後端：numpy（記憶體內精確索引）、partitioned（依產業分區、分區內依碳足跡排序的
+# 記憶體內精確索引，適合大型資料庫）或 chroma（collection.query）
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy")
+IN_MEMORY_BACKENDS = {
+    "numpy": NumpyVectorIndex,
+    "partitioned": PartitionedVectorIndex,
+}
+# 有匯出的向量快照時以 np.memmap 載入（所有 worker 共用 page cache），否則從 collection 載入
+VECTOR_SNAPSHOT_ENABLED = os.getenv("VECTOR_SNAPSHOT_ENABLED", "true").lower() == "true"
+
+# 碳足跡搜尋模式：
+# - two_step：LLM（或本地分類器）產生搜尋參數 → 過濾搜尋 → GPT 重新排序
+# - fused：以原始描述做不過濾的 top-K 搜尋，只用一次 GPT 呼叫選出最佳結果與原因
+CARBON_SEARCH_MODES = ("two_step", "fused")
+CARBON_SEARCH_MODE = os.getenv("CARBON_SEARCH_MODE", "two_step")
+FUSED_TOP_K = int(os.getenv("FUSED_TOP_K", "15"))
+
+# 推測式搜尋：two_step 模式需要 LLM 產生搜尋參數時，同時以原始描述做不過濾的搜尋，
+# 參數回來後在記憶體中套用過濾條件；留下的候選不足時才重新查詢
+SPECULATIVE_SEARCH_ENABLED = os.getenv("SPECULATIVE_SEARCH_ENABLED", "true").lower() == "true"
+SPECULATIVE_TOP_K = int(os.getenv("SPECULATIVE_TOP_K", "40"))
+SPECULATIVE_MIN_CANDIDATES = int(os.getenv("SPECULATIVE_MIN_CANDIDATES", "5"))
 
-# 初始化 OpenAI 客戶端
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 向量搜尋（嵌入 API + 索引查詢）在專用、大小固定的執行緒池執行：不阻塞 event loop，
+# 也不與其他 asyncio.to_thread 工作搶預設執行緒池
+VECTOR_SEARCH_WORKERS = int(os.getenv("VECTOR_SEARCH_WORKERS", "8"))
+
+vector_search_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failures": 0,
+    "pending": 0,
+    "queue_wait_ms_total": 0.0,
+    "queue_wait_ms_max": 0.0,
+    "execution_ms_total": 0.0,
+    "execution_ms_max": 0.0,
+}
+
+speculative_stats = {
+    "started": 0,
+    "used": 0,
+    "requeried": 0,
+    "failed": 0,
+}
+
+# 記憶體內向量索引（第一次查詢時從 collection 載入）
+_vector_index = None
+_vector_index_lock = threading.Lock()
+
+# 各產業的中心向量（第一次需要時從向量索引計算）
+_sector_centroids = None
+
+def _load_vector_index():
+    if VECTOR_SNAPSHOT_ENABLED and os.path.exists(VECTOR_SNAPSHOT_PATH):
+        try:
+            index = load_snapshot(VECTOR_SNAPSHOT_PATH, partitioned=VECTOR_BACKEND == "partitioned")
+            # 快照記錄的資料庫版本（collection ID + 筆數 + 內容雜湊）與目前資料庫不同時表示快照過期，改從 collection 載入
+            expected, current = snapshot_version(index.snapshot_header), get_catalogue_version()
+            if expected == current:
+                return index
+            logger.warning(f"向量快照的資料庫版本 {expected} 與目前資料庫 {current} 不符，請重新匯出快照；改從資料庫載入")
+        except Exception as e:
+            logger.warning(f"載入向量快照失敗，改從資料庫載入: {str(e)}")
+    return IN_MEMORY_BACKENDS.get(VECTOR_BACKEND, NumpyVectorIndex).from_collection(get_collection())
+
+def get_vector_index():
+    """取得記憶體內的向量索引（必要時從 collection 載入）"""
+    global _vector_index
+    if _vector_index is None:
+        with _vector_index_lock:
+            if _vector_index is None:
+                _vector_index = _load_vector_index()
+    return _vector_index
+
+def reload_vector_index():
+    """資料庫內容更新後重新載入向量索引"""
+    global _vector_index, _sector_centroids
+    with _vector_index_lock:
+        _vector_index = _load_vector_index()
+        _sector_centroids = None
+    return _vector_index
+
+def refresh_catalogue():
+    """
+    資料庫重建後更新本行程的狀態：捨棄快取的 collection（舊的 collection 已被刪除），
+    並重新載入記憶體內的向量索引與產業中心向量（尚未載入時留待第一次查詢）
+    """
+    global _sector_centroids
+    with _resources_lock:
+        _resources.pop("collection", None)
+    if _vector_index is not None:
+        reload_vector_index()
+    else:
+        _sector_centroids = None
+
+def get_sector_centroids() -> SectorCentroids:
+    """取得資料庫各產業的中心向量"""
+    global _sector_centroids
+    if _sector_centroids is None:
+        _sector_centroids = SectorCentroids.from_index(get_vector_index())
+    return _sector_centroids
+
+def _warmup():
+    # 記憶體內的後端（含快照）查詢時不使用 collection，只有 chroma 後端需要預先開啟
+    if VECTOR_BACKEND not in IN_MEMORY_BACKENDS:
+        get_collection()
+    get_embedding_function()
+    get_openai_client()
+    if VECTOR_BACKEND in IN_MEMORY_BACKENDS:
+        get_vector_index()
+        if SECTOR_CLASSIFIER_ENABLED:
+            get_sector_centroids()
+
+async def warmup_query_chroma():
+    """預先建立 Chroma 連線、OpenAI 客戶端與向量索引（供 main.py 啟動時呼叫）"""
+    if CARBON_WARMUP_ENABLED:
+        await asyncio.to_thread(_warmup)
 
 def query_similar_products(
     query_text: str,
@@ -49,8 +283,14 @@ def query_similar_products(
     Returns:
         dict: 包含相似產品信息的字典
     """
-    results = collection.query(
-        query_texts=[query_text],
+    query_embeddings = get_embedding_function()([query_text])
+
+    # 記憶體內索引不支援 where_document，改由 Chroma 處理
+    if VECTOR_BACKEND in IN_MEMORY_BACKENDS and where_document is None:
+        return get_vector_index().query(query_embeddings, n_results=n_results, where=where)
+
+    results = get_collection().query(
+        query_embeddings=query_embeddings,
         n_results=n_results,
         where=where,
         where_document=where_document
@@ -58,14 +298,389 @@ def query_similar_products(
     
     return results
 
-async def ai_search_products(product_description: str):
+def query_similar_products_batch(
+    query_texts: list,
+    n_results: int = 10,
+    wheres: Optional[list] = None
+) -> list:
+    """
+    一次查詢多個文本：嵌入向量以單一批次請求取得，向量搜尋一次處理所有查詢向量
+
+    Args:
+        query_texts (list): 查詢文本列表
+        n_results (int): 每個查詢返回的結果數量
+        wheres (list, optional): 與 query_texts 對應的 metadata 過濾條件（可為 None）
+
+    Returns:
+        list: 每個查詢各一個與 query_similar_products 相同格式的結果
+    """
+    if not query_texts:
+        return []
+    wheres = wheres or [None] * len(query_texts)
+    query_embeddings = get_embedding_function()(list(query_texts))
+
+    if VECTOR_BACKEND in IN_MEMORY_BACKENDS:
+        return get_vector_index().query_many(query_embeddings, n_results=n_results, wheres=wheres)
+
+    # Chroma 的 collection.query 一次只能套用一個 where，依過濾條件分組查詢
+    groups = {}
+    for position, where in enumerate(wheres):
+        groups.setdefault(json.dumps(where, sort_keys=True), []).append(position)
+    results = [None] * len(query_texts)
+    for positions in groups.values():
+        grouped = get_collection().query(
+            query_embeddings=[query_embeddings[position] for position in positions],
+            n_results=n_results,
+            where=wheres[positions[0]]
+        )
+        for row, position in enumerate(positions):
+            results[position] = {
+                key: [value[row]] if isinstance(value, list) and key != "included" else value
+                for key, value in grouped.items()
+            }
+    return results
+
+
+def get_vector_search_pool() -> ThreadPoolExecutor:
+    """取得本行程的向量搜尋執行緒池"""
+    return _get_resource("vector_search_pool", lambda: ThreadPoolExecutor(
+        max_workers=VECTOR_SEARCH_WORKERS, thread_name_prefix="vector-search"
+    ))
+
+def shutdown_vector_search_pool():
+    """關閉向量搜尋執行緒池（供 main.py 關閉時呼叫）"""
+    pool = _resources.pop("vector_search_pool", None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+async def run_vector_search(func, *args, **kwargs) -> tuple:
+    """
+    在向量搜尋執行緒池執行同步的嵌入或搜尋函數
+
+    Args:
+        func: 要執行的同步函數
+        *args / **kwargs: 傳給 func 的參數
+
+    Returns:
+        tuple: (func 的回傳值, {"queue_wait_ms": 排隊等待時間, "execution_ms": 執行時間})
+    """
+    submitted = time.perf_counter()
+    timing = {"queue_wait_ms": 0.0, "execution_ms": 0.0}
+
+    def run():
+        started = time.perf_counter()
+        timing["queue_wait_ms"] = (started - submitted) * 1000
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timing["execution_ms"] = (time.perf_counter() - started) * 1000
+
+    vector_search_stats["submitted"] += 1
+    vector_search_stats["pending"] += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(get_vector_search_pool(), run)
+        vector_search_stats["completed"] += 1
+        return result, timing
+    except Exception:
+        vector_search_stats["failures"] += 1
+        raise
+    finally:
+        vector_search_stats["pending"] -= 1
+        for name in ("queue_wait_ms", "execution_ms"):
+            vector_search_stats[f"{name}_total"] += timing[name]
+            vector_search_stats[f"{name}_max"] = max(vector_search_stats[f"{name}_max"], timing[name])
+        logger.debug(f"向量搜尋 {getattr(func, '__name__', func)}：排隊 {timing['queue_wait_ms']:.1f} ms，"
+                     f"執行 {timing['execution_ms']:.1f} ms")
+
+async def query_similar_products_async(
+    query_text: str,
+    n_results: int = 10,
+    where: Optional[Dict[str, Any]] = None,
+    where_document: Optional[Dict[str, Any]] = None
+) -> dict:
+    """query_similar_products 的非同步版本（在向量搜尋執行緒池執行）"""
+    results, _ = await run_vector_search(
+        query_similar_products, query_text, n_results=n_results, where=where, where_document=where_document
+    )
+    return results
+
+async def query_similar_products_batch_async(
+    query_texts: list,
+    n_results: int = 10,
+    wheres: Optional[list] = None
+) -> list:
+    """query_similar_products_batch 的非同步版本（在向量搜尋執行緒池執行）"""
+    results, _ = await run_vector_search(query_similar_products_batch, query_texts, n_results=n_results, wheres=wheres)
+    return results
+
+def get_vector_search_stats() -> dict:
+    """回傳向量搜尋執行緒池的佇列深度、排隊與執行時間"""
+    finished = vector_search_stats["completed"] + vector_search_stats["failures"]
+    return {
+        **{name: round(value, 2) if isinstance(value, float) else value for name, value in vector_search_stats.items()},
+        "workers": VECTOR_SEARCH_WORKERS,
+        "queue_wait_ms_avg": round(vector_search_stats["queue_wait_ms_total"] / finished, 2) if finished else 0.0,
+        "execution_ms_avg": round(vector_search_stats["execution_ms_total"] / finished, 2) if finished else 0.0,
+    }
+
+
+def build_where(args: dict) -> Optional[Dict[str, Any]]:
+    """
+    將 function calling 產生的搜尋參數轉換為 metadata 過濾條件
+
+    Args:
+        args (dict): 包含 min_carbon_footprint、max_carbon_footprint、sector 的搜尋參數
+
+    Returns:
+        dict: Chroma where 條件，沒有任何條件時為 None
+    """
+    where_conditions = []
+    if args.get("min_carbon_footprint") is not None:
+        where_conditions.append({"carbon_footprint": {"$gte": args["min_carbon_footprint"]}})
+    if args.get("max_carbon_footprint") is not None:
+        where_conditions.append({"carbon_footprint": {"$lte": args["max_carbon_footprint"]}})
+    if args.get("sector") is not None:
+        where_conditions.append({"sector": args["sector"]})
+
+    # 如果有多個條件，使用 $and 運算符組合
+    if len(where_conditions) == 1:
+        return where_conditions[0]
+    if len(where_conditions) > 1:
+        return {"$and": where_conditions}
+    return None
+
+
+def resolve_search_mode(mode: Optional[str] = None) -> str:
+    """決定碳足跡搜尋模式；未指定或不支援時使用 CARBON_SEARCH_MODE"""
+    mode = mode or CARBON_SEARCH_MODE
+    return mode if mode in CARBON_SEARCH_MODES else "two_step"
+
+
+def fused_search_params(product_description: str) -> dict:
+    """fused 模式的搜尋參數：直接以原始描述搜尋，不設任何過濾條件"""
+    return {
+        "query_text": product_description,
+        "min_carbon_footprint": None,
+        "max_carbon_footprint": None,
+        "sector": None,
+        "mode": "fused",
+    }
+
+
+async def prepare_search(product_description: str, mode: Optional[str] = None,
+                         vector=None, use_centroid: bool = True) -> tuple:
+    """
+    依搜尋模式產生搜尋參數與搜尋結果數量
+
+    vector 與 use_centroid 傳給 plan_product_search（批次模式預先取得描述嵌入向量時使用）。
+
+    Returns:
+        tuple: (搜尋參數或 {"error": ...}, n_results)
+    """
+    if resolve_search_mode(mode) == "fused":
+        return fused_search_params(product_description), FUSED_TOP_K
+    return await plan_product_search(product_description, vector=vector, use_centroid=use_centroid), 10
+
+
+async def needs_llm_plan(product_description: str) -> bool:
+    """關鍵字分類與參數快取都無法決定搜尋參數時，plan_product_search 需要等待嵌入 API 或 LLM"""
+    if SECTOR_CLASSIFIER_ENABLED:
+        result = classify_by_keywords(product_description)
+        if result is not None and result["confidence"] >= SECTOR_CLASSIFIER_MIN_CONFIDENCE:
+            return False
+    if not SEARCH_PARAMS_CACHE_ENABLED:
+        return True
+    # SQLite 讀取在執行緒中進行，不阻塞事件迴圈
+    return not await asyncio.to_thread(get_search_params_cache().contains, canonical_product_key(product_description))
+
+
+async def embed_for_centroid(product_descriptions: list) -> list:
+    """
+    批次模式：以單一嵌入請求取得需要產業中心向量分類的描述嵌入向量
+
+    關鍵字分類或參數快取即可決定參數的描述不需要向量。向量會進嵌入快取，
+    以中心向量分類的描述搜尋時（搜尋詞即原始描述）不會再呼叫 API。
+
+    Returns:
+        list: 與輸入等長，不需要向量的位置為 None
+    """
+    vectors = [None] * len(product_descriptions)
+    if not SECTOR_CLASSIFIER_ENABLED:
+        return vectors
+    needed = [index for index, description in enumerate(product_descriptions) if await needs_llm_plan(description)]
+    if needed:
+        embedded, _ = await run_vector_search(
+            get_embedding_function(), [product_descriptions[index] for index in needed]
+        )
+        for index, vector in zip(needed, embedded):
+            vectors[index] = vector
+    return vectors
+
+
+def filter_speculative_results(results: dict, where: Optional[Dict[str, Any]], n_results: int) -> dict:
+    """
+    在記憶體中對推測式搜尋的結果套用過濾條件，保留前 n_results 筆
+
+    Returns:
+        dict: 與 query_similar_products 相同格式的結果
+    """
+    keep = [
+        position for position, metadata in enumerate(results['metadatas'][0])
+        if metadata_matches(metadata, where)
+    ][:n_results]
+    filtered = dict(results)
+    for key in ("ids", "distances", "metadatas", "documents"):
+        filtered[key] = [[results[key][0][position] for position in keep]]
+    return filtered
+
+
+async def ai_search_products(product_description: str, mode: Optional[str] = None):
     """
     使用 AI 搜尋產品資料，通過 function calling 執行查詢
     Args:
         product_description (str): 產品描述文字
+        mode (str, optional): 搜尋模式（two_step 或 fused），預設依 CARBON_SEARCH_MODE
     Returns:
         dict: 查詢結果包含最佳匹配產品信息
     """
+    # 搜尋參數需要等待 LLM 時，先以原始描述開始不過濾的搜尋（嵌入 API 與 LLM 並行）
+    speculative = None
+    if (SPECULATIVE_SEARCH_ENABLED and resolve_search_mode(mode) == "two_step"
+            and await needs_llm_plan(product_description)):
+        speculative_stats["started"] += 1
+        speculative = asyncio.create_task(query_similar_products_async(
+            product_description,
+            n_results=SPECULATIVE_TOP_K
+        ))
+        # 參數產生失敗而不再等待時，避免未取得的例外在垃圾回收時被記錄
+        speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    args, n_results = await prepare_search(product_description, mode)
+    if "error" in args:
+        if speculative is not None:
+            speculative.cancel()
+        return args
+
+    where = build_where(args)
+    results = None
+    if speculative is not None:
+        try:
+            results = filter_speculative_results(await speculative, where, n_results)
+        except Exception as e:
+            speculative_stats["failed"] += 1
+            logger.warning(f"推測式搜尋失敗，改為一般搜尋: {str(e)}")
+        else:
+            if len(results['ids'][0]) >= min(SPECULATIVE_MIN_CANDIDATES, n_results):
+                speculative_stats["used"] += 1
+            else:
+                speculative_stats["requeried"] += 1
+                results = None
+
+    if results is None:
+        try:
+            # 執行搜尋（嵌入 API 呼叫與搜尋都是同步的，在向量搜尋執行緒池執行避免阻塞 event loop）
+            results = await query_similar_products_async(
+                args["query_text"],
+                n_results=n_results,
+                where=where
+            )
+        except Exception as e:
+            return {"error": f"搜尋過程中發生錯誤: {str(e)}"}
+
+    return await select_best_match(product_description, args, results)
+
+
+def get_speculative_search_stats() -> dict:
+    """回傳推測式搜尋的啟動、採用與重新查詢次數"""
+    started = speculative_stats["started"]
+    return {
+        **speculative_stats,
+        "enabled": SPECULATIVE_SEARCH_ENABLED,
+        "top_k": SPECULATIVE_TOP_K,
+        "hit_rate": round(speculative_stats["used"] / started, 4) if started else 0.0,
+    }
+
+
+async def classify_product_locally(product_description: str, use_centroid: bool = True,
+                                   vector=None) -> Optional[dict]:
+    """
+    以本地分類器產生搜尋參數：先比對關鍵字，信心不足時再比較描述嵌入向量與各產業中心向量
+
+    Args:
+        product_description (str): 產品描述文字
+        use_centroid (bool): 關鍵字信心不足時是否以中心向量分類（需要嵌入向量）
+        vector: 預先取得的描述嵌入向量；未提供時呼叫嵌入函數
+
+    Returns:
+        dict: 與 function calling 相同格式的搜尋參數（另含 classifier 欄位），信心不足時為 None
+    """
+    result = classify_by_keywords(product_description)
+    source = "keyword"
+    if result is None or result["confidence"] < SECTOR_CLASSIFIER_MIN_CONFIDENCE:
+        if not use_centroid:
+            return None
+        try:
+            # 嵌入向量會進快取；只靠中心向量分類時搜尋詞就是原始描述，搜尋時不會再呼叫 API
+            if vector is None:
+                vectors, _ = await run_vector_search(get_embedding_function(), [product_description])
+                vector = vectors[0]
+            centroid = get_sector_centroids().classify(vector)
+        except Exception as e:
+            logger.warning(f"產業中心向量分類失敗，改用 LLM: {str(e)}")
+            return None
+        result = combine_with_centroid(product_description, result, centroid)
+        source = "centroid"
+        if result["confidence"] < SECTOR_CLASSIFIER_MIN_CONFIDENCE:
+            return None
+
+    record_decision(source)
+    return {
+        "query_text": result["query_text"],
+        "min_carbon_footprint": result["min_carbon_footprint"],
+        "max_carbon_footprint": result["max_carbon_footprint"],
+        "sector": result["sector"],
+        "classifier": {
+            "source": source,
+            "confidence": result["confidence"],
+            "product_type": result["product_type"],
+        },
+    }
+
+
+async def plan_product_search(product_description: str, vector=None, use_centroid: bool = True) -> dict:
+    """
+    第一步：將產品描述轉換為搜尋參數
+
+    關鍵字分類信心足夠時直接採用；其次查詢依產品類型（品牌 + 型號系列）快取的 LLM 參數，
+    再其次以產業中心向量分類；都沒有時才以 function calling 交給 LLM 判斷，結果寫入快取。
+
+    Args:
+        product_description (str): 產品描述文字
+        vector: 預先取得的描述嵌入向量（中心向量分類用，批次模式以單一請求取得）
+        use_centroid (bool): 是否使用中心向量分類；False 時不呼叫嵌入 API
+
+    Returns:
+        dict: 搜尋參數（query_text、min/max_carbon_footprint、sector），失敗時為 {"error": ...}
+    """
+    # 信心足夠的關鍵字分類不需要任何 API，也優先於快取中的 LLM 參數
+    if SECTOR_CLASSIFIER_ENABLED:
+        args = await classify_product_locally(product_description, use_centroid=False)
+        if args is not None:
+            return args
+
+    params_cache = get_search_params_cache()
+    product_key = canonical_product_key(product_description) if SEARCH_PARAMS_CACHE_ENABLED else None
+    # 快取的 SQLite 讀寫在執行緒中進行，不阻塞事件迴圈
+    cached = await asyncio.to_thread(params_cache.lookup, product_key) if SEARCH_PARAMS_CACHE_ENABLED else None
+    if cached is not None:
+        return cached
+
+    if SECTOR_CLASSIFIER_ENABLED and use_centroid:
+        args = await classify_product_locally(product_description, vector=vector)
+        if args is not None:
+            return args
+    record_decision("llm")
+
     # 定義查詢函數工具
     tools = [{
         "type": "function",
@@ -150,14 +765,17 @@ async def ai_search_products(product_description: str):
     """
 
     # 調用 AI 進行查詢準備
-    response = await client.responses.create(
-        model="gpt-4.1-nano",
-        input=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"你的任務是找這個產品的碳足跡資訊：{product_description}，你需要將此描述轉換為最佳搜尋參數，以便在Chroma向量碳足跡資料庫中找到最相關的結果。請設定合理的碳足跡過濾範圍，避免查不到結果。記得根據產品類型選擇正確的行業分類。"}
-        ],
-        tools=tools
-    )
+    try:
+        response = await get_openai_client().responses.create(
+            model="gpt-4.1-nano",
+            input=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"你的任務是找這個產品的碳足跡資訊：{product_description}，你需要將此描述轉換為最佳搜尋參數，以便在Chroma向量碳足跡資料庫中找到最相關的結果。請設定合理的碳足跡過濾範圍，避免查不到結果。記得根據產品類型選擇正確的行業分類。"}
+            ],
+            tools=tools
+        )
+    except Exception as e:
+        return {"error": f"搜尋過程中發生錯誤: {str(e)}"}
 
     # 處理 AI 的搜尋函數呼叫
     function_call = None
@@ -172,51 +790,51 @@ async def ai_search_products(product_description: str):
     # 解析函數參數
     try:
         args = json.loads(function_call.arguments)
-        query_text = args["query_text"]
-        n_results = 10
-
-        # 構建 metadata 過濾條件
-        where_conditions = []
-        if args.get("min_carbon_footprint") is not None:
-            where_conditions.append({"carbon_footprint": {"$gte": args["min_carbon_footprint"]}})
-        if args.get("max_carbon_footprint") is not None:
-            where_conditions.append({"carbon_footprint": {"$lte": args["max_carbon_footprint"]}})
-        if args.get("sector") is not None:
-            where_conditions.append({"sector": args["sector"]})
-
-        # 如果有多個條件，使用 $and 運算符組合
-        where = None
-        if len(where_conditions) == 1:
-            where = where_conditions[0]
-        elif len(where_conditions) > 1:
-            where = {"$and": where_conditions}
-
-        # 執行搜尋
-        results = query_similar_products(
-            query_text=query_text,
-            n_results=n_results,
-            where=where
-        )
+    except json.JSONDecodeError as e:
+        return {"error": f"解析函數參數錯誤: {str(e)}"}
+    if "query_text" not in args:
+        return {"error": "解析函數參數錯誤: 'query_text'"}
+    await asyncio.to_thread(params_cache.store, product_key, args)
+    return args
+
+
+async def select_best_match(product_description: str, args: dict, results: dict) -> dict:
+    """
+    第三步：以 GPT 重新排序向量搜尋結果，並組成最終結果
+
+    Args:
+        product_description (str): 產品描述文字
+        args (dict): plan_product_search 產生的搜尋參數
+        results (dict): 單一查詢的向量搜尋結果
 
+    Returns:
+        dict: 與 ai_search_products 相同格式的結果
+    """
+    try:
         # 檢查是否有搜尋結果
         if not results['ids'][0] or len(results['ids'][0]) == 0:
             return {"error": "沒有找到符合條件的產品"}
-        # 使用 GPT 重新排序結果（簡化錯誤處理）
-        try:
-            reranked_result = await gpt_rerank_async(product_description, results)
-            best_index = reranked_result.get("best_match_index", 0)
-
-            # 簡單檢查索引是否有效
-            if best_index < 0 or best_index >= len(results['ids'][0]):
-                best_index = 0
-                selection_reason = "索引無效，使用相似度最高的結果"
-            else:
-                selection_reason = reranked_result.get("reason", "使用 GPT 選擇的結果")
-        except Exception as e:
-            # 出現任何錯誤時，預設使用第一個結果
+        # 第一名明顯可靠時略過 GPT 重新排序；其次採用信心足夠的重新排序模型；否則使用 GPT 重新排序結果
+        gate = should_skip_rerank(product_description, args, results)
+        model_choice = None if gate["skip"] else predict_rerank(product_description, args, results)
+        if gate["skip"]:
             best_index = 0
-            selection_reason = "重排序過程出錯，使用相似度最高的結果"
-            reranked_result = {"best_match_index": 0, "reason": selection_reason}
+            selection_reason = gate["reason"]
+            reranked_result = {"best_match_index": 0, "reason": selection_reason, "skipped": True, "gate": gate}
+        elif model_choice is not None:
+            best_index = model_choice["best_match_index"]
+            selection_reason = model_choice["reason"]
+            reranked_result = {**model_choice, "skipped": True}
+        else:
+            started = time.perf_counter()
+            best_index, selection_reason, reranked_result = await rerank_best_index(product_description, results)
+            # 記錄 GPT 的有效選擇，作為重新排序模型的訓練資料（在背景寫入執行緒寫檔，不等待完成）
+            if RERANK_LOG_ENABLED and "error" not in reranked_result \
+                    and reranked_result.get("best_match_index") == best_index:
+                submit_rerank_decision(
+                    product_description, args, results, best_index,
+                    (time.perf_counter() - started) * 1000, reranked_result.get("group_size", 1) > 1
+                )
 
         # 準備結果物件
         best_match = {
@@ -238,42 +856,61 @@ async def ai_search_products(product_description: str):
             "best_product": best_match  # 新增：直接包含最佳匹配產品
         }
 
-    except (json.JSONDecodeError, KeyError) as e:
+    except KeyError as e:
         return {"error": f"解析函數參數錯誤: {str(e)}"}
     except Exception as e:
         return {"error": f"搜尋過程中發生錯誤: {str(e)}"}
 
 
-async def gpt_rerank_async(query: str, results: dict):
+async def rerank_best_index(product_description: str, results: dict) -> tuple:
     """
-    使用 GPT 重新排序查詢結果 (非同步版本)
+    以 GPT 重新排序並取得最佳結果的索引（簡化錯誤處理，出錯時使用相似度最高的結果）
+
+    Returns:
+        tuple: (最佳索引, 選擇原因, GPT 重新排序結果)
+    """
+    try:
+        reranked_result = await gpt_rerank_async(product_description, results)
+        best_index = reranked_result.get("best_match_index", 0)
+
+        # 簡單檢查索引是否有效
+        if best_index < 0 or best_index >= len(results['ids'][0]):
+            return 0, "索引無效，使用相似度最高的結果", reranked_result
+        return best_index, reranked_result.get("reason", "使用 GPT 選擇的結果"), reranked_result
+    except Exception as e:
+        # 出現任何錯誤時，預設使用第一個結果
+        selection_reason = "重排序過程出錯，使用相似度最高的結果"
+        return 0, selection_reason, {"best_match_index": 0, "reason": selection_reason, "error": str(e)}
+
+
+RERANK_SYSTEM_PROMPT = "你是一個極其嚴格的產品匹配專家，你的首要任務是確保產品類別的絕對正確匹配。產品類型不匹配是嚴重錯誤，必須避免。例如：\n\n- 如果查詢是筆記型電腦，你絕對不能選擇列印機、鍵盤或其他任何非筆記型電腦產品\n- 如果查詢是智慧型手機，你絕對不能選擇平板、耳機或其他任何非智慧型手機產品\n\n在選擇產品時，請首先識別查詢中的產品類型，然後確保只考慮相同類型的產品。只有在沒有完全相同類型的產品時，才考慮功能最相近的產品類型。碳足跡計算的準確性完全依賴於正確的產品類型匹配。"
+
+
+def build_rerank_prompt(query: str, results: dict, compact: Optional[bool] = None) -> tuple:
+    """
+    構建重新排序的提示
 
     Args:
         query (str): 原始查詢
         results (dict): Chroma 查詢結果
+        compact (bool, optional): 是否使用精簡候選格式，預設依 RERANK_COMPACT_CANDIDATES
 
     Returns:
-        dict: 包含 GPT 選擇的最佳結果索引和原因
-    """
-    # 準備候選者列表
-    candidates = []
-    for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
-        candidates.append({
-            "index": i,
-            "product_name": metadata['product_name'],
-            "company": metadata['company'],
-            "carbon_footprint": metadata['carbon_footprint'],
-            "sector": metadata.get('sector', '未知'),
-            "cosine_distance": results['distances'][0][i],
-            "details": doc
-        })
-
-    # 構建提示
+        tuple: (提示文字, 候選分組)；GPT 回覆的索引以 expand_index(分組, 索引) 轉回原始索引
+    """
+    compact = RERANK_COMPACT_CANDIDATES if compact is None else compact
+    if compact:
+        groups = group_candidates(results)
+        candidates_text = f"{COMPACT_SCHEMA_LEGEND}\n        {format_compact_candidates(results, groups)}"
+    else:
+        groups = [[index] for index in range(len(results['ids'][0]))]
+        candidates_text = format_verbose_candidates(results)
+
     prompt = f"""
         請根據以下查詢和候選產品列表，選擇最符合的產品：
         查詢：{query}
         候選產品列表：
-        {json.dumps(candidates, ensure_ascii=False, indent=2)}
+        {candidates_text}
 
         你的任務是：
         1. 先從產品描述中識別出查詢的產品類型，再從候選產品中識別出每個產品的類型，然後嚴格按照產品類型進行匹配。
@@ -292,12 +929,27 @@ async def gpt_rerank_async(query: str, results: dict):
         3. 品牌相似度（有相同品牌最好，但功能相似更重要）
         4. 碳足跡數值的合理性
         """
+    return prompt, groups
+
+
+async def gpt_rerank_async(query: str, results: dict):
+    """
+    使用 GPT 重新排序查詢結果 (非同步版本)
+
+    Args:
+        query (str): 原始查詢
+        results (dict): Chroma 查詢結果
+
+    Returns:
+        dict: 包含 GPT 選擇的最佳結果索引（原始搜尋結果的索引）和原因
+    """
+    prompt, groups = build_rerank_prompt(query, results)
 
     # 調用 GPT (非同步)
-    response = await client.responses.create(
+    response = await get_openai_client().responses.create(
         model="gpt-4.1-nano",
         input=[
-            {"role": "system", "content": "你是一個極其嚴格的產品匹配專家，你的首要任務是確保產品類別的絕對正確匹配。產品類型不匹配是嚴重錯誤，必須避免。例如：\n\n- 如果查詢是筆記型電腦，你絕對不能選擇列印機、鍵盤或其他任何非筆記型電腦產品\n- 如果查詢是智慧型手機，你絕對不能選擇平板、耳機或其他任何非智慧型手機產品\n\n在選擇產品時，請首先識別查詢中的產品類型，然後確保只考慮相同類型的產品。只有在沒有完全相同類型的產品時，才考慮功能最相近的產品類型。碳足跡計算的準確性完全依賴於正確的產品類型匹配。"},
+            {"role": "system", "content": RERANK_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
         text={
@@ -327,6 +979,11 @@ async def gpt_rerank_async(query: str, results: dict):
     # 解析回應
     try:
         result = json.loads(response.output_text)
+        # 合併過的候選展開回原始索引
+        chosen = result.get("best_match_index")
+        result["best_match_index"] = expand_index(groups, chosen)
+        # 選到合併的近似重複候選時，展開後的索引是組內第一個，而非 GPT 確切選擇的成員
+        result["group_size"] = len(groups[chosen]) if isinstance(chosen, int) and 0 <= chosen < len(groups) else 0
         return result
     except (json.JSONDecodeError, AttributeError) as e:
         return {"error": f"無法解析 GPT 回應: {str(e)}"}
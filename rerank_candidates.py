@@ -0,0 +1,128 @@
+"""
+ReviveAI 的 GPT 重新排序候選清單編碼
+
+gpt_rerank_async 原本以 json.dumps(..., indent=2) 列出 10 個候選產品，並附上完整的資料庫文件
+（文件內容大多與 metadata 重複），而碳足跡資料庫中常有幾乎相同的產品
+（例如 bizhub C458 與 C558）。此模組產生精簡的候選清單：
+
+- 固定的短欄位名稱（i / name / company / sector / cf / dist / details），不縮排
+- details 只保留文件的「詳情」部分，並截斷到 token 上限
+- 同公司、同產業、碳足跡相同且名稱只差數字的候選合併成一筆，送出前收合，GPT 回覆後再展開回原始索引
+  （碳足跡不同的型號不合併，GPT 仍能選到確切的型號）
+"""
+
+import json
+import os
+import re
+from dotenv import load_dotenv
+from text_tokens import truncate_to_tokens
+
+# 載入環境變數
+load_dotenv()
+
+RERANK_COMPACT_CANDIDATES = os.getenv("RERANK_COMPACT_CANDIDATES", "true").lower() == "true"
+RERANK_DETAILS_MAX_TOKENS = int(os.getenv("RERANK_DETAILS_MAX_TOKENS", "60"))
+RERANK_COLLAPSE_DUPLICATES = os.getenv("RERANK_COLLAPSE_DUPLICATES", "true").lower() == "true"
+
+# 精簡格式的欄位說明，放在提示中
+COMPACT_SCHEMA_LEGEND = (
+    "欄位：i=候選索引、name=產品名稱、company=公司、sector=產業、cf=碳足跡(kg CO2e)、"
+    "dist=cosine distance（越小越相似）、details=產品詳情、n=合併的相似產品數量"
+)
+
+_DETAILS_MARKER = "詳情:"
+_DIGITS_PATTERN = re.compile(r"\d+")
+
+
+def duplicate_key(metadata: dict) -> tuple:
+    """近似重複的判斷鍵：公司、產業、碳足跡，以及把數字遮蔽後的產品名稱"""
+    name = _DIGITS_PATTERN.sub("#", (metadata.get("product_name") or "").casefold())
+    try:
+        carbon = round(float(metadata.get("carbon_footprint")), 6)
+    except (TypeError, ValueError):
+        carbon = metadata.get("carbon_footprint")
+    return (
+        (metadata.get("company") or "").casefold().strip(),
+        metadata.get("sector"),
+        carbon,
+        re.sub(r"\s+", " ", name).strip(),
+    )
+
+
+def _details(document: str, max_tokens: int) -> str:
+    """只保留文件的「詳情」部分（其他欄位與 metadata 重複），並截斷到 token 上限"""
+    document = document or ""
+    if _DETAILS_MARKER in document:
+        document = document.rsplit(_DETAILS_MARKER, 1)[1]
+    return truncate_to_tokens(document.strip(), max_tokens)
+
+
+def group_candidates(results: dict, collapse: bool = None) -> list:
+    """
+    將搜尋結果分組，近似重複的候選放在同一組
+
+    Args:
+        results: 單一查詢的向量搜尋結果（依距離排序）
+        collapse: 是否合併近似重複的候選，預設依 RERANK_COLLAPSE_DUPLICATES
+
+    Returns:
+        list: 每組的原始索引列表；各組依第一個成員的排序，組內第一個即距離最小的代表
+    """
+    collapse = RERANK_COLLAPSE_DUPLICATES if collapse is None else collapse
+    metadatas = results["metadatas"][0]
+    if not collapse:
+        return [[index] for index in range(len(metadatas))]
+    groups = {}
+    for index, metadata in enumerate(metadatas):
+        groups.setdefault(duplicate_key(metadata), []).append(index)
+    return sorted(groups.values(), key=lambda members: members[0])
+
+
+def format_compact_candidates(results: dict, groups: list, max_details_tokens: int = None) -> str:
+    """
+    以精簡格式輸出候選清單（每組只列代表產品）
+
+    Returns:
+        str: 不縮排的 JSON 陣列
+    """
+    max_details_tokens = RERANK_DETAILS_MAX_TOKENS if max_details_tokens is None else max_details_tokens
+    candidates = []
+    for position, members in enumerate(groups):
+        index = members[0]
+        metadata = results["metadatas"][0][index]
+        candidate = {
+            "i": position,
+            "name": metadata["product_name"],
+            "company": metadata["company"],
+            "sector": metadata.get("sector", "未知"),
+            "cf": metadata["carbon_footprint"],
+            "dist": round(float(results["distances"][0][index]), 3),
+            "details": _details(results["documents"][0][index], max_details_tokens),
+        }
+        if len(members) > 1:
+            candidate["n"] = len(members)
+        candidates.append(candidate)
+    return json.dumps(candidates, ensure_ascii=False, separators=(",", ":"))
+
+
+def format_verbose_candidates(results: dict) -> str:
+    """原本的候選清單格式（完整文件、縮排 JSON），RERANK_COMPACT_CANDIDATES=false 時使用"""
+    candidates = []
+    for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
+        candidates.append({
+            "index": i,
+            "product_name": metadata['product_name'],
+            "company": metadata['company'],
+            "carbon_footprint": metadata['carbon_footprint'],
+            "sector": metadata.get('sector', '未知'),
+            "cosine_distance": results['distances'][0][i],
+            "details": doc
+        })
+    return json.dumps(candidates, ensure_ascii=False, indent=2)
+
+
+def expand_index(groups: list, index: int) -> int:
+    """將 GPT 回覆的分組索引展開回原始搜尋結果的索引；超出範圍時回傳 -1"""
+    if isinstance(index, int) and 0 <= index < len(groups):
+        return groups[index][0]
+    return -1
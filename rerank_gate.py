@@ -0,0 +1,128 @@
+"""
+ReviveAI 碳足跡搜尋的 GPT 重新排序閘門
+
+select_best_match 原本在向量搜尋後一律呼叫 gpt_rerank_async，即使第一名明顯就是正確答案
+也要多等一次 LLM 往返。此模組判斷第一名是否足夠可靠，可靠時直接採用、略過重新排序：
+
+- 第一名的 cosine distance 不超過上限，且與第二名的差距（margin）達到門檻
+- 第一名的產品名稱／描述中出現與查詢相同的產品類型（以 sector_classifier 的關鍵字比對）
+- 第一名的產業分類與搜尋參數（或關鍵字分類）的產業一致
+
+門檻皆可由環境變數調整；benchmarks/eval_rerank_gate.py 可離線評估不同門檻下
+節省的延遲與和 GPT 選擇的一致率。
+"""
+
+import os
+from dotenv import load_dotenv
+from sector_classifier import classify_by_keywords, detect_product_types
+
+# 載入環境變數
+load_dotenv()
+
+RERANK_GATE_ENABLED = os.getenv("RERANK_GATE_ENABLED", "true").lower() == "true"
+RERANK_GATE_MIN_MARGIN = float(os.getenv("RERANK_GATE_MIN_MARGIN", "0.03"))  # 第二名與第一名的距離差
+RERANK_GATE_MAX_DISTANCE = float(os.getenv("RERANK_GATE_MAX_DISTANCE", "0.6"))  # 第一名的 cosine distance 上限
+RERANK_GATE_REQUIRE_TYPE_MATCH = os.getenv("RERANK_GATE_REQUIRE_TYPE_MATCH", "true").lower() == "true"
+RERANK_GATE_REQUIRE_SECTOR_MATCH = os.getenv("RERANK_GATE_REQUIRE_SECTOR_MATCH", "true").lower() == "true"
+
+_stats = {
+    "checked": 0,
+    "skipped": 0,
+    "reranked": 0,
+}
+
+
+def evaluate_rerank_gate(
+    product_description: str,
+    args: dict,
+    results: dict,
+    min_margin: float = None,
+    max_distance: float = None,
+    require_type_match: bool = None,
+    require_sector_match: bool = None,
+) -> dict:
+    """
+    判斷是否可以略過 GPT 重新排序、直接採用第一名（不更新統計，離線評估也使用此函數）
+
+    Args:
+        product_description: 產品描述文字
+        args: plan_product_search 產生的搜尋參數
+        results: 單一查詢的向量搜尋結果（依距離排序）
+        min_margin / max_distance / require_type_match / require_sector_match: 覆寫預設門檻
+
+    Returns:
+        dict: {"skip", "reason", "distance", "margin", "query_type", "candidate_types",
+               "expected_sector", "sector"}
+    """
+    min_margin = RERANK_GATE_MIN_MARGIN if min_margin is None else min_margin
+    max_distance = RERANK_GATE_MAX_DISTANCE if max_distance is None else max_distance
+    require_type_match = RERANK_GATE_REQUIRE_TYPE_MATCH if require_type_match is None else require_type_match
+    require_sector_match = RERANK_GATE_REQUIRE_SECTOR_MATCH if require_sector_match is None else require_sector_match
+
+    distances = results["distances"][0]
+    metadata = results["metadatas"][0][0]
+    document = results["documents"][0][0] or ""
+    distance = float(distances[0])
+    margin = float(distances[1] - distances[0]) if len(distances) > 1 else float("inf")
+
+    keywords = classify_by_keywords(product_description)
+    query_type = keywords["product_type"] if keywords else None
+    expected_sector = args.get("sector") or (keywords["sector"] if keywords else None)
+    candidate_types = detect_product_types(f"{metadata.get('product_name', '')} {document}")
+    sector = metadata.get("sector")
+
+    decision = {
+        "skip": False,
+        "reason": "",
+        "distance": round(distance, 4),
+        "margin": round(margin, 4) if margin != float("inf") else None,
+        "query_type": query_type,
+        "candidate_types": candidate_types,
+        "expected_sector": expected_sector,
+        "sector": sector,
+    }
+    if distance > max_distance:
+        decision["reason"] = f"第一名距離 {distance:.3f} 超過上限 {max_distance}"
+    elif margin < min_margin:
+        decision["reason"] = f"第一名與第二名差距 {margin:.3f} 低於門檻 {min_margin}"
+    elif require_type_match and (query_type is None or query_type not in candidate_types):
+        decision["reason"] = "無法確認第一名與查詢的產品類型相同"
+    elif require_sector_match and (expected_sector is None or sector != expected_sector):
+        decision["reason"] = "第一名的產業分類與查詢不一致"
+    else:
+        decision["skip"] = True
+        margin_text = f"{margin:.3f}" if margin != float("inf") else "—"
+        decision["reason"] = (
+            f"相似度明顯領先（距離 {distance:.3f}、差距 {margin_text}）且產品類型與產業一致，略過 GPT 重新排序"
+        )
+    return decision
+
+
+def should_skip_rerank(product_description: str, args: dict, results: dict) -> dict:
+    """
+    serving 路徑使用的閘門：停用時一律重新排序，並累計略過比例
+
+    Returns:
+        dict: 與 evaluate_rerank_gate 相同
+    """
+    if not RERANK_GATE_ENABLED:
+        decision = {"skip": False, "reason": "閘門已停用"}
+    else:
+        decision = evaluate_rerank_gate(product_description, args, results)
+    _stats["checked"] += 1
+    _stats["skipped" if decision["skip"] else "reranked"] += 1
+    return decision
+
+
+def get_rerank_gate_stats() -> dict:
+    """回傳閘門的判斷次數、略過比例與目前門檻"""
+    checked = _stats["checked"]
+    return {
+        **_stats,
+        "skip_rate": round(_stats["skipped"] / checked, 4) if checked else 0.0,
+        "enabled": RERANK_GATE_ENABLED,
+        "min_margin": RERANK_GATE_MIN_MARGIN,
+        "max_distance": RERANK_GATE_MAX_DISTANCE,
+        "require_type_match": RERANK_GATE_REQUIRE_TYPE_MATCH,
+        "require_sector_match": RERANK_GATE_REQUIRE_SECTOR_MATCH,
+    }
@@ -0,0 +1,509 @@
+"""
+ReviveAI 輕量重新排序模型（由 GPT 重新排序的紀錄訓練）
+
+select_best_match 在閘門無法略過時呼叫 gpt_rerank_async，每次都是一筆「查詢 + 10 個候選 + GPT 選擇」
+的標註資料。此模組：
+
+- 把 GPT 重新排序的決策（候選 ID、距離與特徵，不含文件內容）寫入本地 JSONL，可設定取樣比例，
+  檔案超過大小上限時輪替；GPT 選到合併的近似重複候選時標記 collapsed，不作為訓練資料
+- 以 NumPy 訓練條件 logit 模型（候選間 softmax），特徵為 cosine distance、與第一名的距離差、排名、
+  詞彙重疊、產品類型是否一致、產業是否一致與碳足跡合理性
+- 模型檔案依版本號保存（rerank_model_v{N}.json），預設載入最新版本，也可用 RERANK_MODEL_VERSION 固定
+- serving 路徑在模型信心達到門檻時直接採用模型的選擇，否則照常呼叫 GPT 並記錄決策
+
+訓練：python rerank_model.py --log data/rerank_decisions.jsonl
+與 GPT 比較的準確率與延遲報告：benchmarks/eval_rerank_model.py
+"""
+
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import numpy as np
+from dotenv import load_dotenv
+from search_cache import normalize_query
+from sector_classifier import classify_by_keywords, detect_product_types
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 決策紀錄與模型設定
+RERANK_LOG_ENABLED = os.getenv("RERANK_LOG_ENABLED", "true").lower() == "true"
+RERANK_LOG_PATH = os.getenv("RERANK_LOG_PATH", os.path.join(_DATA_DIR, "rerank_decisions.jsonl"))
+RERANK_LOG_SAMPLE_RATE = float(os.getenv("RERANK_LOG_SAMPLE_RATE", "1.0"))  # 記錄的決策比例
+RERANK_LOG_MAX_BYTES = int(os.getenv("RERANK_LOG_MAX_BYTES", str(20 * 1024 * 1024)))  # 超過時輪替
+RERANK_LOG_BACKUPS = int(os.getenv("RERANK_LOG_BACKUPS", "3"))  # 保留的輪替檔數（.1 為最新）
+RERANK_LOG_QUEUE_SIZE = int(os.getenv("RERANK_LOG_QUEUE_SIZE", "256"))  # 等待寫入的決策上限，超過時捨棄
+RERANK_MODEL_ENABLED = os.getenv("RERANK_MODEL_ENABLED", "false").lower() == "true"
+RERANK_MODEL_DIR = os.getenv("RERANK_MODEL_DIR", os.path.join(_DATA_DIR, "rerank_models"))
+RERANK_MODEL_VERSION = os.getenv("RERANK_MODEL_VERSION", "")  # 空字串表示使用最新版本
+RERANK_MODEL_MIN_CONFIDENCE = float(os.getenv("RERANK_MODEL_MIN_CONFIDENCE", "0.8"))  # 模型選擇的機率門檻
+
+FEATURE_NAMES = (
+    "distance",
+    "distance_gap",
+    "rank",
+    "lexical_overlap",
+    "type_match",
+    "type_mismatch",
+    "sector_match",
+    "carbon_in_range",
+    "carbon_deviation",
+)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_MODEL_FILE_PATTERN = re.compile(r"rerank_model_v(\d+)\.json$")
+
+_stats = {
+    "predicted": 0,
+    "deferred": 0,
+    "logged": 0,
+    "sampled_out": 0,
+    "rotations": 0,
+    "log_errors": 0,
+    "log_dropped": 0,
+}
+_log_lock = threading.Lock()
+
+# serving 路徑的決策寫入：本行程專用的單一寫入執行緒與等待中的寫入（fork 後重新建立）
+_log_writer = None
+_log_writer_pid = None
+_pending_writes = set()
+_pending_lock = threading.Lock()
+
+
+def _tokens(text: str) -> set:
+    """英數詞彙（長度 2 以上），用於詞彙重疊"""
+    return {token for token in _TOKEN_PATTERN.findall(normalize_query(text)) if len(token) > 1}
+
+
+def candidate_features(product_description: str, args: dict, results: dict) -> np.ndarray:
+    """
+    計算單一查詢每個候選的特徵
+
+    Args:
+        product_description: 產品描述文字
+        args: plan_product_search 產生的搜尋參數
+        results: 單一查詢的向量搜尋結果（依距離排序）
+
+    Returns:
+        np.ndarray: 形狀為 (候選數, len(FEATURE_NAMES))
+    """
+    distances = [float(distance) for distance in results["distances"][0]]
+    metadatas = results["metadatas"][0]
+    documents = results["documents"][0]
+
+    keywords = classify_by_keywords(product_description)
+    query_type = keywords["product_type"] if keywords else None
+    expected_sector = args.get("sector") or (keywords["sector"] if keywords else None)
+    min_carbon = args.get("min_carbon_footprint")
+    max_carbon = args.get("max_carbon_footprint")
+    if min_carbon is None and max_carbon is None and keywords:
+        min_carbon, max_carbon = keywords["min_carbon_footprint"], keywords["max_carbon_footprint"]
+    query_tokens = _tokens(product_description) | _tokens(args.get("query_text") or "")
+
+    carbons = [float(metadata.get("carbon_footprint") or 0) for metadata in metadatas]
+    log_carbons = [math.log1p(max(carbon, 0.0)) for carbon in carbons]
+    median_log_carbon = float(np.median(log_carbons)) if log_carbons else 0.0
+
+    rows = []
+    last_rank = max(len(distances) - 1, 1)
+    for rank, (distance, metadata, document) in enumerate(zip(distances, metadatas, documents)):
+        text = f"{metadata.get('product_name', '')} {metadata.get('company', '')} {document or ''}"
+        candidate_tokens = _tokens(text)
+        candidate_types = detect_product_types(text)
+        carbon = carbons[rank]
+        in_range = (min_carbon is None or carbon >= min_carbon) and (max_carbon is None or carbon <= max_carbon)
+        rows.append((
+            distance,
+            distance - distances[0],
+            rank / last_rank,
+            len(query_tokens & candidate_tokens) / len(query_tokens) if query_tokens else 0.0,
+            float(query_type is not None and query_type in candidate_types),
+            float(query_type is not None and bool(candidate_types) and query_type not in candidate_types),
+            float(expected_sector is not None and metadata.get("sector") == expected_sector),
+            float(in_range),
+            abs(log_carbons[rank] - median_log_carbon),
+        ))
+    return np.asarray(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_NAMES))
+
+
+class LogisticReranker:
+    """
+    條件 logit 重新排序模型：每個候選的分數為標準化特徵的線性組合，候選間取 softmax
+
+    Args:
+        weights: 特徵權重
+        mean / std: 訓練資料的特徵平均與標準差（標準化用）
+        version: 模型版本號（save 時指定）
+        info: 訓練資訊（樣本數、準確率、訓練時間等）
+    """
+
+    def __init__(self, weights=None, mean=None, std=None, version: Optional[int] = None, info: dict = None):
+        dimension = len(FEATURE_NAMES)
+        self.weights = np.zeros(dimension) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.mean = np.zeros(dimension) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.std = np.ones(dimension) if std is None else np.asarray(std, dtype=np.float64)
+        self.version = version
+        self.info = info or {}
+
+    def fit(self, features: list, labels: list, epochs: int = 500, learning_rate: float = 0.5,
+            l2: float = 1e-3) -> "LogisticReranker":
+        """
+        以全批次梯度下降最小化交叉熵
+
+        Args:
+            features: 每個查詢的候選特徵矩陣（candidate_features 的輸出）
+            labels: 每個查詢中 GPT 選擇的候選索引
+        """
+        stacked = np.vstack(features)
+        self.mean = stacked.mean(axis=0)
+        self.std = stacked.std(axis=0)
+        self.std[self.std < 1e-9] = 1.0
+
+        # 候選數不同的查詢補齊到相同長度，補上的位置以遮罩排除
+        width = max(len(matrix) for matrix in features)
+        padded = np.zeros((len(features), width, len(FEATURE_NAMES)))
+        mask = np.zeros((len(features), width), dtype=bool)
+        for row, matrix in enumerate(features):
+            padded[row, :len(matrix)] = (matrix - self.mean) / self.std
+            mask[row, :len(matrix)] = True
+        targets = np.zeros((len(features), width))
+        targets[np.arange(len(labels)), labels] = 1.0
+
+        self.weights = np.zeros(len(FEATURE_NAMES))
+        for _ in range(epochs):
+            probabilities = self._softmax(padded @ self.weights, mask)
+            gradient = np.einsum("qc,qcf->f", probabilities - targets, padded) / len(features)
+            self.weights -= learning_rate * (gradient + l2 * self.weights)
+        return self
+
+    @staticmethod
+    def _softmax(scores: np.ndarray, mask: np.ndarray = None) -> np.ndarray:
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        exponents = np.exp(scores)
+        return exponents / exponents.sum(axis=-1, keepdims=True)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """回傳各候選為最佳匹配的機率"""
+        return self._softmax(((features - self.mean) / self.std) @ self.weights)
+
+    def predict(self, product_description: str, args: dict, results: dict) -> tuple:
+        """
+        Returns:
+            tuple: (最佳候選索引, 機率)
+        """
+        probabilities = self.predict_proba(candidate_features(product_description, args, results))
+        best_index = int(np.argmax(probabilities))
+        return best_index, float(probabilities[best_index])
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "features": list(FEATURE_NAMES),
+            "weights": self.weights.tolist(),
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "info": self.info,
+        }
+
+    def save(self, directory: str = RERANK_MODEL_DIR) -> str:
+        """以下一個版本號保存模型，回傳檔案路徑"""
+        os.makedirs(directory, exist_ok=True)
+        self.version = max(model_versions(directory), default=0) + 1
+        path = os.path.join(directory, f"rerank_model_v{self.version}.json")
+        with open(path, "w", encoding="utf-8") as model_file:
+            json.dump(self.to_dict(), model_file, ensure_ascii=False, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "LogisticReranker":
+        with open(path, encoding="utf-8") as model_file:
+            data = json.load(model_file)
+        if data.get("features") != list(FEATURE_NAMES):
+            raise ValueError(f"模型特徵與目前版本不符: {data.get('features')}")
+        return cls(data["weights"], data["mean"], data["std"], data.get("version"), data.get("info"))
+
+
+def model_versions(directory: str = RERANK_MODEL_DIR) -> list:
+    """列出目錄中已保存的模型版本號（由小到大）"""
+    versions = []
+    for path in glob.glob(os.path.join(directory, "rerank_model_v*.json")):
+        match = _MODEL_FILE_PATTERN.search(path)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def model_path(version: Optional[int] = None, directory: str = RERANK_MODEL_DIR) -> Optional[str]:
+    """指定版本（預設最新版本）的模型路徑；沒有任何模型時為 None"""
+    if version is None:
+        versions = model_versions(directory)
+        if not versions:
+            return None
+        version = versions[-1]
+    return os.path.join(directory, f"rerank_model_v{version}.json")
+
+
+def _rotate_log(path: str, backups: int):
+    """path → path.1 → path.2 …，超過保留數的最舊檔案刪除（呼叫端持有 _log_lock）"""
+    if backups <= 0:
+        os.remove(path)
+    else:
+        for number in range(backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{number}"):
+                os.replace(f"{path}.{number}", f"{path}.{number + 1}")
+        os.replace(path, f"{path}.1")
+    _stats["rotations"] += 1
+
+
+def log_rerank_decision(product_description: str, args: dict, results: dict, chosen_index: int,
+                        latency_ms: float, collapsed: bool = False, path: str = RERANK_LOG_PATH):
+    """
+    依取樣比例把一次 GPT 重新排序的決策附加到 JSONL 紀錄（同步寫檔，serving 路徑應在執行緒中呼叫）
+
+    紀錄合併前的完整候選清單（ID、距離與 candidate_features 的特徵），不含文件內容。
+
+    Args:
+        chosen_index: GPT 的選擇（原始搜尋結果的索引）
+        latency_ms: GPT 重新排序的延遲
+        collapsed: GPT 選到的是合併的近似重複候選（選擇展開為組內第一個，並非 GPT 確切選的成員）
+    """
+    if random.random() >= RERANK_LOG_SAMPLE_RATE:
+        _stats["sampled_out"] += 1
+        return
+    try:
+        record = {
+            "description": product_description,
+            "args": args,
+            "ids": list(results["ids"][0]),
+            "distances": [float(distance) for distance in results["distances"][0]],
+            "feature_names": list(FEATURE_NAMES),
+            "features": candidate_features(product_description, args, results).round(6).tolist(),
+            "rerank_index": chosen_index,
+            "collapsed": collapsed,
+            "rerank_latency_ms": round(latency_ms, 1),
+            "logged_at": time.time(),
+        }
+        line = json.dumps(record, ensure_ascii=False, default=float)
+        with _log_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) >= RERANK_LOG_MAX_BYTES:
+                _rotate_log(path, RERANK_LOG_BACKUPS)
+            with open(path, "a", encoding="utf-8") as log_file:
+                log_file.write(line + "\n")
+        _stats["logged"] += 1
+    except Exception as e:
+        _stats["log_errors"] += 1
+        logger.warning(f"寫入重新排序紀錄失敗: {str(e)}")
+
+
+def submit_rerank_decision(*args, **kwargs) -> bool:
+    """
+    在背景寫入執行緒排入一筆決策（參數同 log_rerank_decision），不等待寫入完成
+
+    等待寫入的決策達 RERANK_LOG_QUEUE_SIZE 時捨棄並計入 log_dropped；
+    寫入時的例外由完成回呼記錄。服務關閉時以 shutdown_rerank_log 寫完剩下的決策。
+
+    Returns:
+        bool: 是否已排入
+    """
+    global _log_writer, _log_writer_pid
+    with _pending_lock:
+        if _log_writer is None or _log_writer_pid != os.getpid():
+            _log_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank-log")
+            _log_writer_pid = os.getpid()
+            _pending_writes.clear()
+        if len(_pending_writes) >= RERANK_LOG_QUEUE_SIZE:
+            _stats["log_dropped"] += 1
+            return False
+        future = _log_writer.submit(log_rerank_decision, *args, **kwargs)
+        _pending_writes.add(future)
+    future.add_done_callback(_finish_write)
+    return True
+
+
+def _finish_write(future):
+    with _pending_lock:
+        _pending_writes.discard(future)
+    if not future.cancelled() and future.exception() is not None:
+        _stats["log_errors"] += 1
+        logger.warning(f"寫入重新排序紀錄失敗: {str(future.exception())}")
+
+
+def shutdown_rerank_log():
+    """寫完等待中的決策並關閉寫入執行緒（供 main.py 關閉時呼叫）"""
+    global _log_writer
+    with _pending_lock:
+        writer, _log_writer = _log_writer, None
+    if writer is not None and _log_writer_pid == os.getpid():
+        writer.shutdown(wait=True)
+
+
+def rerank_log_paths(path: str = RERANK_LOG_PATH) -> list:
+    """決策紀錄與其輪替檔（由舊到新），只列出存在的檔案"""
+    rotated = sorted(glob.glob(f"{glob.escape(path)}.[0-9]*"), key=lambda name: -int(name.rsplit(".", 1)[1]))
+    return rotated + ([path] if os.path.exists(path) else [])
+
+
+def case_features(case: dict) -> np.ndarray:
+    """案例的候選特徵：決策紀錄直接使用記錄的特徵，評估案例（含完整 results）則重新計算"""
+    if "features" in case:
+        return np.asarray(case["features"], dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+    return candidate_features(case["description"], case["args"], case["results"])
+
+
+def load_decisions(path: str = RERANK_LOG_PATH, include_collapsed: bool = False) -> list:
+    """
+    讀取決策紀錄或評估案例
+
+    略過沒有有效選擇的案例（例如代理案例中來源產品不在結果內）、特徵定義與目前版本不同的紀錄，
+    以及 GPT 選到合併候選的紀錄（include_collapsed 為 True 時保留）
+    """
+    cases = []
+    with open(path, encoding="utf-8") as log_file:
+        for line in log_file:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "features" in case and case.get("feature_names") != list(FEATURE_NAMES):
+                continue
+            if case.get("collapsed") and not include_collapsed:
+                continue
+            ids = case["ids"] if "ids" in case else case["results"]["ids"][0]
+            if 0 <= case.get("rerank_index", -1) < len(ids):
+                cases.append(case)
+    return cases
+
+
+def train_rerank_model(cases: list, holdout: float = 0.2, seed: int = 42, **fit_options) -> tuple:
+    """
+    以決策紀錄訓練模型，保留部分案例評估與 GPT 選擇的一致率
+
+    Returns:
+        tuple: (模型, {"train_cases", "test_cases", "test_accuracy", "top1_accuracy"})
+    """
+    features = [case_features(case) for case in cases]
+    labels = [case["rerank_index"] for case in cases]
+    order = np.random.default_rng(seed).permutation(len(cases))
+    test_size = int(len(cases) * holdout)
+    test_rows, train_rows = order[:test_size], order[test_size:]
+
+    model = LogisticReranker().fit([features[row] for row in train_rows], [labels[row] for row in train_rows],
+                                   **fit_options)
+    metrics = {"train_cases": len(train_rows), "test_cases": test_size}
+    if test_size:
+        predictions = [int(np.argmax(model.predict_proba(features[row]))) for row in test_rows]
+        metrics["test_accuracy"] = round(float(np.mean([predictions[i] == labels[row]
+                                                        for i, row in enumerate(test_rows)])), 4)
+        metrics["top1_accuracy"] = round(float(np.mean([labels[row] == 0 for row in test_rows])), 4)
+    model.info = {**metrics, "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return model, metrics
+
+
+# 行程內共用的模型（載入失敗時記錄為 None，不重複嘗試）
+_model = None
+_model_loaded = False
+
+
+def get_rerank_model() -> Optional[LogisticReranker]:
+    """取得 serving 使用的模型；沒有模型檔案或載入失敗時為 None"""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        path = model_path(int(RERANK_MODEL_VERSION) if RERANK_MODEL_VERSION else None)
+        if path is not None and os.path.exists(path):
+            try:
+                _model = LogisticReranker.load(path)
+                logger.info(f"已載入重新排序模型 v{_model.version}: {path}")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"載入重新排序模型失敗，改用 GPT 重新排序: {str(e)}")
+    return _model
+
+
+def predict_rerank(product_description: str, args: dict, results: dict) -> Optional[dict]:
+    """
+    serving 路徑使用：模型信心達到門檻時回傳選擇，否則為 None（交給 GPT）
+
+    Returns:
+        dict: {"best_match_index", "reason", "model_version", "confidence"} 或 None
+    """
+    if not RERANK_MODEL_ENABLED:
+        return None
+    model = get_rerank_model()
+    if model is None:
+        return None
+    best_index, confidence = model.predict(product_description, args, results)
+    if confidence < RERANK_MODEL_MIN_CONFIDENCE:
+        _stats["deferred"] += 1
+        return None
+    _stats["predicted"] += 1
+    return {
+        "best_match_index": best_index,
+        "reason": f"重新排序模型 v{model.version} 選擇（信心 {confidence:.2f}），略過 GPT 重新排序",
+        "model_version": model.version,
+        "confidence": round(confidence, 4),
+    }
+
+
+def get_rerank_model_stats() -> dict:
+    """回傳模型採用比例、紀錄筆數與目前設定"""
+    checked = _stats["predicted"] + _stats["deferred"]
+    return {
+        **_stats,
+        "predict_rate": round(_stats["predicted"] / checked, 4) if checked else 0.0,
+        "enabled": RERANK_MODEL_ENABLED,
+        "log_enabled": RERANK_LOG_ENABLED,
+        "log_sample_rate": RERANK_LOG_SAMPLE_RATE,
+        "log_pending": len(_pending_writes),
+        "model_version": _model.version if _model is not None else None,
+        "min_confidence": RERANK_MODEL_MIN_CONFIDENCE,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以 GPT 重新排序紀錄訓練輕量重新排序模型")
+    parser.add_argument("--log", action="append",
+                        help=f"決策紀錄 JSONL，可多次指定（預設 {RERANK_LOG_PATH} 與其輪替檔）")
+    parser.add_argument("--model-dir", default=RERANK_MODEL_DIR, help="模型版本目錄")
+    parser.add_argument("--holdout", type=float, default=0.2, help="保留評估的案例比例")
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--include-collapsed", action="store_true", help="也使用 GPT 選到合併候選的紀錄")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示評估結果，不保存模型")
+    args = parser.parse_args()
+
+    paths = args.log or rerank_log_paths()
+    cases = [case for path in paths for case in load_decisions(path, include_collapsed=args.include_collapsed)]
+    if len(cases) < 10:
+        parser.error(f"決策紀錄只有 {len(cases)} 筆，至少需要 10 筆才能訓練")
+
+    model, metrics = train_rerank_model(cases, holdout=args.holdout, seed=args.seed, epochs=args.epochs,
+                                        learning_rate=args.learning_rate, l2=args.l2)
+    print(f"訓練 {metrics['train_cases']} 筆、評估 {metrics['test_cases']} 筆")
+    if metrics["test_cases"]:
+        print(f"與 GPT 選擇的一致率：模型 {metrics['test_accuracy']:.3f}，直接採用第一名 {metrics['top1_accuracy']:.3f}")
+    for name, weight in zip(FEATURE_NAMES, model.weights):
+        print(f"  {name:>16}: {weight:+.3f}")
+    if not args.dry_run:
+        print(f"模型已保存：{model.save(args.model_dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+ReviveAI 產品搜尋報告快取
+
+熱門商品（MacBook Air M1、iPad、Switch 等）會以幾乎相同的查詢重複搜尋，
+每次都要重做 Brave 搜尋、網頁抓取與 LLM 摘要。此模組快取最終報告文字：
+
+- 兩層快取：行程內 LRU + 磁碟 SQLite（多個 worker 與重啟之間共用）
+- 以正規化後的查詢為鍵
+- TTL 內直接回傳；超過 TTL 但仍在過期容忍期內時先回傳舊資料，並於背景重新整理
+  （stale-while-revalidate）
+- 提供命中/未命中統計
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+# 快取設定
+SEARCH_CACHE_PATH = os.getenv(
+    "SEARCH_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search_cache.sqlite3")
+)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))  # 新鮮期（秒）
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", str(7 * 24 * 3600)))  # 可回傳舊資料的最長期限（秒）
+SEARCH_CACHE_MEMORY_SIZE = int(os.getenv("SEARCH_CACHE_MEMORY_SIZE", "256"))
+
+
+def normalize_query(query: str) -> str:
+    """
+    正規化查詢字串：全形轉半形、轉小寫、合併空白、移除頭尾標點
+
+    Args:
+        query: 原始查詢
+
+    Returns:
+        str: 正規化後的查詢
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" .,;:!?'\"，。；：！？、")
+
+
+class SearchReportCache:
+    """
+    搜尋報告的兩層快取
+
+    lookup() 回傳 (報告文字, 狀態)，狀態為 "hit"（新鮮）、"stale"（過期但可用）或 None（未命中）。
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL,
+                 stale_ttl: float = SEARCH_CACHE_STALE_TTL, memory_size: int = SEARCH_CACHE_MEMORY_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_tasks = set()  # 保留背景任務的參照，避免執行中被回收
+        self._db = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+    def _connect(self):
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_reports ("
+                "key TEXT PRIMARY KEY, query TEXT, text TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    @staticmethod
+    def make_key(query: str) -> str:
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+    def _get_entry(self, key: str):
+        """依序查詢記憶體與 SQLite，回傳 (text, created_at) 或 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, "memory"
+            try:
+                row = self._connect().execute(
+                    "SELECT text, created_at FROM search_reports WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"讀取搜尋快取失敗: {str(e)}")
+                row = None
+            if row is None:
+                return None, None
+            self._remember(key, (row[0], row[1]))
+            return (row[0], row[1]), "disk"
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def lookup(self, query: str):
+        """
+        查詢快取
+
+        Returns:
+            tuple: (報告文字, "hit" | "stale")；未命中或已超過過期容忍期時為 (None, None)
+        """
+        entry, source = self._get_entry(self.make_key(query))
+        if entry is None:
+            self.stats["misses"] += 1
+            return None, None
+
+        text, created_at = entry
+        age = time.time() - created_at
+        if age <= self.ttl:
+            self.stats["memory_hits" if source == "memory" else "disk_hits"] += 1
+            return text, "hit"
+        if age <= self.stale_ttl:
+            self.stats["stale_hits"] += 1
+            return text, "stale"
+
+        self.stats["misses"] += 1
+        return None, None
+
+    def store(self, query: str, text: str):
+        """寫入兩層快取（空白報告不寫入）"""
+        if not text or not text.strip():
+            return
+        key = self.make_key(query)
+        entry = (text, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO search_reports (key, query, text, created_at) VALUES (?, ?, ?, ?)",
+                    (key, normalize_query(query)[:200], entry[0], entry[1])
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"寫入搜尋快取失敗: {str(e)}")
+
+    def refresh_in_background(self, query: str, compute):
+        """
+        在背景重新計算報告並更新快取；同一查詢同時只會有一個重新整理任務
+
+        Args:
+            query: 查詢字串
+            compute: 無參數的非同步函數，回傳新的報告文字
+        """
+        key = self.make_key(query)
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                await asyncio.to_thread(self.store, query, await compute())
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["refresh_failures"] += 1
+                logger.warning(f"背景更新搜尋快取失敗: {str(e)}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def get_stats(self) -> dict:
+        """回傳命中統計與命中率"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["stale_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+# 行程內共用的快取實例（fork 出的子行程不沿用父行程的 SQLite 連線，重新建立）
+_search_cache = None
+_search_cache_pid = None
+
+
+def get_search_cache() -> SearchReportCache:
+    """取得行程內共用的搜尋報告快取"""
+    global _search_cache, _search_cache_pid
+    if _search_cache is None or _search_cache_pid != os.getpid():
+        _search_cache = SearchReportCache()
+        _search_cache_pid = os.getpid()
+    return _search_cache
@@ -0,0 +1,182 @@
+"""
+ReviveAI 搜尋參數快取（依產品類型）
+
+plan_product_search 的 function calling 結果（query_text、sector、碳足跡範圍）幾乎只取決於產品類型：
+各種規格的 MacBook Air 都會得到相同的參數。此模組以 sector_classifier.canonical_product_key
+（品牌 + 型號系列 + 產品類型，去除規格）為鍵快取 LLM 產生的參數，相同產品類型再次出現時不必呼叫 LLM：
+
+- 兩層快取：行程內 LRU + 磁碟 SQLite（多個 worker 與重啟之間共用）
+- 超過 TTL 的參數視為未命中並重新產生
+- 提供命中/未命中統計
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+# 快取設定
+SEARCH_PARAMS_CACHE_ENABLED = os.getenv("SEARCH_PARAMS_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_PARAMS_CACHE_PATH = os.getenv(
+    "SEARCH_PARAMS_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search_params_cache.sqlite3")
+)
+SEARCH_PARAMS_CACHE_TTL = float(os.getenv("SEARCH_PARAMS_CACHE_TTL", str(30 * 24 * 3600)))  # 有效期（秒）
+SEARCH_PARAMS_CACHE_MEMORY_SIZE = int(os.getenv("SEARCH_PARAMS_CACHE_MEMORY_SIZE", "1024"))
+
+# 鍵格式版本：canonical_product_key 的格式改變時遞增，舊格式的項目（例如配件與主產品共用的鍵）不再命中
+SEARCH_PARAMS_KEY_VERSION = 2
+
+# 參數欄位（與 plan_product_search 的 function 定義相同）
+SEARCH_PARAM_FIELDS = ("query_text", "min_carbon_footprint", "max_carbon_footprint", "sector")
+
+
+class SearchParamsCache:
+    """
+    以產品類型鍵快取搜尋參數
+
+    lookup() 回傳參數字典的副本或 None；store() 只保存 SEARCH_PARAM_FIELDS 欄位。
+    """
+
+    def __init__(self, path: str = SEARCH_PARAMS_CACHE_PATH, ttl: float = SEARCH_PARAMS_CACHE_TTL,
+                 memory_size: int = SEARCH_PARAMS_CACHE_MEMORY_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+            "unkeyed": 0,
+        }
+
+    def _connect(self):
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_params ("
+                "key TEXT PRIMARY KEY, params TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_entry(self, key: str):
+        """依序查詢記憶體與 SQLite，回傳 ((params, created_at), 來源) 或 (None, None)"""
+        key = f"v{SEARCH_PARAMS_KEY_VERSION}:{key}"
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, "memory"
+            try:
+                row = self._connect().execute(
+                    "SELECT params, created_at FROM search_params WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"讀取搜尋參數快取失敗: {str(e)}")
+                row = None
+            if row is None:
+                return None, None
+            entry = (json.loads(row[0]), row[1])
+            self._remember(key, entry)
+            return entry, "disk"
+
+    def contains(self, key: Optional[str]) -> bool:
+        """是否有未過期的參數（不計入統計）"""
+        if key is None:
+            return False
+        entry, _ = self._get_entry(key)
+        return entry is not None and time.time() - entry[1] <= self.ttl
+
+    def lookup(self, key: Optional[str]) -> Optional[dict]:
+        """
+        查詢快取
+
+        Args:
+            key: canonical_product_key 產生的鍵；None 表示描述無法歸類，不查詢
+
+        Returns:
+            dict: 搜尋參數的副本；未命中或已過期時為 None
+        """
+        if key is None:
+            self.stats["unkeyed"] += 1
+            return None
+        entry, source = self._get_entry(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        params, created_at = entry
+        if time.time() - created_at > self.ttl:
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.stats[f"{source}_hits"] += 1
+        return dict(params)
+
+    def store(self, key: Optional[str], params: dict):
+        """寫入兩層快取（沒有鍵或缺少欄位時不寫入）"""
+        if key is None or any(field not in params for field in SEARCH_PARAM_FIELDS):
+            return
+        entry = ({field: params[field] for field in SEARCH_PARAM_FIELDS}, time.time())
+        key = f"v{SEARCH_PARAMS_KEY_VERSION}:{key}"
+        with self._lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO search_params (key, params, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(entry[0], ensure_ascii=False), entry[1])
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"寫入搜尋參數快取失敗: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """回傳命中統計與命中率"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": SEARCH_PARAMS_CACHE_ENABLED,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+# 行程內共用的快取實例（fork 出的子行程不沿用父行程的 SQLite 連線，重新建立）
+_search_params_cache = None
+_search_params_cache_pid = None
+
+
+def get_search_params_cache() -> SearchParamsCache:
+    """取得行程內共用的搜尋參數快取"""
+    global _search_params_cache, _search_params_cache_pid
+    if _search_params_cache is None or _search_params_cache_pid != os.getpid():
+        _search_params_cache = SearchParamsCache()
+        _search_params_cache_pid = os.getpid()
+    return _search_params_cache
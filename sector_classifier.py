@@ -0,0 +1,479 @@
+"""
+ReviveAI 的本地產業分類器
+
+ai_search_products 的第一步原本是一次 gpt-4.1-nano function calling，只為了從產品描述
+取出 query_text、sector 與碳足跡範圍，而這些決定幾乎都是對照系統提示中的產品類型提示表。
+此模組在本機完成同樣的判斷：
+
+1. 關鍵字字典樹：以中英文產品類型詞彙（取自 plan_product_search 的提示表）做最長比對，
+   直接得到產業分類與碳足跡範圍，不需要任何 API 呼叫
+2. 產業中心向量：關鍵字無法判斷時，以描述的嵌入向量與資料庫各產業的平均向量比較，
+   依第一名與第二名的相似度差距估計信心
+
+信心低於門檻時才交給 LLM；各來源的處理次數與本機處理比例由 get_sector_classifier_stats() 回報。
+canonical_product_key 另外產生「品牌 + 型號系列 + 產品類型」的鍵，供 search_params_cache 共用 LLM 產生的參數。
+"""
+
+import os
+import re
+import unicodedata
+import numpy as np
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+SECTOR_CLASSIFIER_ENABLED = os.getenv("SECTOR_CLASSIFIER_ENABLED", "true").lower() == "true"
+SECTOR_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("SECTOR_CLASSIFIER_MIN_CONFIDENCE", "0.75"))
+# 中心向量第一名與第二名的相似度差距達到此值時，信心剛好等於預設門檻 0.75
+SECTOR_CENTROID_MARGIN = float(os.getenv("SECTOR_CENTROID_MARGIN", "0.05"))
+
+COMPUTER = "Computer, IT & telecom"
+FOOD = "Food & Beverage"
+AUTOMOBILES = "Automobiles & components"
+CHEMICALS = "Chemicals"
+CONSTRUCTION = "Construction & commercial materials"
+HOME = "Home durables, textiles, & equipment"
+
+# 產品類型：(關鍵字, 英文搜尋詞, 產業分類, 最小碳足跡, 最大碳足跡)
+# 碳足跡範圍與 plan_product_search 系統提示中的參考值一致
+PRODUCT_TYPES = [
+    (("智慧型手機", "智慧手機", "手機", "smartphone", "iphone", "mobile phone", "cell phone"),
+     "smartphone", COMPUTER, 30, None),
+    (("筆記型電腦", "筆電", "laptop", "notebook", "macbook", "chromebook", "ultrabook"),
+     "laptop", COMPUTER, 100, None),
+    (("桌上型電腦", "桌機", "desktop", "imac", "mac mini", "all-in-one pc"),
+     "desktop computer", COMPUTER, 200, None),
+    (("平板電腦", "平板", "tablet", "ipad"), "tablet", COMPUTER, 50, None),
+    (("顯示器", "螢幕", "monitor", "display"), "monitor", COMPUTER, 200, None),
+    (("印表機", "事務機", "printer"), "printer", COMPUTER, 100, None),
+    (("咖啡", "coffee"), "coffee", FOOD, 0.5, None),
+    (("巧克力", "chocolate"), "chocolate", FOOD, 0.2, None),
+    (("瓶裝水", "礦泉水", "bottled water", "mineral water"), "bottled water", FOOD, 0.1, None),
+    (("牛肉", "豬肉", "雞肉", "肉品", "beef", "pork", "chicken", "meat"), "meat", FOOD, 5, None),
+    (("餅乾", "洋芋片", "泡麵", "零食", "snack", "biscuit", "cookie", "chips"), "packaged food", FOOD, 0.5, None),
+    (("電動車", "電動汽車", "electric vehicle", "electric car", "tesla"), "electric vehicle", AUTOMOBILES, 8000, None),
+    (("轎車", "汽車", "休旅車", "sedan", "suv", "car"), "car", AUTOMOBILES, 5000, None),
+    (("自行車", "腳踏車", "單車", "bicycle", "bike"), "bicycle", AUTOMOBILES, 50, None),
+    (("輪胎", "汽車零件", "煞車", "tire", "tyre", "brake", "car parts"), "auto parts", AUTOMOBILES, 10, None),
+    (("洗碗精", "洗衣精", "清潔劑", "漂白水", "detergent", "cleaner", "bleach"), "cleaning product", CHEMICALS, 0.5, None),
+    (("洗髮精", "沐浴乳", "乳液", "牙膏", "shampoo", "body wash", "lotion", "toothpaste"),
+     "personal care product", CHEMICALS, 0.3, None),
+    (("油漆", "塗料", "paint", "coating"), "paint", CHEMICALS, 1, None),
+    (("水泥", "混凝土", "cement", "concrete"), "cement", CONSTRUCTION, 0.5, None),
+    (("鋼材", "鋼筋", "鋼板", "steel"), "steel", CONSTRUCTION, 1, None),
+    (("木材", "木板", "合板", "lumber", "timber", "plywood"), "timber", CONSTRUCTION, 0.2, None),
+    (("沙發", "椅子", "辦公椅", "桌子", "書桌", "衣櫃", "床架", "家具",
+      "sofa", "chair", "table", "desk", "wardrobe", "furniture"), "furniture", HOME, 20, 100),
+    (("冰箱", "洗衣機", "微波爐", "電鍋", "烤箱", "洗碗機", "咖啡機",
+      "refrigerator", "fridge", "washing machine", "microwave", "oven", "dishwasher", "coffee machine"),
+     "kitchen appliance", HOME, 50, 300),
+    (("衣服", "上衣", "襯衫", "外套", "褲子", "牛仔褲", "洋裝",
+      "t-shirt", "shirt", "jacket", "jeans", "pants", "dress", "clothing"), "clothing", HOME, 5, 30),
+    (("鞋子", "球鞋", "運動鞋", "皮鞋", "靴子", "shoes", "sneakers", "boots"), "shoes", HOME, 10, 30),
+]
+
+# 配件或周邊詞彙：描述主體可能不是比對到的產品類型，降低信心交給 LLM 判斷
+ACCESSORY_TERMS = (
+    "殼", "保護貼", "保護套", "充電器", "充電線", "傳輸線", "支架", "貼膜", "鍵盤", "滑鼠", "耳機", "墨水", "碳粉",
+    "case", "cover", "charger", "cable", "stand", "screen protector", "keyboard", "mouse", "earphone",
+    "headphone", "ink", "toner",
+)
+ACCESSORY_PENALTY = 0.5
+
+# 品牌：正規化名稱 → 中英文別名（canonical_product_key 使用）
+BRANDS = {
+    "apple": ("apple", "蘋果"),
+    "samsung": ("samsung", "三星"),
+    "google": ("google",),
+    "microsoft": ("microsoft", "微軟"),
+    "sony": ("sony", "索尼"),
+    "lg": ("lg",),
+    "asus": ("asus", "華碩"),
+    "acer": ("acer", "宏碁"),
+    "lenovo": ("lenovo", "聯想"),
+    "dell": ("dell", "戴爾"),
+    "hp": ("hp", "惠普"),
+    "msi": ("msi", "微星"),
+    "xiaomi": ("xiaomi", "小米"),
+    "huawei": ("huawei", "華為"),
+    "oppo": ("oppo",),
+    "vivo": ("vivo",),
+    "nokia": ("nokia",),
+    "benq": ("benq", "明基"),
+    "canon": ("canon", "佳能"),
+    "epson": ("epson", "愛普生"),
+    "brother": ("brother",),
+    "philips": ("philips", "飛利浦"),
+    "panasonic": ("panasonic", "國際牌"),
+    "hitachi": ("hitachi", "日立"),
+    "tatung": ("tatung", "大同"),
+    "dyson": ("dyson",),
+    "toyota": ("toyota", "豐田"),
+    "honda": ("honda", "本田"),
+    "tesla": ("tesla", "特斯拉"),
+    "giant": ("giant", "捷安特"),
+    "ikea": ("ikea",),
+    "nike": ("nike",),
+    "adidas": ("adidas", "愛迪達"),
+    "uniqlo": ("uniqlo",),
+}
+# 型號系列詞可推得的品牌與產品類型（None 表示該系列涵蓋多種產品類型）
+_FAMILIES = {
+    "iphone": ("apple", "smartphone"), "ipad": ("apple", "tablet"),
+    "macbook": ("apple", "laptop"), "imac": ("apple", "desktop computer"),
+    "galaxy": ("samsung", None), "pixel": ("google", "smartphone"), "surface": ("microsoft", None),
+    "xperia": ("sony", "smartphone"), "redmi": ("xiaomi", "smartphone"),
+    "thinkpad": ("lenovo", "laptop"), "ideapad": ("lenovo", "laptop"),
+    "zenbook": ("asus", "laptop"), "vivobook": ("asus", "laptop"),
+    "xps": ("dell", "laptop"), "inspiron": ("dell", None), "latitude": ("dell", "laptop"),
+    "pavilion": ("hp", None), "elitebook": ("hp", "laptop"), "spectre": ("hp", "laptop"), "envy": ("hp", None),
+}
+# 不屬於型號系列的詞：顏色、成色、包裝
+_KEY_STOP_WORDS = {
+    "black", "white", "silver", "gray", "grey", "gold", "rose", "blue", "red", "green", "pink", "purple",
+    "space", "midnight", "starlight", "graphite", "clear", "transparent",
+    "used", "new", "like", "mint", "good", "excellent", "condition", "original", "box", "unlocked",
+    "second-hand", "secondhand", "refurbished",
+    "and", "or", "the", "for", "of", "set",
+}
+# 涵蓋多種不同物品的產品類型（沙發與書桌都是 furniture）：鍵使用比對到的關鍵字而非產品類型
+_GENERIC_TYPES = {
+    "meat", "packaged food", "auto parts", "cleaning product", "personal care product",
+    "furniture", "kitchen appliance", "clothing",
+}
+# 型號系列最多保留的詞數
+KEY_FAMILY_WORDS = 3
+# 這些產品類型的型號後單獨的 10~34 通常是螢幕吋數（"MacBook Air 13"、"XPS 13"），不屬於型號系列
+_SCREEN_SIZE_TYPES = {"laptop", "tablet", "monitor", "desktop computer"}
+_SCREEN_SIZE_PATTERN = re.compile(r"^(1\d|2\d|3[0-4])$")
+
+# 去除規格後的搜尋詞不保留的詞：容量、尺寸、年份等（單獨的數字通常是型號，予以保留）
+_SPEC_PATTERN = re.compile(
+    r"^(\d+(\.\d+)?(gb|g|tb|t|mb|mah|w|mm|cm|kg|ml|l|hz|inch|吋|寸|核|代|年)|"
+    r"(19|20)\d{2}|\d+(\.\d+)?x\d+(\.\d+)?)$",
+    re.IGNORECASE,
+)
+_WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-\.+]*(吋|寸|核|代|年)?", re.IGNORECASE)
+_ASCII_WORD_CHAR = re.compile(r"[a-z0-9]")
+# 附屬說明（例如 "laptop with 4K display"、「筆電附螢幕」）之後的詞彙不決定產品類型
+_FEATURE_CLAUSE_PATTERN = re.compile(r"\s(with|w/|incl\.?|including)\s|搭配|附贈|附|含", re.IGNORECASE)
+
+_stats = {
+    "requests": 0,
+    "keyword": 0,
+    "centroid": 0,
+    "llm_fallbacks": 0,
+}
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").casefold()
+
+
+class _KeywordTrie:
+    """以字元為節點的字典樹，回傳文字中所有不重疊的最長比對"""
+
+    _END = object()
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, keyword: str, value):
+        node = self._root
+        for char in _normalize(keyword):
+            node = node.setdefault(char, {})
+        node[self._END] = value
+
+    @staticmethod
+    def _is_boundary(text: str, position: int) -> bool:
+        return position < 0 or position >= len(text) or not _ASCII_WORD_CHAR.match(text[position])
+
+    def find_all(self, text: str) -> list:
+        """
+        Returns:
+            list: (關鍵字, 值) 列表；英文關鍵字必須落在單字邊界上（允許複數 s）
+        """
+        text = _normalize(text)
+        matches = []
+        position = 0
+        while position < len(text):
+            node = self._root
+            best = None
+            end = position
+            while end < len(text) and text[end] in node:
+                node = node[text[end]]
+                end += 1
+                if self._END in node:
+                    keyword = text[position:end]
+                    if not keyword.isascii():
+                        best = (end, node[self._END])
+                        continue
+                    after = end + 1 if end < len(text) and text[end] == "s" else end
+                    if self._is_boundary(text, position - 1) and self._is_boundary(text, after):
+                        best = (after, node[self._END])
+            if best:
+                matches.append((text[position:best[0]], best[1]))
+                position = best[0]
+            else:
+                position += 1
+        return matches
+
+
+def _build_trie() -> _KeywordTrie:
+    trie = _KeywordTrie()
+    for product_type in PRODUCT_TYPES:
+        for keyword in product_type[0]:
+            trie.add(keyword, product_type)
+    return trie
+
+
+_product_trie = _build_trie()
+_accessory_trie = _KeywordTrie()
+for _term in ACCESSORY_TERMS:
+    _accessory_trie.add(_term, _term)
+_brand_trie = _KeywordTrie()
+for _brand, _aliases in BRANDS.items():
+    for _alias in _aliases:
+        _brand_trie.add(_alias, _brand)
+_PRODUCT_TYPES_BY_TERM = {product_type[1]: product_type for product_type in PRODUCT_TYPES}
+# 配件詞本身（case、charger 等）由鍵的配件標記表示，不放進型號系列
+_ACCESSORY_WORDS = {term for term in ACCESSORY_TERMS if term.isascii() and " " not in term}
+_BRAND_WORDS = {alias for aliases in BRANDS.values() for alias in aliases if alias.isascii()}
+# 產品類型本身的英文詞（laptop、notebook 等）已由鍵的產品類型表示
+_TYPE_WORDS = {
+    keyword for product_type in PRODUCT_TYPES for keyword in (*product_type[0], product_type[1])
+    if keyword.isascii() and " " not in keyword
+}
+
+
+def build_query_text(description: str, search_term: str) -> str:
+    """
+    以描述中的品牌與型號詞加上英文產品類型組成搜尋詞，去除容量、尺寸、年份等規格
+
+    Args:
+        description: 產品描述，例如 "macbook air 13吋 2020 16G 512G 筆記型電腦"
+        search_term: 英文產品類型，例如 "laptop"
+
+    Returns:
+        str: 搜尋詞，例如 "macbook air laptop"
+    """
+    words = []
+    for match in _WORD_PATTERN.finditer(_normalize(description)):
+        word = match.group(0).strip("-.+")
+        if not word or _SPEC_PATTERN.match(word) or word in words:
+            continue
+        words.append(word)
+    if search_term not in " ".join(words):
+        words.append(search_term)
+    return " ".join(words)
+
+
+def detect_product_types(text: str) -> list:
+    """
+    列出文字中出現的產品類型
+
+    Args:
+        text: 產品描述或資料庫產品名稱
+
+    Returns:
+        list: 英文產品類型（例如 "laptop"），依出現順序、不重複
+    """
+    return list(dict.fromkeys(product_type[1] for _, product_type in _product_trie.find_all(text)))
+
+
+def canonical_product_key(description: str) -> str:
+    """
+    產品類型的正規化鍵：品牌 + 型號系列 + 英文產品類型，去除容量、尺寸、年份、顏色與成色
+
+    同一系列的不同規格（例如各種 MacBook Air 13 吋 2020 的記憶體與容量組合）得到相同的鍵，
+    function calling 產生的搜尋參數可依此共用。
+
+    Args:
+        description: 產品描述，例如 "Apple MacBook Air 13吋 2020 16G 512G 太空灰 筆記型電腦"
+
+    主體出現配件詞時（「iPhone 13 手機殼」）鍵的最後加上配件標記（"apple|iphone 13|smartphone|殼"），
+    配件與其主產品不共用搜尋參數。
+
+    Returns:
+        str: 例如 "apple|macbook air|laptop"；沒有產品類型、品牌與型號都沒有、
+             或主體同時出現多種產品類型時為 None
+    """
+    head = _FEATURE_CLAUSE_PATTERN.split(_normalize(description), maxsplit=1)[0]
+    words = []
+    for match in _WORD_PATTERN.finditer(head):
+        word = match.group(0).strip("-.+")
+        if word and not _SPEC_PATTERN.match(word) and word not in words and word not in _KEY_STOP_WORDS \
+                and word not in _ACCESSORY_WORDS:
+            words.append(word)
+
+    # 產品類型：關鍵字優先，沒有時由型號系列推得（zenbook → laptop）
+    matches = _product_trie.find_all(head)
+    if len({product_type for _, product_type in matches}) > 1:
+        return None
+    if matches:
+        keyword, product_type = max(matches, key=lambda match: len(match[0]))
+    else:
+        terms = {_FAMILIES[word][1] for word in words if word in _FAMILIES}
+        if len(terms) != 1 or None in terms:
+            return None
+        product_type = _PRODUCT_TYPES_BY_TERM[terms.pop()]
+        keyword = product_type[1]
+    item = keyword if product_type[1] in _GENERIC_TYPES else product_type[1]
+
+    brand = None
+    for _, canonical in _brand_trie.find_all(head):
+        brand = brand or canonical
+    family = []
+    for word in words:
+        if word in _BRAND_WORDS:
+            continue
+        # 型號系列詞也能推得品牌（iphone → apple）
+        if word in _FAMILIES:
+            brand = brand or _FAMILIES[word][0]
+        elif word in _TYPE_WORDS or product_type[1] in _SCREEN_SIZE_TYPES and _SCREEN_SIZE_PATTERN.match(word):
+            continue
+        family.append(word)
+    family = family[:KEY_FAMILY_WORDS]
+    if brand is None and not family:
+        return None
+    key = f"{brand or ''}|{' '.join(family)}|{item}"
+    accessories = _accessory_trie.find_all(head)
+    if accessories:
+        key += f"|{max((term for _, term in accessories), key=len)}"
+    return key
+
+
+def classify_by_keywords(description: str) -> dict:
+    """
+    以關鍵字字典樹判斷產品類型
+
+    只看附屬說明之前的主體；多個產品類型同時出現時，以比對到的關鍵字總長度計分，
+    信心為最高分所佔比例；描述中含有配件詞彙時信心減半。
+
+    Args:
+        description: 產品描述
+
+    Returns:
+        dict: {"query_text", "sector", "min_carbon_footprint", "max_carbon_footprint",
+               "product_type", "confidence"}，沒有比對到任何產品類型時為 None
+    """
+    head = _FEATURE_CLAUSE_PATTERN.split(_normalize(description), maxsplit=1)[0]
+    matches = _product_trie.find_all(head) or _product_trie.find_all(description)
+    if not matches:
+        return None
+    if len(head.strip()) < len(description.strip()) and _product_trie.find_all(head):
+        description = head
+
+    scores = {}
+    for keyword, product_type in matches:
+        scores[product_type] = scores.get(product_type, 0) + len(keyword)
+    product_type, score = max(scores.items(), key=lambda item: item[1])
+    # 同產業的其他產品類型（例如「筆電」與「螢幕」）不算衝突
+    total = sum(value for other, value in scores.items() if other is product_type or other[2] != product_type[2])
+    confidence = 0.95 * score / total
+    if _accessory_trie.find_all(description):
+        confidence *= ACCESSORY_PENALTY
+
+    _, search_term, sector, min_carbon, max_carbon = product_type
+    return {
+        "query_text": build_query_text(description, search_term),
+        "sector": sector,
+        "min_carbon_footprint": min_carbon,
+        "max_carbon_footprint": max_carbon,
+        "product_type": search_term,
+        "confidence": round(confidence, 4),
+    }
+
+
+class SectorCentroids:
+    """
+    資料庫各產業的平均嵌入向量
+
+    Args:
+        embeddings: (N, D) 已正規化的嵌入向量
+        sectors: 與 embeddings 對應的產業分類
+    """
+
+    def __init__(self, embeddings, sectors):
+        sectors = np.asarray(sectors, dtype=object)
+        self.sectors = sorted({sector for sector in sectors if sector})
+        centroids = np.stack([np.asarray(embeddings)[sectors == sector].mean(axis=0) for sector in self.sectors])
+        self.centroids = (centroids / np.linalg.norm(centroids, axis=1, keepdims=True)).astype(np.float32)
+
+    @classmethod
+    def from_index(cls, index) -> "SectorCentroids":
+        """從 NumpyVectorIndex 或 PartitionedVectorIndex 建立"""
+        partitions = getattr(index, "partitions", None)
+        if partitions is None:
+            return cls(index.embeddings, [metadata.get("sector") for metadata in index.metadatas])
+        # 分區索引的每個分區就是一個產業，直接以分區平均向量建立
+        centroids = cls.__new__(cls)
+        centroids.sectors = sorted(sector for sector in partitions if sector)
+        means = np.stack([partitions[sector].embeddings.mean(axis=0) for sector in centroids.sectors])
+        centroids.centroids = (means / np.linalg.norm(means, axis=1, keepdims=True)).astype(np.float32)
+        return centroids
+
+    def classify(self, vector) -> dict:
+        """
+        以最接近的產業中心向量分類
+
+        Returns:
+            dict: {"sector", "similarity", "margin", "confidence"}
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        similarities = self.centroids @ vector
+        order = np.argsort(-similarities)
+        margin = float(similarities[order[0]] - similarities[order[1]]) if len(order) > 1 else 1.0
+        # 差距 0 時信心 0.5，差距等於 SECTOR_CENTROID_MARGIN 時為 0.75
+        confidence = min(0.95, 0.5 + 0.25 * margin / SECTOR_CENTROID_MARGIN)
+        return {
+            "sector": self.sectors[order[0]],
+            "similarity": round(float(similarities[order[0]]), 4),
+            "margin": round(margin, 4),
+            "confidence": round(confidence, 4),
+        }
+
+
+def combine_with_centroid(description: str, keyword_result: dict, centroid_result: dict) -> dict:
+    """
+    合併關鍵字與中心向量的判斷
+
+    兩者產業一致時信心為 1 - (1 - a)(1 - b)；不一致時採信心較高者，並以另一方的信心折減。
+    只有中心向量時沒有碳足跡範圍，搜尋詞使用原始描述（與分類時嵌入的文字相同，可命中嵌入快取）。
+    """
+    if keyword_result is None:
+        return {
+            "query_text": description,
+            "sector": centroid_result["sector"],
+            "min_carbon_footprint": None,
+            "max_carbon_footprint": None,
+            "product_type": None,
+            "confidence": centroid_result["confidence"],
+        }
+
+    a, b = keyword_result["confidence"], centroid_result["confidence"]
+    if keyword_result["sector"] == centroid_result["sector"]:
+        return {**keyword_result, "confidence": round(1 - (1 - a) * (1 - b), 4)}
+    if a >= b:
+        return {**keyword_result, "confidence": round(a * (1 - b), 4)}
+    return combine_with_centroid(description, None, {**centroid_result, "confidence": round(b * (1 - a), 4)})
+
+
+def record_decision(source: str):
+    """記錄一次分類來源：keyword、centroid 或 llm"""
+    _stats["requests"] += 1
+    _stats["llm_fallbacks" if source == "llm" else source] += 1
+
+
+def get_sector_classifier_stats() -> dict:
+    """回傳各來源的處理次數與本機處理比例"""
+    requests = _stats["requests"]
+    local = _stats["keyword"] + _stats["centroid"]
+    return {
+        **_stats,
+        "enabled": SECTOR_CLASSIFIER_ENABLED,
+        "min_confidence": SECTOR_CLASSIFIER_MIN_CONFIDENCE,
+        "local_share": round(local / requests, 4) if requests else 0.0,
+    }
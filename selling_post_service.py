@@ -15,7 +15,8 @@ async def generate_selling_post(
     contact_info: str = "請私訊詳詢",
     trade_method: str = "面交/郵寄皆可",
     style: str = "normal",  # 使用 selling_styles.py 中的風格
-    stream: bool = False    # 新增串流參數
+    stream: bool = False,   # 新增串流參數
+    search_mode: str = None  # 網路搜尋模式：agent 或 direct
 ) -> dict:
     """
     生成適合社群平台發布的二手商品銷售文案
@@ -27,6 +28,7 @@ async def generate_selling_post(
         trade_method (str): 交易方式
         style (str): 文案風格
         stream (bool): 是否使用串流回應
+        search_mode (str): 網路搜尋模式，"agent" 或 "direct"，默認依環境變數 SEARCH_MODE
     Returns:
         dict: 包含生成的社群銷售文案的字典，或者是串流響應物件
     """
@@ -40,7 +42,7 @@ async def generate_selling_post(
     search_start = time.time()
     
     # 獲取商品網路資訊
-    search_result = await search_product_info(product_description)
+    search_result = await search_product_info(product_description, mode=search_mode)
     search_results = search_result["text"]
     
     search_end = time.time()
@@ -0,0 +1,83 @@
+"""
+ReviveAI 的 single-flight 合併機制
+
+同一個處理階段（網路搜尋、碳足跡查詢、圖片分析）在同一時間收到相同鍵的請求時，
+只執行一次，其餘呼叫者等待同一個結果。例如 /combined_service/selling_post 串流路徑中，
+generate_streaming_product_content 與 generate_selling_post 會對同一個描述同時呼叫
+search_product_info；UI 的連點也會同時送出相同的上傳內容。
+
+注意：所有等待者拿到的是同一個結果物件，呼叫端不應修改它。
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger("reviveai_api")
+
+
+class SingleFlight:
+    """
+    以鍵合併同時進行中的非同步呼叫
+
+    使用 asyncio.shield 等待共享任務，因此某個呼叫者被取消時不會連帶取消其他人的結果。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "deduplicated": 0,
+            "failures": 0,
+        }
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        執行 func(*args, **kwargs)；若相同 key 的呼叫仍在進行中，則等待它的結果
+
+        Args:
+            key: 可雜湊的合併鍵
+            func: 非同步函數
+
+        Returns:
+            func 的回傳值
+        """
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._on_done(key, finished))
+        else:
+            self.stats["deduplicated"] += 1
+            logger.info(f"[{self.name}] 合併重複的進行中請求")
+        return await asyncio.shield(task)
+
+    def _on_done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["failures"] += 1
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "in_flight": len(self._inflight)}
+
+
+# 各處理階段共用的合併群組
+_groups = {}
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    """取得（必要時建立）指定處理階段的合併群組"""
+    group = _groups.get(name)
+    if group is None:
+        group = SingleFlight(name)
+        _groups[name] = group
+    return group
+
+
+def get_singleflight_stats() -> dict:
+    """回傳所有處理階段的合併統計"""
+    return {name: group.get_stats() for name, group in _groups.items()}
@@ -9,13 +9,14 @@ from templates.content_styles import CONTENT_STYLES
 load_dotenv()
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-async def generate_streaming_product_content(product_description: str, style: str = "normal"):
+async def generate_streaming_product_content(product_description: str, style: str = "normal", search_mode: str = None):
     """
     根據選擇的風格生成優化的商品內容，使用串流模式返回結果
     
     Args:
         product_description (str): 原始商品描述
         style (str): 選擇的文案風格，默認為"normal"
+        search_mode (str): 網路搜尋模式，"agent" 或 "direct"，默認依環境變數 SEARCH_MODE
         
     Returns:
         AsyncGenerator: 生成器，可迭代地產生串流回應內容
@@ -30,7 +31,7 @@ async def generate_streaming_product_content(product_description: str, style: st
     search_start = time.time()
 
     # 直接使用商品描述調用agent進行搜尋和分析
-    search_result = await search_product_info(product_description)
+    search_result = await search_product_info(product_description, mode=search_mode)
     
     # 獲取處理後的搜尋結果文本
     search_results = search_result["text"]
@@ -0,0 +1,102 @@
+"""
+ReviveAI 的本地 token 計數工具
+
+使用 tiktoken 在本機計算 token 數（不呼叫任何 API），供網頁精簡、候選清單截斷等需要
+控制 LLM 輸入長度的地方共用。
+
+tiktoken 第一次使用某個編碼時需要下載編碼檔；無法載入時（例如離線環境）改用估算：
+CJK 字元每字約 1 個 token，其他文字每 4 個字元約 1 個 token。
+"""
+
+import logging
+import math
+import os
+import re
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger("reviveai_api")
+
+# tiktoken 編碼名稱（gpt-4.1 / gpt-4o 系列使用 o200k_base）
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")
+
+_CJK_PATTERN = re.compile(r"[　-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+# 延遲載入的編碼器；載入失敗時為 False
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            logger.warning(f"無法載入 tiktoken 編碼 {TOKEN_ENCODING}，改用估算的 token 數: {str(e)}")
+            _encoding = False
+    return _encoding
+
+
+def tokenizer_name() -> str:
+    """回傳目前使用的計數方式"""
+    return TOKEN_ENCODING if _get_encoding() else "estimate"
+
+
+def _estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(text: str) -> int:
+    """
+    計算文字的 token 數
+
+    Args:
+        text: 要計算的文字
+
+    Returns:
+        int: token 數
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    將文字截斷到最多 max_tokens 個 token
+
+    Args:
+        text: 要截斷的文字
+        max_tokens: token 上限
+
+    Returns:
+        str: 截斷後的文字（未超過上限時原樣回傳）
+    """
+    if not text or max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        # 截斷點可能落在多位元組字元中間，decode 會以替代字元補上，這裡去掉
+        return encoding.decode(tokens[:max_tokens]).rstrip("�")
+
+    if _estimate_tokens(text) <= max_tokens:
+        return text
+    # 估算模式：二分搜尋最長且不超過上限的前綴
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
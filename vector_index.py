@@ -0,0 +1,522 @@
+"""
+ReviveAI 的記憶體內 NumPy 精確向量索引
+
+碳足跡資料庫只有數百筆產品，因此不需要 HNSW 近似搜尋：把所有嵌入向量正規化後放進一個
+連續的 float32 矩陣，每次查詢只做一次矩陣-向量乘法，再以向量化的布林遮罩套用 metadata
+過濾條件（carbon_footprint 範圍、sector 等），即可得到精確的 top-k 結果。
+
+查詢結果與 Chroma collection.query 的格式相同（ids / distances / metadatas / documents
+皆為「每個查詢一個列表」的巢狀列表），distances 為 cosine distance（1 - cosine similarity）。
+
+支援的 where 語法（Chroma 的子集）：
+- {"field": value}、{"field": {"$eq" | "$ne" | "$gt" | "$gte" | "$lt" | "$lte": value}}
+- {"field": {"$in" | "$nin": [values]}}
+- {"$and": [...]}、{"$or": [...]}
+"""
+
+import numbers
+import numpy as np
+
+_COMPARISONS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+# 非 float32 的嵌入矩陣（例如 float16 快照）分塊轉型後再相乘，避免每次查詢都配置整份 float32 副本
+_SIMILARITY_BLOCK_ROWS = 65536
+
+
+def similarity_matrix(embeddings: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """
+    計算 (N, Q) 的 cosine 相似度矩陣（兩者皆已正規化）
+
+    Args:
+        embeddings: (N, D) 嵌入矩陣，可為 float16/float32 的 np.memmap
+        queries: (Q, D) float32 查詢向量
+
+    Returns:
+        np.ndarray: (N, Q) float32 相似度
+    """
+    if embeddings.dtype == np.float32:
+        return embeddings @ queries.T
+    similarities = np.empty((embeddings.shape[0], queries.shape[0]), dtype=np.float32)
+    for start in range(0, embeddings.shape[0], _SIMILARITY_BLOCK_ROWS):
+        block = embeddings[start:start + _SIMILARITY_BLOCK_ROWS]
+        similarities[start:start + len(block)] = block.astype(np.float32) @ queries.T
+    return similarities
+
+
+def metadata_matches(metadata: dict, where: dict) -> bool:
+    """
+    判斷單筆 metadata 是否符合 where 條件（與 NumpyVectorIndex.where_mask 相同語法），
+    用於在記憶體中過濾已取得的搜尋結果
+
+    Args:
+        metadata: 單筆資料的 metadata
+        where: metadata 過濾條件
+
+    Returns:
+        bool: 是否符合
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, expected in condition.items():
+                if operator in _COMPARISONS:
+                    if not _is_number(value) or not _is_number(expected):
+                        return False
+                    if not _COMPARISONS[operator](value, expected):
+                        return False
+                elif operator == "$eq":
+                    if value != expected:
+                        return False
+                elif operator == "$ne":
+                    if value == expected:
+                        return False
+                elif operator in ("$in", "$nin"):
+                    if (value in expected) != (operator == "$in"):
+                        return False
+                else:
+                    raise ValueError(f"不支援的過濾運算子: {operator}")
+    return True
+
+
+class NumpyVectorIndex:
+    """
+    精確的 cosine 相似度索引
+
+    Args:
+        ids: 每筆資料的 ID
+        embeddings: (N, D) 嵌入向量
+        metadatas: 每筆資料的 metadata 字典
+        documents: 每筆資料的文件文字
+    """
+
+    def __init__(self, ids, embeddings, metadatas, documents):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"嵌入向量形狀 {matrix.shape} 與 ID 數量 {len(ids)} 不符")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._set_rows(ids, np.ascontiguousarray(matrix / norms), metadatas, documents)
+
+    def _set_rows(self, ids, embeddings, metadatas, documents):
+        self.embeddings = embeddings
+        self.ids = list(ids)
+        self.metadatas = [metadata or {} for metadata in metadatas]
+        self.documents = list(documents) if documents is not None else [None] * len(self.ids)
+        self._columns = self._build_columns(self.metadatas)
+
+    @classmethod
+    def from_collection(cls, collection) -> "NumpyVectorIndex":
+        """從 Chroma collection 一次載入所有嵌入向量、metadata 與文件"""
+        data = collection.get(include=["embeddings", "metadatas", "documents"])
+        return cls(data["ids"], data["embeddings"], data["metadatas"], data["documents"])
+
+    @classmethod
+    def from_normalized(cls, ids, embeddings, metadatas, documents) -> "NumpyVectorIndex":
+        """
+        直接使用已正規化的嵌入矩陣（例如 np.memmap 的 float16 快照），不複製、不轉型
+
+        查詢時矩陣乘法的結果為 float32。
+        """
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+            raise ValueError(f"嵌入向量形狀 {embeddings.shape} 與 ID 數量 {len(ids)} 不符")
+        index = cls.__new__(cls)
+        index._set_rows(ids, embeddings, metadatas, documents)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _build_columns(metadatas: list) -> dict:
+        """將 metadata 轉為欄式陣列：數值欄位為 float64（缺值為 NaN），其他為 object 陣列"""
+        keys = {key for metadata in metadatas for key in metadata}
+        columns = {}
+        for key in keys:
+            values = [metadata.get(key) for metadata in metadatas]
+            present = [value for value in values if value is not None]
+            if present and all(_is_number(value) for value in present):
+                columns[key] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                columns[key] = column
+        return columns
+
+    def _field_mask(self, field: str, condition) -> np.ndarray:
+        column = self._columns.get(field)
+        if column is None:
+            return np.zeros(len(self.ids), dtype=bool)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        numeric = column.dtype != object
+        for operator, value in condition.items():
+            if operator in _COMPARISONS:
+                if not numeric or not _is_number(value):
+                    raise ValueError(f"{operator} 只能用於數值欄位: {field}")
+                mask &= _COMPARISONS[operator](column, value)
+            elif operator == "$eq":
+                mask &= column == value
+            elif operator == "$ne":
+                mask &= column != value
+            elif operator in ("$in", "$nin"):
+                member = np.isin(column, list(value))
+                mask &= member if operator == "$in" else ~member
+            else:
+                raise ValueError(f"不支援的過濾運算子: {operator}")
+        return mask
+
+    def where_mask(self, where: dict) -> np.ndarray:
+        """
+        將 Chroma 的 where 條件轉為布林遮罩
+
+        Args:
+            where: metadata 過濾條件
+
+        Returns:
+            np.ndarray: 長度為資料筆數的布林陣列
+        """
+        if not where:
+            return np.ones(len(self.ids), dtype=bool)
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.where_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for clause in condition:
+                    any_mask |= self.where_mask(clause)
+                mask &= any_mask
+            else:
+                mask &= self._field_mask(key, condition)
+        return mask
+
+    @staticmethod
+    def _normalize_queries(query_embeddings) -> np.ndarray:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return queries / norms
+
+    def _top_k(self, similarities: np.ndarray, k: int) -> dict:
+        """從單一查詢的相似度向量取出 top-k，回傳 Chroma 格式的單一查詢結果（未包成巢狀列表）"""
+        if k > 0:
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top], kind="stable")]
+        else:
+            top = []
+        return {
+            "ids": [self.ids[i] for i in top],
+            "distances": [float(1.0 - similarities[i]) for i in top],
+            "metadatas": [self.metadatas[i] for i in top],
+            "documents": [self.documents[i] for i in top],
+        }
+
+    @staticmethod
+    def _wrap(rows: list) -> dict:
+        """將多個單一查詢結果組成 Chroma collection.query 的巢狀格式"""
+        return {
+            "ids": [row["ids"] for row in rows],
+            "distances": [row["distances"] for row in rows],
+            "metadatas": [row["metadatas"] for row in rows],
+            "documents": [row["documents"] for row in rows],
+            "embeddings": None,
+            "uris": None,
+            "data": None,
+            "included": ["metadatas", "documents", "distances"],
+        }
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None) -> dict:
+        """
+        查詢最相似的資料（所有查詢向量共用同一個過濾條件）
+
+        Args:
+            query_embeddings: 單一查詢向量或 (Q, D) 查詢向量
+            n_results: 每個查詢返回的結果數量
+            where: metadata 過濾條件
+
+        Returns:
+            dict: 與 Chroma collection.query 相同格式的結果
+        """
+        queries = self._normalize_queries(query_embeddings)
+        mask = self.where_mask(where)
+        k = min(n_results, int(mask.sum()))
+
+        # (N, Q) 相似度矩陣；不符合過濾條件的資料設為 -inf
+        similarities = similarity_matrix(self.embeddings, queries)
+        similarities[~mask] = -np.inf
+        return self._wrap([self._top_k(column, k) for column in similarities.T])
+
+    def query_many(self, query_embeddings, n_results: int = 10, wheres: list = None) -> list:
+        """
+        以一次矩陣乘法查詢多個向量，每個查詢可以有各自的過濾條件
+
+        Args:
+            query_embeddings: (Q, D) 查詢向量
+            n_results: 每個查詢返回的結果數量
+            wheres: 與查詢向量對應的過濾條件列表（元素可為 None）
+
+        Returns:
+            list: 每個查詢各一個與 query() 相同格式的結果
+        """
+        queries = self._normalize_queries(query_embeddings)
+        wheres = wheres or [None] * len(queries)
+        if len(wheres) != len(queries):
+            raise ValueError(f"過濾條件數量 {len(wheres)} 與查詢數量 {len(queries)} 不符")
+
+        similarities = similarity_matrix(self.embeddings, queries)
+        masks = {}
+        results = []
+        for column, where in zip(similarities.T, wheres):
+            # 相同的過濾條件只計算一次遮罩
+            key = repr(where)
+            if key not in masks:
+                masks[key] = self.where_mask(where)
+            mask = masks[key]
+            column[~mask] = -np.inf
+            results.append(self._wrap([self._top_k(column, min(n_results, int(mask.sum())))]))
+        return results
+
+
+def _flatten_and(where: dict) -> list:
+    """將 where 條件展開成 $and 子句列表（每個子句只有一個鍵）"""
+    if not where:
+        return []
+    clauses = []
+    for key, condition in where.items():
+        if key == "$and":
+            for clause in condition:
+                clauses.extend(_flatten_and(clause))
+        else:
+            clauses.append({key: condition})
+    return clauses
+
+
+class PartitionedVectorIndex:
+    """
+    依產業分區的精確 cosine 相似度索引
+
+    每個分區是一個依 carbon_footprint 排序的 NumpyVectorIndex：sector 條件直接選出分區，
+    碳足跡範圍以二分搜尋取得連續區段，只對區段內的向量做矩陣乘法；其他條件再以遮罩過濾。
+    查詢介面與結果格式和 NumpyVectorIndex 相同。
+
+    Args:
+        ids: 每筆資料的 ID
+        embeddings: (N, D) 嵌入向量
+        metadatas: 每筆資料的 metadata 字典
+        documents: 每筆資料的文件文字
+        partition_key: 分區欄位
+        sort_key: 分區內排序、以二分搜尋處理範圍條件的數值欄位
+    """
+
+    def __init__(self, ids, embeddings, metadatas, documents,
+                 partition_key: str = "sector", sort_key: str = "carbon_footprint"):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"嵌入向量形狀 {matrix.shape} 與 ID 數量 {len(ids)} 不符")
+        metadatas = [metadata or {} for metadata in metadatas]
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.dimensions = matrix.shape[1]
+
+        groups = {}
+        for row, metadata in enumerate(metadatas):
+            groups.setdefault(metadata.get(partition_key), []).append(row)
+
+        self.partitions = {}
+        self._sort_values = {}
+        for key, rows in groups.items():
+            values = np.array([
+                value if _is_number(value) else np.nan
+                for value in (metadatas[row].get(sort_key) for row in rows)
+            ], dtype=np.float64)
+            # 缺值（NaN）排在最後，不會落入任何範圍
+            order = np.argsort(values, kind="stable")
+            rows = np.asarray(rows)[order]
+            self.partitions[key] = NumpyVectorIndex(
+                [ids[row] for row in rows],
+                matrix[rows],
+                [metadatas[row] for row in rows],
+                [documents[row] for row in rows] if documents is not None else None,
+            )
+            self._sort_values[key] = values[order]
+
+    @classmethod
+    def from_sorted(cls, ids, embeddings, metadatas, documents, partitions: dict,
+                    partition_key: str = "sector", sort_key: str = "carbon_footprint") -> "PartitionedVectorIndex":
+        """
+        由已依分區與排序欄位排好、已正規化的資料建立（例如 np.memmap 快照），各分區直接使用矩陣切片，不複製
+
+        Args:
+            partitions: {分區鍵: (起始列, 結束列)}
+        """
+        index = cls.__new__(cls)
+        index.partition_key = partition_key
+        index.sort_key = sort_key
+        index.dimensions = embeddings.shape[1]
+        index.partitions = {}
+        index._sort_values = {}
+        for key, (start, end) in partitions.items():
+            index.partitions[key] = NumpyVectorIndex.from_normalized(
+                ids[start:end],
+                embeddings[start:end],
+                metadatas[start:end],
+                documents[start:end] if documents is not None else None,
+            )
+            index._sort_values[key] = np.array([
+                value if _is_number(value) else np.nan
+                for value in (metadata.get(sort_key) for metadata in index.partitions[key].metadatas)
+            ], dtype=np.float64)
+        return index
+
+    @classmethod
+    def from_collection(cls, collection) -> "PartitionedVectorIndex":
+        """從 Chroma collection 一次載入所有嵌入向量、metadata 與文件"""
+        data = collection.get(include=["embeddings", "metadatas", "documents"])
+        return cls(data["ids"], data["embeddings"], data["metadatas"], data["documents"])
+
+    def __len__(self) -> int:
+        return sum(len(partition) for partition in self.partitions.values())
+
+    def _plan(self, where: dict) -> tuple:
+        """
+        將 where 條件拆成：要查詢的分區、排序欄位的範圍，以及其餘條件
+
+        Returns:
+            tuple: (分區鍵列表, (下界, 下界是否包含), (上界, 上界是否包含), 其餘條件或 None)
+        """
+        partitions = set(self.partitions)
+        low, high = (-np.inf, True), (np.inf, True)
+        residual = []
+        for clause in _flatten_and(where):
+            (field, condition), = clause.items()
+            if field == self.partition_key:
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                if set(condition) == {"$eq"}:
+                    partitions &= {condition["$eq"]}
+                    continue
+                if set(condition) == {"$in"}:
+                    partitions &= set(condition["$in"])
+                    continue
+            elif field == self.sort_key and isinstance(condition, dict) and set(condition) <= set(_COMPARISONS):
+                if not all(_is_number(value) for value in condition.values()):
+                    raise ValueError(f"比較運算子只能用於數值: {field}")
+                for operator, value in condition.items():
+                    if operator in ("$gt", "$gte"):
+                        bound = (value, operator == "$gte")
+                        # 取較嚴格的下界；數值相同時不包含比包含嚴格
+                        if bound[0] > low[0] or (bound[0] == low[0] and not bound[1]):
+                            low = bound
+                    else:
+                        bound = (value, operator == "$lte")
+                        if bound[0] < high[0] or (bound[0] == high[0] and not bound[1]):
+                            high = bound
+                continue
+            residual.append(clause)
+        residual_where = None
+        if residual:
+            residual_where = residual[0] if len(residual) == 1 else {"$and": residual}
+        return [key for key in self.partitions if key in partitions], low, high, residual_where
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None) -> dict:
+        """
+        查詢最相似的資料（所有查詢向量共用同一個過濾條件）
+
+        Args:
+            query_embeddings: 單一查詢向量或 (Q, D) 查詢向量
+            n_results: 每個查詢返回的結果數量
+            where: metadata 過濾條件
+
+        Returns:
+            dict: 與 Chroma collection.query 相同格式的結果
+        """
+        queries = NumpyVectorIndex._normalize_queries(query_embeddings)
+        partitions, low, high, residual = self._plan(where)
+
+        # 每個分區先取各自的 top-k，再合併
+        candidates = [[] for _ in range(len(queries))]  # (相似度, 分區, 分區內索引)
+        for key in partitions:
+            partition = self.partitions[key]
+            values = self._sort_values[key]
+            # 沒有範圍條件時整個分區都要查詢（包含排在最後的缺值）
+            start = 0 if low[0] == -np.inf else int(np.searchsorted(values, low[0], side="left" if low[1] else "right"))
+            end = len(values) if high[0] == np.inf else int(
+                np.searchsorted(values, high[0], side="right" if high[1] else "left"))
+            if start >= end:
+                continue
+            similarities = similarity_matrix(partition.embeddings[start:end], queries)
+            if residual is not None:
+                mask = partition.where_mask(residual)[start:end]
+                similarities[~mask] = -np.inf
+                count = int(mask.sum())
+            else:
+                count = end - start
+            k = min(n_results, count)
+            if k <= 0:
+                continue
+            for position, column in enumerate(similarities.T):
+                top = np.argpartition(-column, k - 1)[:k]
+                candidates[position].extend((float(column[i]), partition, start + int(i)) for i in top)
+
+        rows = []
+        for found in candidates:
+            found.sort(key=lambda candidate: -candidate[0])
+            found = found[:n_results]
+            rows.append({
+                "ids": [partition.ids[i] for _, partition, i in found],
+                "distances": [1.0 - similarity for similarity, _, _ in found],
+                "metadatas": [partition.metadatas[i] for _, partition, i in found],
+                "documents": [partition.documents[i] for _, partition, i in found],
+            })
+        return NumpyVectorIndex._wrap(rows)
+
+    def query_many(self, query_embeddings, n_results: int = 10, wheres: list = None) -> list:
+        """
+        查詢多個向量，每個查詢可以有各自的過濾條件；相同過濾條件的查詢一起處理
+
+        Returns:
+            list: 每個查詢各一個與 query() 相同格式的結果
+        """
+        queries = NumpyVectorIndex._normalize_queries(query_embeddings)
+        wheres = wheres or [None] * len(queries)
+        if len(wheres) != len(queries):
+            raise ValueError(f"過濾條件數量 {len(wheres)} 與查詢數量 {len(queries)} 不符")
+
+        groups = {}
+        for position, where in enumerate(wheres):
+            groups.setdefault(repr(where), []).append(position)
+        results = [None] * len(queries)
+        for positions in groups.values():
+            grouped = self.query(queries[positions], n_results=n_results, where=wheres[positions[0]])
+            for row, position in enumerate(positions):
+                results[position] = self._wrap([{
+                    key: grouped[key][row] for key in ("ids", "distances", "metadatas", "documents")
+                }])
+        return results
+
+    _wrap = staticmethod(NumpyVectorIndex._wrap)
@@ -4,23 +4,455 @@ ReviveAI 的 MCP 服務器 - 提供網路搜尋和網頁抓取工具
 此服務器提供兩個主要工具：
 1. brave_search: 使用 Brave Search API 進行網路搜尋
 2. fetch_webpage: 獲取網頁內容並轉換為 Markdown 格式
+
+所有對外 HTTP 請求共用一個服務器生命週期內的 aiohttp 連線池（含 keep-alive 與 DNS 快取），
+HTML 正文擷取在有上限的行程池中執行，不會阻塞 event loop。擷取引擎可逐次或依網域選擇：
+- readability: readabilipy + markdownify（預設）
+- fast: fast_extractor 的 lxml 輕量擷取器
+擷取後的 Markdown 會再經 page_condenser 依查詢精簡到 token 上限內，減少代理的輸入 token。
+HTTP 模式下可透過 GET /stats 查看連線重用與擷取佇列統計。
 """
 
 import os
+import re
+import logging
+import codecs
 import aiohttp
 from dotenv import load_dotenv
 import markdownify
 import readabilipy.simple_json
+from urllib.parse import urlparse
+from fast_extractor import extract_main_content
+from page_condenser import condense_page
 from mcp.server.fastmcp import FastMCP
 import asyncio
+import anyio
+from concurrent.futures import ProcessPoolExecutor
+from starlette.responses import JSONResponse
 
 # 載入環境變數
 load_dotenv()
 BRAVE_SEARCH_API_KEY = os.getenv("BRAVE_SEARCH_API_KEY")
 
+# 共用連線池設定
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # 全部主機的連線上限
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "8"))  # 單一主機的連線上限
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))  # 閒置連線保留秒數
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))  # DNS 快取秒數
+
+# 網頁抓取設定
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(1024 * 1024)))  # 單一網頁最多下載的位元組數
+FETCH_CHUNK_SIZE = 64 * 1024
+RAW_HTML_MAX_CHARS = 10000  # raw_html 模式回傳的最大字元數
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+# 正文擷取行程池設定
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 表示改用執行緒
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "10"))  # 單一網頁的擷取逾時（秒）
+EXTRACT_MAX_PENDING = int(os.getenv("EXTRACT_MAX_PENDING", str(max(1, EXTRACT_WORKERS) * 4)))  # 同時送入行程池的網頁上限
+
+# 正文擷取引擎設定
+EXTRACT_ENGINES = ("readability", "fast")
+EXTRACT_ENGINE = os.getenv("EXTRACT_ENGINE", "readability")  # 預設引擎
+# 依網域指定引擎，格式："momoshop.com.tw=fast,apple.com=readability"（子網域同樣適用）
+EXTRACT_ENGINE_OVERRIDES = dict(
+    item.strip().split("=", 1)
+    for item in os.getenv("EXTRACT_ENGINE_OVERRIDES", "").split(",")
+    if "=" in item
+)
+
+# 網頁精簡設定
+CONDENSE_ENABLED = os.getenv("CONDENSE_ENABLED", "true").lower() == "true"
+CONDENSE_MAX_TOKENS = int(os.getenv("CONDENSE_MAX_TOKENS", "1500"))  # 每個網頁交給代理的 token 上限
+
+# 記錄輸出到 stderr（stdio 模式下不可寫入 stdout）
+logger = logging.getLogger("web_tools")
+
 # 建立 MCP 服務器
 mcp = FastMCP("WebTools")
 
+# 共用的 aiohttp 連線池（綁定建立時的 event loop）
+_http_session = None
+_http_session_loop = None
+
+# 連線重用統計
+http_stats = {
+    "requests": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "dns_cache_hits": 0,
+    "dns_cache_misses": 0,
+    "bytes_downloaded": 0,
+    "fetches_truncated": 0,
+    "fetches_rejected": 0,
+}
+
+# 正文擷取行程池（延遲建立）
+_extract_pool = None
+_extract_semaphore = None
+_extract_semaphore_loop = None
+
+# 正文擷取統計
+extract_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failures": 0,
+    "timeouts": 0,
+    "pool_restarts": 0,
+    "waiting": 0,  # 等待送入行程池的網頁數
+    "pending": 0,  # 已送入行程池、尚未完成的網頁數
+    "stuck": 0,    # 已逾時但仍佔用工作行程的網頁數
+    "engines": {engine: 0 for engine in EXTRACT_ENGINES},  # 各引擎擷取次數
+}
+
+# 網頁精簡統計
+condense_stats = {
+    "fetches": 0,
+    "tokens_before": 0,
+    "tokens_after": 0,
+    "tokens_saved": 0,
+}
+
+def _count(stat_name: str):
+    async def handler(session, trace_config_ctx, params):
+        http_stats[stat_name] += 1
+    return handler
+
+def _create_trace_config() -> aiohttp.TraceConfig:
+    """建立記錄連線建立/重用與 DNS 快取命中的追蹤設定"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_count("requests"))
+    trace_config.on_connection_create_end.append(_count("connections_created"))
+    trace_config.on_connection_reuseconn.append(_count("connections_reused"))
+    trace_config.on_dns_cache_hit.append(_count("dns_cache_hits"))
+    trace_config.on_dns_cache_miss.append(_count("dns_cache_misses"))
+    return trace_config
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """取得共用的 aiohttp 連線池（必要時建立）"""
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector, trace_configs=[_create_trace_config()])
+        _http_session_loop = loop
+    return _http_session
+
+async def close_http_session():
+    """關閉共用的連線池（服務器關閉時呼叫）"""
+    global _http_session, _http_session_loop
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+    _http_session_loop = None
+
+def get_http_stats() -> dict:
+    """回傳連線重用統計"""
+    created = http_stats["connections_created"]
+    reused = http_stats["connections_reused"]
+    return {
+        **http_stats,
+        "reuse_rate": round(reused / (created + reused), 4) if created + reused else 0.0,
+    }
+
+_META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset=["']?([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+
+def _resolve_charset(declared, head: bytes) -> str:
+    """決定解碼用的字元集：回應標頭 → HTML meta 標籤 → utf-8"""
+    candidates = [declared]
+    match = _META_CHARSET_PATTERN.search(head[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            codecs.lookup(charset)
+            return charset
+        except LookupError:
+            continue
+    return "utf-8"
+
+async def read_text_capped(response, max_bytes: int) -> tuple:
+    """
+    以串流方式讀取回應內容，達到位元組上限即停止下載，並逐塊解碼
+
+    Args:
+        response: aiohttp 回應物件
+        max_bytes: 最多讀取的位元組數（若 Content-Length 較小則以其為準）
+
+    Returns:
+        tuple: (解碼後的文字, 是否因上限而截斷)
+    """
+    # 壓縮傳輸時 Content-Length 是壓縮後的大小，不能用來限制解壓後的讀取量
+    content_length = None if response.headers.get("Content-Encoding") else response.content_length
+    budget = max_bytes if content_length is None else min(max_bytes, content_length)
+
+    decoder = None
+    parts = []
+    received = 0
+    truncated = False
+    async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+        if received + len(chunk) >= budget:
+            chunk = chunk[:budget - received]
+            truncated = content_length is None or content_length > budget
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(_resolve_charset(response.charset, chunk))(errors="replace")
+        parts.append(decoder.decode(chunk))
+        received += len(chunk)
+        if received >= budget:
+            break
+
+    if decoder is not None:
+        parts.append(decoder.decode(b"", final=True))
+    http_stats["bytes_downloaded"] += received
+    if truncated:
+        http_stats["fetches_truncated"] += 1
+    return "".join(parts), truncated
+
+def resolve_extract_engine(url: str, engine: str = None) -> str:
+    """
+    決定擷取引擎：呼叫時指定 → 網域覆寫設定 → 預設引擎
+
+    Raises:
+        ValueError: 引擎名稱不存在
+    """
+    if not engine:
+        host = (urlparse(url).hostname or "").lower()
+        for domain, domain_engine in EXTRACT_ENGINE_OVERRIDES.items():
+            if host == domain or host.endswith("." + domain):
+                engine = domain_engine
+                break
+        else:
+            engine = EXTRACT_ENGINE
+    engine = engine.strip().lower()
+    if engine not in EXTRACT_ENGINES:
+        raise ValueError(f"不支援的擷取引擎: {engine}（可用: {', '.join(EXTRACT_ENGINES)}）")
+    return engine
+
+def _extract_markdown(html: str, engine: str = "readability", query: str = None, max_tokens: int = None) -> dict:
+    """
+    從 HTML 擷取主要內容並轉換為 Markdown（在擷取行程池的工作行程中執行）
+
+    Args:
+        html: 網頁 HTML
+        engine: 擷取引擎（readability 或 fast）
+        query: 精簡時用來挑選相關段落的查詢
+        max_tokens: 精簡後的 token 上限；None 表示不精簡
+
+    Returns:
+        dict: {"title": 標題, "markdown": Markdown 內容}；擷取不到內容時 markdown 為 None。
+            有精簡時另含 "condense": {"tokens_before", "tokens_after", "tokens_saved"}
+    """
+    if engine == "fast":
+        extracted = extract_main_content(html)
+    else:
+        extracted = _extract_with_readability(html)
+
+    if max_tokens is not None and extracted["markdown"]:
+        extracted["markdown"], extracted["condense"] = condense_page(extracted["markdown"], query, max_tokens)
+    return extracted
+
+def _extract_with_readability(html: str) -> dict:
+    """readabilipy + markdownify 擷取"""
+    # 使用 readabilipy 來提取主要內容
+    extracted = readabilipy.simple_json.simple_json_from_html_string(
+        html, use_readability=True
+    )
+    if not extracted.get("content"):
+        return {"title": None, "markdown": None}
+
+    # 轉換為 Markdown
+    markdown = markdownify.markdownify(
+        extracted["content"],
+        heading_style="ATX"
+    )
+    return {"title": extracted.get("title"), "markdown": markdown}
+
+def get_extract_pool():
+    """取得正文擷取行程池（必要時建立）；EXTRACT_WORKERS=0 時回傳 None，改用執行緒"""
+    global _extract_pool
+    if _extract_pool is None and EXTRACT_WORKERS > 0:
+        _extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _extract_pool
+
+def shutdown_extract_pool():
+    """關閉正文擷取行程池（服務器關閉時呼叫）"""
+    global _extract_pool
+    if _extract_pool is not None:
+        _extract_pool.shutdown(wait=False, cancel_futures=True)
+    _extract_pool = None
+    extract_stats["stuck"] = 0
+
+def _restart_extract_pool():
+    """所有工作行程都被逾時的網頁佔住時，終止並重建行程池"""
+    # ProcessPoolExecutor 沒有公開終止工作行程的介面，只能透過 _processes 取得
+    processes = list((getattr(_extract_pool, "_processes", None) or {}).values())
+    shutdown_extract_pool()
+    for process in processes:
+        process.terminate()
+    extract_stats["pool_restarts"] += 1
+
+def _get_extract_semaphore() -> asyncio.Semaphore:
+    global _extract_semaphore, _extract_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _extract_semaphore is None or _extract_semaphore_loop is not loop:
+        _extract_semaphore = asyncio.Semaphore(max(1, EXTRACT_MAX_PENDING))
+        _extract_semaphore_loop = loop
+    return _extract_semaphore
+
+def _on_stuck_done(future):
+    extract_stats["stuck"] = max(0, extract_stats["stuck"] - 1)
+
+async def extract_markdown(html: str, engine: str = "readability", query: str = None, max_tokens: int = None) -> dict:
+    """
+    在行程池中擷取網頁正文，不阻塞 event loop
+
+    同時送入行程池的網頁數受 EXTRACT_MAX_PENDING 限制，其餘在此排隊等待。
+
+    Args:
+        html: 網頁 HTML
+        engine: 擷取引擎（readability 或 fast）
+        query: 精簡時用來挑選相關段落的查詢
+        max_tokens: 精簡後的 token 上限；None 表示不精簡
+
+    Returns:
+        dict: 與 _extract_markdown 相同
+
+    Raises:
+        asyncio.TimeoutError: 擷取超過 EXTRACT_TIMEOUT 秒
+    """
+    loop = asyncio.get_running_loop()
+    extract_stats["waiting"] += 1
+    try:
+        await _get_extract_semaphore().acquire()
+    finally:
+        extract_stats["waiting"] -= 1
+
+    extract_stats["submitted"] += 1
+    extract_stats["engines"][engine] += 1
+    extract_stats["pending"] += 1
+    try:
+        pool = get_extract_pool()
+        if pool is None:
+            future = asyncio.ensure_future(asyncio.to_thread(_extract_markdown, html, engine, query, max_tokens))
+        else:
+            future = loop.run_in_executor(pool, _extract_markdown, html, engine, query, max_tokens)
+        try:
+            # shield：逾時只放棄等待，工作行程中的擷取無法中途取消
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            extract_stats["timeouts"] += 1
+            extract_stats["stuck"] += 1
+            future.add_done_callback(_on_stuck_done)
+            if pool is not None and extract_stats["stuck"] >= EXTRACT_WORKERS:
+                _restart_extract_pool()
+            raise
+        extract_stats["completed"] += 1
+        return result
+    except asyncio.TimeoutError:
+        raise
+    except Exception:
+        extract_stats["failures"] += 1
+        raise
+    finally:
+        extract_stats["pending"] -= 1
+        _get_extract_semaphore().release()
+
+def get_extract_stats() -> dict:
+    """回傳正文擷取行程池的佇列深度與計數"""
+    return {
+        **extract_stats,
+        "engines": dict(extract_stats["engines"]),
+        "workers": EXTRACT_WORKERS,
+        "max_pending": EXTRACT_MAX_PENDING,
+        "queue_depth": extract_stats["waiting"] + max(0, extract_stats["pending"] - max(1, EXTRACT_WORKERS)),
+    }
+
+def _record_condense(url: str, stats: dict):
+    """累計網頁精簡節省的 token 數並記錄本次結果"""
+    condense_stats["fetches"] += 1
+    for key in ("tokens_before", "tokens_after", "tokens_saved"):
+        condense_stats[key] += stats[key]
+    logger.info(f"網頁精簡 {url}: {stats['tokens_before']} → {stats['tokens_after']} tokens（節省 {stats['tokens_saved']}）")
+
+def get_condense_stats() -> dict:
+    """回傳網頁精簡統計"""
+    fetches = condense_stats["fetches"]
+    return {
+        **condense_stats,
+        "max_tokens": CONDENSE_MAX_TOKENS,
+        "avg_tokens_saved": round(condense_stats["tokens_saved"] / fetches, 1) if fetches else 0.0,
+    }
+
+@mcp.custom_route("/stats", methods=["GET"])
+async def stats_route(request):
+    """HTTP 模式下的統計端點"""
+    return JSONResponse({"http": get_http_stats(), "extract": get_extract_stats(), "condense": get_condense_stats()})
+
+async def fetch_brave_results(query: str, count: int = 5, country: str = "TW") -> list:
+    """
+    呼叫 Brave Search API 並回傳原始搜尋結果列表
+
+    brave_search 工具與 agent_client 的 direct 搜尋模式共用此函數。
+
+    Args:
+        query: 搜尋查詢字串
+        count: 要返回的結果數量 (最多 5 個)
+        country: 本地化結果的國家代碼 (例如 TW、US)
+
+    Returns:
+        list: Brave 回傳的網頁結果（包含 title、description、url）
+
+    Raises:
+        RuntimeError: 缺少 API 金鑰或 HTTP 狀態碼不是 200
+    """
+    if not BRAVE_SEARCH_API_KEY:
+        raise RuntimeError("找不到 Brave Search API 金鑰。請在 .env 文件中設定 BRAVE_SEARCH_API_KEY。")
+
+    # 不使用 print，避免污染 stdio 通道
+    # 如需除錯，可使用 stderr: import sys; print(f"...", file=sys.stderr)
+
+    session = await get_http_session()
+    async with session.get(
+        "https://api.search.brave.com/res/v1/web/search",
+        headers={
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+            "X-Subscription-Token": BRAVE_SEARCH_API_KEY
+        },
+        params={
+            "q": query,
+            "count": min(count, 5),  # 最多 5 個結果
+            "country": country,
+            "result_filter": "web",
+        }
+    ) as response:
+        if response.status != 200:
+            raise RuntimeError(f"HTTP狀態碼 {response.status}")
+
+        data = await response.json()
+        return data.get("web", {}).get("results", [])[:count]
+
+def format_search_results(query: str, results: list) -> str:
+    """將搜尋結果格式化為標題、描述和 URL 的 Markdown 文字"""
+    formatted_results = f"## 搜尋結果：\"{query}\"\n\n"
+    if not results:
+        return formatted_results + "找不到相關結果。\n"
+
+    for idx, result in enumerate(results, 1):
+        formatted_results += f"### {idx}. {result.get('title', '無標題')}\n"
+        formatted_results += f"{result.get('description', '無描述')}\n"
+        formatted_results += f"URL: {result.get('url', '')}\n\n"
+
+    return formatted_results
+
 @mcp.tool()
 async def brave_search(query: str, count: int = 5, country: str = "TW") -> str:
     """
@@ -36,58 +468,26 @@ async def brave_search(query: str, count: int = 5, country: str = "TW") -> str:
     """
     if not BRAVE_SEARCH_API_KEY:
         return "錯誤: 找不到 Brave Search API 金鑰。請在 .env 文件中設定 BRAVE_SEARCH_API_KEY。"
-        
-    # 不使用 print，避免污染 stdio 通道
-    # 如需除錯，可使用 stderr: import sys; print(f"...", file=sys.stderr)
-    
+
     try:
-        async with aiohttp.ClientSession() as session:
-            response = await session.get(
-                "https://api.search.brave.com/res/v1/web/search",
-                headers={
-                    "Accept": "application/json",
-                    "Accept-Encoding": "gzip",
-                    "X-Subscription-Token": BRAVE_SEARCH_API_KEY
-                },
-                params={
-                    "q": query,
-                    "count": min(count, 5),  # 最多 5 個結果
-                    "country": country,
-                    "result_filter": "web",
-                }
-            )
-            
-            if response.status != 200:
-                return f"搜尋錯誤: HTTP狀態碼 {response.status}"
-                
-            data = await response.json()
-            formatted_results = f"## 搜尋結果：\"{query}\"\n\n"
-            
-            # 檢查並處理結果
-            results = data.get("web", {}).get("results", [])
-            if not results:
-                return formatted_results + "找不到相關結果。\n"
-            
-            # 格式化結果
-            for idx, result in enumerate(results, 1):
-                if idx > count:
-                    break
-                formatted_results += f"### {idx}. {result.get('title', '無標題')}\n"
-                formatted_results += f"{result.get('description', '無描述')}\n"
-                formatted_results += f"URL: {result.get('url', '')}\n\n"
-            
-            return formatted_results
+        results = await fetch_brave_results(query, count, country)
+        return format_search_results(query, results)
+    except RuntimeError as e:
+        return f"搜尋錯誤: {str(e)}"
     except Exception as e:
         return f"搜尋時發生錯誤: {str(e)}"
 
 @mcp.tool()
-async def fetch_webpage(url: str, raw_html: bool = False) -> str:
+async def fetch_webpage(url: str, raw_html: bool = False, engine: str = None, query: str = None) -> str:
     """
     抓取網頁內容並轉換為 Markdown 格式
     
     Args:
         url: 要抓取的網頁 URL
         raw_html: 是否返回原始 HTML 而不是 Markdown
+        engine: 正文擷取引擎，readability（完整、較慢）或 fast（輕量、較快）；
+            不指定時依網域設定或預設引擎
+        query: 要研究的產品名稱；提供時只保留與產品相關的段落、標題與規格表
         
     Returns:
         網頁內容的 Markdown 格式（或原始 HTML，如果 raw_html=True）
@@ -97,40 +497,50 @@ async def fetch_webpage(url: str, raw_html: bool = False) -> str:
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            # 設定 4 秒的超時限制
-            async with session.get(url, headers=headers, timeout=4) as response:
-                if response.status != 200:
-                    return f"錯誤: 無法獲取頁面，HTTP狀態碼 {response.status}"
-                
-                html = await response.text()
-                content_type = response.headers.get("Content-Type", "")
-                
-                # 如果要求原始 HTML 或不是 HTML 內容
-                if raw_html or not any(ct in content_type for ct in ["text/html", "application/xhtml+xml"]):
-                    return f"## 網頁原始內容: {url}\n\n```html\n{html[:10000]}...\n```"
-                
-                # 處理 HTML 並轉換為 Markdown
-                try:
-                    # 使用 readabilipy 來提取主要內容
-                    extracted = readabilipy.simple_json.simple_json_from_html_string(
-                        html, use_readability=True
-                    )
-                    
-                    if not extracted.get("content"):
-                        return f"錯誤: 無法從網頁提取有意義的內容: {url}"
-                    
-                    # 轉換為 Markdown
-                    markdown = markdownify.markdownify(
-                        extracted["content"],
-                        heading_style="ATX"
-                    )
-                    
-                    title = extracted.get("title", "無標題")
-                    
-                    return f"## 網頁內容: {title}\n\n來源: {url}\n\n{markdown}"
-                except Exception as e:
-                    return f"處理 HTML 時出錯: {str(e)}\n\n網頁: {url}"
+        engine = resolve_extract_engine(url, engine)
+    except ValueError as e:
+        return f"錯誤: {str(e)}"
+    
+    try:
+        session = await get_http_session()
+        # 設定 4 秒的超時限制
+        async with session.get(url, headers=headers, timeout=4) as response:
+            if response.status != 200:
+                return f"錯誤: 無法獲取頁面，HTTP狀態碼 {response.status}"
+            
+            # 先檢查內容類型，非 HTML 內容不下載本文
+            content_type = response.headers.get("Content-Type", "")
+            is_html = any(ct in content_type for ct in HTML_CONTENT_TYPES)
+            if not raw_html and not is_html:
+                http_stats["fetches_rejected"] += 1
+                return f"錯誤: 不支援的內容類型（{content_type or '未知'}），僅能處理 HTML 網頁: {url}"
+            
+            # 串流讀取本文，超過位元組上限即停止下載
+            if raw_html:
+                # 最多回傳 10000 字元，UTF-8 每字元最多 4 位元組
+                html, _ = await read_text_capped(response, min(FETCH_MAX_BYTES, RAW_HTML_MAX_CHARS * 4))
+                return f"## 網頁原始內容: {url}\n\n```html\n{html[:RAW_HTML_MAX_CHARS]}...\n```"
+            
+            html, _ = await read_text_capped(response, FETCH_MAX_BYTES)
+            
+        # 處理 HTML 並轉換為 Markdown（於擷取行程池中執行，連線已先釋放回連線池）
+        try:
+            extracted = await extract_markdown(
+                html, engine, query, CONDENSE_MAX_TOKENS if CONDENSE_ENABLED else None
+            )
+        except asyncio.TimeoutError:
+            return f"錯誤: 網頁內容擷取超時（超過{EXTRACT_TIMEOUT:g}秒）: {url}"
+        except Exception as e:
+            return f"處理 HTML 時出錯: {str(e)}\n\n網頁: {url}"
+        
+        if not extracted["markdown"]:
+            return f"錯誤: 無法從網頁提取有意義的內容: {url}"
+        
+        title = extracted["title"] or "無標題"
+        if "condense" in extracted:
+            _record_condense(url, extracted["condense"])
+        
+        return f"## 網頁內容: {title}\n\n來源: {url}\n\n{extracted['markdown']}"
     except asyncio.TimeoutError:
         return f"錯誤: 網頁載入超時（超過4秒）:此網頁可能響應速度較慢或暫時無法訪問。"
     except Exception as e:
@@ -139,7 +549,6 @@ async def fetch_webpage(url: str, raw_html: bool = False) -> str:
 if __name__ == "__main__":
     # 根據命令行參數決定運行方式
     import sys
-    import logging
     
     # 配置日誌輸出到 stderr，避免污染 stdio 通道
     logging.basicConfig(
@@ -147,13 +556,23 @@ if __name__ == "__main__":
         format='%(asctime)s - %(levelname)s - %(message)s',
         stream=sys.stderr
     )
-    logger = logging.getLogger(__name__)
+    
+    async def serve(run_server):
+        # 服務器啟動時建立共用連線池，關閉時釋放
+        await get_http_session()
+        try:
+            await run_server()
+        finally:
+            await close_http_session()
+            shutdown_extract_pool()
     
     if len(sys.argv) > 1 and sys.argv[1] == "--http":
         port = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
         logger.info(f"以 HTTP 模式啟動 WebTools MCP 服務器，監聽端口 {port}...")
-        mcp.run(transport="http", host="0.0.0.0", port=port)
+        mcp.settings.host = "0.0.0.0"
+        mcp.settings.port = port
+        anyio.run(serve, mcp.run_streamable_http_async)
     else:
         # stdio 模式下不應該有任何輸出到 stdout
         # logger.info("以 stdio 模式啟動 WebTools MCP 服務器...")
-        mcp.run(transport="stdio")
+        anyio.run(serve, mcp.run_stdio_async)